@@ -2,24 +2,43 @@
 Flask backend for RTSP Livestream Overlay Application.
 Handles RTSP to HLS conversion using FFmpeg and overlay CRUD operations.
 """
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-import subprocess
+from werkzeug.security import safe_join
 import logging
 import signal
 import sys
 import os
 import atexit
-import threading
+import math
+import time
 from config import Config
 from models import (
-    init_db_connection,
+    init_overlay_store,
     create_overlay,
     get_all_overlays,
     get_overlay_by_id,
+    get_stream_overlays,
     update_overlay,
-    delete_overlay
+    update_overlays,
+    delete_overlay,
+    get_overlays_etag,
+    OverlayStoreUnavailableError
 )
+from stream_manager import (
+    stream_manager, parse_prewarm_streams, parse_stream_options, validate_stream_id, StreamLimitError
+)
+import ll_hls
+import dvr
+from hls_proxy import UpstreamError, upstream_pool
+from segment_cache import segment_cache
+from segment_storage import segment_storage
+from snapshots import snapshot_cache
+from recorder import recording_pool
+from stream_metrics import render_prometheus
+from overlay_events import overlay_events
+from overlay_rasters import overlay_rasters, box_for
+from overlay_burnin import DEFAULT_SIZE_PERCENT
 
 # Configure logging
 logging.basicConfig(
@@ -33,43 +52,14 @@ app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
 
-# Global FFmpeg process management
-ffmpeg_process = None
-current_rtsp_url = None
-
 
 def cleanup_ffmpeg():
     """
-    Cleanup FFmpeg process on application shutdown.
+    Cleanup all FFmpeg processes on application shutdown.
     Ensures no zombie processes are left running.
     """
-    global ffmpeg_process
-    
-    if ffmpeg_process:
-        logger.info("Cleaning up FFmpeg process...")
-        try:
-            ffmpeg_process.terminate()
-            ffmpeg_process.wait(timeout=5)
-            logger.info("FFmpeg process terminated successfully")
-        except subprocess.TimeoutExpired:
-            logger.warning("FFmpeg process did not terminate, forcing kill")
-            ffmpeg_process.kill()
-        except Exception as e:
-            logger.error(f"Error cleaning up FFmpeg: {str(e)}")
-        finally:
-            ffmpeg_process = None
-
-
-def monitor_ffmpeg_output(process):
-    """
-    Monitor FFmpeg stderr output in a separate thread.
-    """
-    try:
-        for line in process.stderr:
-            if line:
-                logger.info(f"FFmpeg: {line.strip()}")
-    except Exception as e:
-        logger.error(f"Error monitoring FFmpeg: {str(e)}")
+    logger.info("Cleaning up FFmpeg processes...")
+    stream_manager.stop_all()
 
 
 def signal_handler(signum, frame):
@@ -91,20 +81,48 @@ signal.signal(signal.SIGTERM, signal_handler)
 signal.signal(signal.SIGINT, signal_handler)
 
 
+def build_hls_url(session):
+    """
+    Build the browser-facing playlist URL for a stream.
+    Uses localhost instead of 0.0.0.0 for browser compatibility.
+    """
+    return f'http://localhost:{Config.PORT}/static/stream/{session.stream_id}/{session.playlist_name}'
+
+
+def serialize_stream(session):
+    """Serialize a stream session including its HLS URL."""
+    stream = session.to_dict()
+    stream['hls_url'] = build_hls_url(session)
+    return stream
+
+
 @app.route('/api/stream/start', methods=['POST'])
 def start_stream():
     """
     Start RTSP to HLS stream conversion using FFmpeg.
+    Viewers of an RTSP URL that is already being converted share its FFmpeg process.
+    HTTP(S) HLS URLs are returned as-is, or relayed through the backend with proxy.
     
     Request Body:
-        rtsp_url (str): RTSP stream URL to convert
+        rtsp_url (str): RTSP stream URL to convert, or HTTP(S) HLS playlist URL
+        proxy (bool): Relay an HTTP(S) source instead of returning its URL
+            (optional, defaults to HLS_PROXY_DEFAULT)
+        wait (bool): Respond only once the first segment is playable, or after
+            STREAM_START_WAIT_SECONDS (optional)
+        stream_id (str): Optional stream ID; an existing ID with a different URL is restarted
+        codec_mode (str): 'auto', 'copy' or 'transcode' (optional, defaults to STREAM_CODEC_MODE)
+        low_latency (bool): Produce LL-HLS with fMP4 partial segments (optional)
+        abr (bool): Produce an adaptive bitrate ladder with a master playlist (optional)
+        burn_overlays (bool): Composite the saved overlays into the video (optional)
+        dvr (bool): Keep DVR_WINDOW_SECONDS of segments for seeking (optional)
+        record (bool): Record the stream into hourly MP4 files (optional)
     
     Returns:
-        JSON response with success status, HLS URL, and message
+        JSON response with success status, stream ID, HLS URL, viewer count,
+        readiness, time to first frame and message
     """
-    global ffmpeg_process, current_rtsp_url
-    
     try:
+        request_started = time.time()
         data = request.get_json()
         rtsp_url = data.get('rtsp_url')
         
@@ -116,84 +134,71 @@ def start_stream():
             }), 400
         
         # Check if URL is HTTP/HTTPS (direct HLS) or RTSP (needs conversion)
-        if rtsp_url.startswith('http://') or rtsp_url.startswith('https://'):
+        is_http = rtsp_url.startswith('http://') or rtsp_url.startswith('https://')
+        if is_http and not data.get('proxy', Config.HLS_PROXY_DEFAULT):
             # Direct HLS stream - no conversion needed
             logger.info(f"Direct HLS stream detected: {rtsp_url}")
             return jsonify({
                 'success': True,
                 'hls_url': rtsp_url,
+                'proxy': False,
                 'message': 'Direct HLS stream - no conversion needed'
             }), 200
         
-        if not rtsp_url.startswith('rtsp://'):
+        if not is_http and not rtsp_url.startswith('rtsp://'):
             return jsonify({
                 'success': False,
                 'error': 'Invalid stream URL format. Must start with rtsp://, http://, or https://'
             }), 400
         
-        # Stop existing stream if running
-        if ffmpeg_process:
-            logger.info("Stopping existing stream before starting new one")
-            cleanup_ffmpeg()
-        
-        # Ensure stream directory exists
-        os.makedirs(Config.STREAM_DIR, exist_ok=True)
-        
-        # Define output paths
-        output_playlist = os.path.join(Config.STREAM_DIR, 'playlist.m3u8')
-        output_segment = os.path.join(Config.STREAM_DIR, 'segment%03d.ts')
-        
-        # Build FFmpeg command with optimized settings for live streaming
-        # Use full path to ffmpeg for reliability
-        ffmpeg_path = '/opt/homebrew/bin/ffmpeg'
-        ffmpeg_cmd = [
-            ffmpeg_path,
-            '-rtsp_transport', 'tcp',  # Use TCP for reliability
-            '-i', rtsp_url,  # Input RTSP stream
-            '-c:v', 'libx264',  # Video codec
-            '-preset', 'ultrafast',  # Prioritize speed over compression
-            '-tune', 'zerolatency',  # Minimize latency
-            '-c:a', 'aac',  # Audio codec
-            '-b:a', '128k',  # Audio bitrate
-            '-f', 'hls',  # Output format HLS
-            '-hls_time', '2',  # 2-second segments
-            '-hls_list_size', '5',  # Keep last 5 segments
-            '-hls_flags', 'delete_segments+append_list',  # Auto-delete old segments
-            '-hls_segment_filename', output_segment,
-            output_playlist
-        ]
-        
-        logger.info(f"Starting FFmpeg with command: {' '.join(ffmpeg_cmd)}")
-        
-        # Start FFmpeg process
-        ffmpeg_process = subprocess.Popen(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
+        session = stream_manager.start(
+            rtsp_url,
+            stream_id=data.get('stream_id'),
+            options=parse_stream_options(data)
         )
         
-        # Start monitoring thread for FFmpeg output
-        monitor_thread = threading.Thread(target=monitor_ffmpeg_output, args=(ffmpeg_process,), daemon=True)
-        monitor_thread.start()
-        
-        current_rtsp_url = rtsp_url
-        
-        logger.info(f"FFmpeg process started with PID: {ffmpeg_process.pid}")
-        logger.info(f"Streaming from: {rtsp_url}")
-        logger.info(f"Output playlist: {output_playlist}")
-        logger.info(f"Output segments: {output_segment}")
-        
-        # Generate HLS URL for frontend
-        # Use localhost instead of 0.0.0.0 for browser compatibility
-        hls_url = f'http://localhost:{Config.PORT}/static/stream/playlist.m3u8'
+        if data.get('wait'):
+            ready = session.wait_until_ready(Config.STREAM_START_WAIT_SECONDS)
+        else:
+            ready = session.is_ready()
+        # Zero when joining a stream that was already playable
+        time_to_first_frame = (
+            round(max(session.first_segment_at - request_started, 0), 3) if ready else None
+        )
         
         return jsonify({
             'success': True,
-            'hls_url': hls_url,
-            'message': 'Stream started successfully'
+            'stream_id': session.stream_id,
+            'hls_url': build_hls_url(session),
+            'viewers': session.viewers,
+            'shared': session.viewers > 1,
+            'proxy': session.proxy,
+            'codec_plan': session.codec_plan,
+            'low_latency': session.low_latency,
+            'abr': session.abr,
+            'burn_overlays': session.burn_overlays,
+            'dvr': session.dvr is not None,
+            'recording': session.recorder is not None,
+            'pinned': session.pinned,
+            'ready': ready,
+            'time_to_first_frame': time_to_first_frame,
+            'message': 'Stream started successfully' if ready else 'Stream started, first segment not ready yet'
         }), 200
         
+    except ValueError as e:
+        logger.warning(f"Invalid stream request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except StreamLimitError as e:
+        logger.warning(f"Stream limit reached: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
     except FileNotFoundError:
         logger.error("FFmpeg not found on system")
         return jsonify({
@@ -203,7 +208,6 @@ def start_stream():
         
     except Exception as e:
         logger.error(f"Error starting stream: {str(e)}")
-        cleanup_ffmpeg()
         return jsonify({
             'success': False,
             'error': f'Failed to start stream: {str(e)}'
@@ -213,22 +217,86 @@ def start_stream():
 @app.route('/api/stream/stop', methods=['POST'])
 def stop_stream():
     """
-    Stop the current RTSP to HLS stream conversion.
+    Stop RTSP to HLS stream conversion.
+    
+    Request Body:
+        stream_id (str): Stream to leave (required unless all is set)
+        force (bool): Stop the stream even if other viewers remain (optional)
+        all (bool): Stop every stream, for every viewer (optional)
     
     Returns:
         JSON response with success status and message
     """
-    global current_rtsp_url
+    try:
+        data = request.get_json(silent=True) or {}
+        stream_id = data.get('stream_id')
+        
+        if stream_id:
+            stream_manager.stop(stream_id, force=bool(data.get('force')))
+        elif data.get('all') is True:
+            logger.info("Stopping all streams on request")
+            stream_manager.stop_all()
+        else:
+            raise ValueError("stream_id is required; send \"all\": true to stop every stream")
+        
+        return jsonify({
+            'success': True,
+            'message': 'Stream stopped successfully'
+        }), 200
+        
+    except ValueError as e:
+        logger.warning(f"Invalid stop request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except LookupError as e:
+        logger.warning(f"Stream not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except Exception as e:
+        logger.error(f"Error stopping stream: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to stop stream: {str(e)}'
+        }), 500
+
+
+@app.route('/api/stream/<stream_id>/stop', methods=['POST'])
+def stop_stream_by_id(stream_id):
+    """
+    Leave a single stream. FFmpeg stops after the idle grace period once
+    the last viewer has left.
+    
+    Args:
+        stream_id (str): Stream ID
+    
+    Request Body:
+        force (bool): Stop immediately even if other viewers remain (optional)
     
+    Returns:
+        JSON response with success status and message
+    """
     try:
-        cleanup_ffmpeg()
-        current_rtsp_url = None
+        data = request.get_json(silent=True) or {}
+        stream_manager.stop(stream_id, force=bool(data.get('force')))
         
         return jsonify({
             'success': True,
             'message': 'Stream stopped successfully'
         }), 200
         
+    except LookupError as e:
+        logger.warning(f"Stream not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
     except Exception as e:
         logger.error(f"Error stopping stream: {str(e)}")
         return jsonify({
@@ -240,20 +308,58 @@ def stop_stream():
 @app.route('/api/stream/status', methods=['GET'])
 def get_stream_status():
     """
-    Get current stream status.
+    Get status of all registered streams.
+    
+    Returns:
+        JSON response with per-stream status; 'active' and 'rtsp_url'
+        describe the most recently started active stream
+    """
+    try:
+        streams = [serialize_stream(session) for session in stream_manager.list()]
+        active_streams = [stream for stream in streams if stream['active']]
+        latest = active_streams[-1] if active_streams else None
+        
+        return jsonify({
+            'success': True,
+            'active': latest is not None,
+            'rtsp_url': latest['rtsp_url'] if latest else None,
+            'streams': streams
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error getting stream status: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to get stream status: {str(e)}'
+        }), 500
+
+
+@app.route('/api/stream/<stream_id>/status', methods=['GET'])
+def get_stream_status_by_id(stream_id):
+    """
+    Get status of a single stream.
+    
+    Args:
+        stream_id (str): Stream ID
     
     Returns:
-        JSON response with active status and RTSP URL if streaming
+        JSON response with stream status
     """
     try:
-        is_active = ffmpeg_process is not None and ffmpeg_process.poll() is None
+        session = stream_manager.get(stream_id)
         
         return jsonify({
             'success': True,
-            'active': is_active,
-            'rtsp_url': current_rtsp_url if is_active else None
+            'stream': serialize_stream(session)
         }), 200
         
+    except LookupError as e:
+        logger.warning(f"Stream not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
     except Exception as e:
         logger.error(f"Error getting stream status: {str(e)}")
         return jsonify({
@@ -262,21 +368,257 @@ def get_stream_status():
         }), 500
 
 
+@app.route('/api/stream/<stream_id>/metrics', methods=['GET'])
+def get_stream_metrics(stream_id):
+    """
+    Get FFmpeg performance metrics for a single stream, or upstream
+    fetch counters for a relayed HTTP(S) source.
+    
+    Args:
+        stream_id (str): Stream ID
+    
+    Returns:
+        JSON response with the current FFmpeg process's or the relay's metrics
+    """
+    try:
+        session = stream_manager.get(stream_id)
+        
+        return jsonify({
+            'success': True,
+            'stream_id': session.stream_id,
+            'active': session.is_active(),
+            'restarts': session.restart_count,
+            'metrics': session.metrics.to_dict()
+        }), 200
+        
+    except LookupError as e:
+        logger.warning(f"Stream not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except Exception as e:
+        logger.error(f"Error getting stream metrics: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to get stream metrics: {str(e)}'
+        }), 500
+
+
+@app.route('/api/stream/<stream_id>/snapshot', methods=['GET'])
+def get_stream_snapshot(stream_id):
+    """
+    Get a still JPEG of a stream's newest keyframe, for dashboards that
+    show many cameras without a video player each. Snapshots are shared by
+    all viewers and refreshed at most every SNAPSHOT_MAX_AGE_SECONDS.
+    
+    Args:
+        stream_id (str): Stream ID
+    
+    Returns:
+        JPEG image with a strong ETag and Cache-Control max-age set to the
+        snapshot's remaining lifetime; 304 if it matches If-None-Match
+    """
+    try:
+        session = stream_manager.get(stream_id)
+        snapshot = snapshot_cache.get(session)
+        
+        if snapshot.etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(snapshot.jpeg, mimetype='image/jpeg')
+        response.set_etag(snapshot.etag)
+        remaining = Config.SNAPSHOT_MAX_AGE_SECONDS - (time.time() - snapshot.taken_at)
+        response.headers['Cache-Control'] = f'public, max-age={max(math.ceil(remaining), 0)}'
+        response.last_modified = snapshot.taken_at
+        return response
+        
+    except LookupError as e:
+        logger.warning(f"Snapshot not available: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except RuntimeError as e:
+        logger.error(f"Error taking snapshot of stream {stream_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to take snapshot: {str(e)}'
+        }), 502
+        
+    except FileNotFoundError:
+        logger.error("FFmpeg not found on system")
+        return jsonify({
+            'success': False,
+            'error': 'FFmpeg is not installed or not in PATH'
+        }), 500
+        
+    except Exception as e:
+        logger.error(f"Error getting snapshot: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get snapshot'
+        }), 500
+
+
+@app.route('/api/stream/<stream_id>/seek', methods=['GET'])
+def seek_stream(stream_id):
+    """
+    Get a DVR playlist that starts at a point in time and runs to the live
+    edge. Players begin playback at its first segment.
+    
+    Args:
+        stream_id (str): Stream ID of a stream started with dvr
+    
+    Query Parameters:
+        t (str): ISO 8601 timestamp, Unix time in seconds, or negative
+            seconds before now. Clamped to the DVR window
+    
+    Returns:
+        HLS playlist
+    """
+    try:
+        session = stream_manager.get(stream_id)
+        if session.dvr is None:
+            raise ValueError(f"DVR is not enabled for stream {stream_id}")
+        t = request.args.get('t')
+        if not t:
+            raise ValueError("t is required")
+        timestamp = dvr.parse_time(t)
+        
+        session.dvr.refresh()
+        playlist = session.dvr.render_from(timestamp, uri_prefix=f'/static/stream/{stream_id}/')
+        if playlist is None:
+            return jsonify({
+                'success': False,
+                'error': f'Playlist not ready: {stream_id}'
+            }), 404
+        return send_stream_bytes(playlist.encode(), 'seek.m3u8')
+        
+    except ValueError as e:
+        logger.warning(f"Invalid seek request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except LookupError as e:
+        logger.warning(f"Stream not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except Exception as e:
+        logger.error(f"Error seeking stream: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to seek stream: {str(e)}'
+        }), 500
+
+
+@app.route('/api/stream/<stream_id>/overlays', methods=['GET'])
+def get_overlays_for_stream(stream_id):
+    """
+    Retrieve one page of the overlays shown on a stream: its own overlays
+    plus those without a streamId, in creation order. The stream does not
+    have to be running. Supports If-None-Match like GET /api/overlays.
+    
+    Args:
+        stream_id (str): Stream ID
+    
+    Query Parameters:
+        limit (int): Page size (optional, defaults to OVERLAY_PAGE_SIZE)
+        after (str): next_after of the previous page (optional)
+        fields (str): Comma-separated fields to return besides id (optional)
+    
+    Returns:
+        JSON response with the overlays and the next_after cursor (null on the last page)
+    """
+    try:
+        validate_stream_id(stream_id)
+        limit = request.args.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise ValueError("limit must be an integer")
+        after = request.args.get('after') or None
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        
+        # Any overlay change invalidates every page; the query distinguishes pages
+        etag = f'{get_overlays_etag()}-{stream_id}-{limit}-{after}-{",".join(fields or [])}'
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+        
+        overlays, next_after = get_stream_overlays(stream_id, after, limit, fields)
+        
+        response = jsonify({
+            'success': True,
+            'overlays': overlays,
+            'next_after': next_after
+        })
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response, 200
+        
+    except ValueError as e:
+        logger.warning(f"Invalid overlay list request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
+    except Exception as e:
+        logger.error(f"Error retrieving overlays for stream {stream_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to retrieve overlays'
+        }), 500
+
+
 @app.route('/api/overlays', methods=['GET'])
 def get_overlays():
     """
     Retrieve all overlays from database.
+    Supports If-None-Match, answering 304 while the list is unchanged.
     
     Returns:
         JSON response with success status and array of overlays
     """
     try:
+        # Read the ETag first so a concurrent write can only make it older than the body
+        etag = get_overlays_etag()
+        if etag in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+        
         overlays = get_all_overlays()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'overlays': overlays
-        }), 200
+        })
+        response.set_etag(etag)
+        # Browsers may keep the response but must revalidate before reusing it
+        response.headers['Cache-Control'] = 'no-cache'
+        return response, 200
+        
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
         
     except Exception as e:
         logger.error(f"Error retrieving overlays: {str(e)}")
@@ -286,6 +628,53 @@ def get_overlays():
         }), 500
 
 
+@app.route('/api/overlays/events', methods=['GET'])
+def overlay_event_stream():
+    """
+    Server-Sent Events stream of overlay changes.
+    Each event is named 'created', 'updated' or 'deleted' and carries the
+    overlay (or its ID) as JSON. 'reset' tells the client it missed events
+    and should refetch the overlay list. Browsers reconnect automatically
+    and resume from the Last-Event-ID header.
+    
+    Query Parameters:
+        stream_id (str): Only send created/updated events for overlays shown
+            on this stream (optional). Deletes are always sent
+    
+    Returns:
+        text/event-stream response that stays open until the client disconnects
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    stream_id = request.args.get('stream_id')
+    
+    def generate():
+        subscription = overlay_events.subscribe(last_event_id)
+        try:
+            yield 'retry: 2000\n\n'
+            while True:
+                event = subscription.get(Config.OVERLAY_EVENTS_KEEPALIVE_SECONDS)
+                if event is None:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                
+                overlay = event.data.get('overlay')
+                if stream_id and overlay and overlay.get('streamId') not in (stream_id, None):
+                    continue
+                
+                message = f'event: {event.type}\ndata: {app.json.dumps(event.data)}\n\n'
+                if event.id is not None:
+                    message = f'id: {event.id}\n' + message
+                yield message
+        finally:
+            overlay_events.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable nginx response buffering
+    })
+
+
 @app.route('/api/overlays', methods=['POST'])
 def create_new_overlay():
     """
@@ -296,12 +685,15 @@ def create_new_overlay():
         content (str): Text content or image URL
         position (dict): {x: int, y: int} in pixels (optional, defaults to 100, 100)
         size (dict): {width: int, height: int} in pixels (optional, defaults to 200, 100)
+        streamId (str): Stream the overlay belongs to (optional, shown on all streams if omitted)
     
     Returns:
         JSON response with success status, generated ID, and overlay data
     """
     try:
         data = request.get_json()
+        if data and data.get('streamId') is not None:
+            validate_stream_id(data['streamId'])
         
         # Create overlay using model function
         overlay = create_overlay(data)
@@ -360,6 +752,13 @@ def get_overlay(overlay_id):
             'error': str(e)
         }), 404
         
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
     except Exception as e:
         logger.error(f"Error retrieving overlay: {str(e)}")
         return jsonify({
@@ -368,6 +767,77 @@ def get_overlay(overlay_id):
         }), 500
 
 
+@app.route('/api/overlays/<overlay_id>/raster', methods=['GET'])
+def get_overlay_raster(overlay_id):
+    """
+    Serve an image overlay pre-scaled to the box it occupies in a player of
+    the given size, so browsers never download the full-size source.
+    
+    Args:
+        overlay_id (str): Overlay ID
+    
+    Query Parameters:
+        width (int): Player width in device pixels
+        height (int): Player height in device pixels
+    
+    Returns:
+        PNG image with a strong ETag; 304 if it matches If-None-Match
+    """
+    try:
+        width = request.args.get('width', type=int)
+        height = request.args.get('height', type=int)
+        if not width or not height or width <= 0 or height <= 0:
+            raise ValueError('width and height must be positive integers')
+        
+        overlay = get_overlay_by_id(overlay_id)
+        if overlay.get('type') != 'image':
+            raise ValueError('Only image overlays have a raster')
+        
+        box_width, box_height = box_for(overlay.get('sizePercent') or DEFAULT_SIZE_PERCENT, width, height)
+        raster = overlay_rasters.get_raster(overlay['content'], box_width, box_height)
+        
+        response = Response(raster.png, mimetype='image/png')
+        response.set_etag(raster.etag)
+        # The overlay's image can change under the same URL, so always revalidate
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+        
+    except ValueError as e:
+        logger.warning(f"Invalid overlay raster request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except LookupError as e:
+        logger.warning(f"Overlay not found: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except OSError as e:
+        logger.warning(f"Could not fetch overlay image: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch overlay image'
+        }), 502
+        
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
+    except Exception as e:
+        logger.error(f"Error rendering overlay raster: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to render overlay raster'
+        }), 500
+
+
 @app.route('/api/overlays/<overlay_id>', methods=['PUT'])
 def update_existing_overlay(overlay_id):
     """
@@ -409,6 +879,13 @@ def update_existing_overlay(overlay_id):
             'error': str(e)
         }), 404
         
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
     except Exception as e:
         logger.error(f"Error updating overlay: {str(e)}")
         return jsonify({
@@ -417,6 +894,58 @@ def update_existing_overlay(overlay_id):
         }), 500
 
 
+@app.route('/api/overlays', methods=['PATCH'])
+def update_overlays_bulk():
+    """
+    Apply partial updates to several overlays in one request.
+    
+    Request Body:
+        updates (list): Objects with an 'id' plus any of position, size,
+            content, opacity, positionPercent and sizePercent
+    
+    Returns:
+        JSON response with the updated overlays and the IDs that were not found
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        overlays, not_found = update_overlays(data.get('updates'))
+        
+        return jsonify({
+            'success': True,
+            'overlays': overlays,
+            'not_found': not_found
+        }), 200
+        
+    except ValueError as e:
+        logger.warning(f"Invalid bulk overlay update: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except LookupError as e:
+        logger.warning(f"Bulk overlay update failed: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+        
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
+    except Exception as e:
+        logger.error(f"Error updating overlays: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to update overlays'
+        }), 500
+
+
 @app.route('/api/overlays/<overlay_id>', methods=['DELETE'])
 def delete_existing_overlay(overlay_id):
     """
@@ -450,6 +979,13 @@ def delete_existing_overlay(overlay_id):
             'error': str(e)
         }), 404
         
+    except OverlayStoreUnavailableError as e:
+        logger.warning(f"Overlay store unavailable: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+        
     except Exception as e:
         logger.error(f"Error deleting overlay: {str(e)}")
         return jsonify({
@@ -458,51 +994,157 @@ def delete_existing_overlay(overlay_id):
         }), 500
 
 
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4'
+}
+
+
+def cache_control_for(name):
+    """
+    Cache-Control header for a stream file. Live playlists change every
+    segment and must be revalidated; segments never change once written.
+    The fMP4 init segment keeps its name when FFmpeg restarts with a new
+    codec plan, so it is revalidated too; its ETag keeps that to a 304.
+    """
+    if name.endswith('.m3u8') or os.path.basename(name) == ll_hls.INIT_SEGMENT:
+        return 'no-cache'
+    return f'public, max-age={Config.SEGMENT_CACHE_MAX_AGE_SECONDS}, immutable'
+
+
+def send_stream_bytes(data, name, etag=None):
+    """
+    Build a conditional response for in-memory stream data.
+    Honors If-None-Match (304) and Range requests.
+    """
+    response = Response(data, mimetype=HLS_MIMETYPES.get(os.path.splitext(name)[1]))
+    response.headers['Cache-Control'] = cache_control_for(name)
+    if etag:
+        response.set_etag(etag)
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+
+def serve_ll_hls_file(session, name):
+    """
+    Serve LL-HLS resources that are generated rather than read from disk as-is:
+    the LL-HLS playlist (with blocking reload), full segments assembled from
+    parts, and preload-hinted parts that FFmpeg has not finished yet.
+    
+    Args:
+        session (StreamSession): Low-latency stream session
+        name (str): Filename within the stream directory
+    
+    Returns:
+        Response, or None to fall back to serving the file from disk
+    """
+    if name == 'playlist.m3u8':
+        msn = request.args.get('_HLS_msn', type=int)
+        part = request.args.get('_HLS_part', type=int)
+        if part is not None and msn is None:
+            return jsonify({
+                'success': False,
+                'error': '_HLS_part requires _HLS_msn'
+            }), 400
+        
+        playlist = ll_hls.wait_for_playlist(
+            session.output_dir, msn, part, session.restart_count
+        )
+        if playlist is None:
+            return jsonify({
+                'success': False,
+                'error': f'Playlist not ready: {session.stream_id}'
+            }), 404
+        return send_stream_bytes(playlist.encode(), name)
+    
+    segment_match = ll_hls.SEGMENT_FILENAME.match(name)
+    if segment_match:
+        data = ll_hls.read_segment(session.output_dir, int(segment_match.group(1)))
+        if data is None:
+            return jsonify({
+                'success': False,
+                'error': f'File not found: {name}'
+            }), 404
+        return send_stream_bytes(data, name)
+    
+    if ll_hls.PART_FILENAME.match(name) and not ll_hls.wait_for_part(session.output_dir, name):
+        return jsonify({
+            'success': False,
+            'error': f'File not found: {name}'
+        }), 404
+    
+    return None
+
+
 @app.route('/static/stream/<path:filename>')
 def serve_stream_file(filename):
     """
     Serve HLS playlist and segment files.
     
     Args:
-        filename (str): Filename to serve
+        filename (str): Path relative to Config.STREAM_DIR, e.g. <stream_id>/playlist.m3u8
     
     Returns:
         Static file with appropriate Content-Type header
     """
     try:
-        file_path = os.path.join(Config.STREAM_DIR, filename)
+        stream_id, _, name = filename.partition('/')
+        session = stream_manager.find(stream_id)
         
-        # Check if file exists
-        if not os.path.exists(file_path):
-            logger.warning(f"Stream file not found: {filename} at {file_path}")
-            return jsonify({
-                'success': False,
-                'error': f'File not found: {filename}'
-            }), 404
+        if session and session.low_latency:
+            response = serve_ll_hls_file(session, name)
+            if response is not None:
+                return response
         
-        # Set appropriate Content-Type based on file extension
-        if filename.endswith('.m3u8'):
-            return send_from_directory(
-                Config.STREAM_DIR,
-                filename,
-                mimetype='application/vnd.apple.mpegurl'
-            )
-        elif filename.endswith('.ts'):
-            return send_from_directory(
-                Config.STREAM_DIR,
-                filename,
-                mimetype='video/mp2t'
-            )
-        else:
-            return send_from_directory(Config.STREAM_DIR, filename)
+        if session and session.proxy:
+            # Relayed files are fetched from the upstream origin when missing or stale
+            session.prepare(name)
+        
+        if session and session.dvr and name == dvr.DVR_PLAYLIST:
+            session.dvr.refresh()
+            playlist = session.dvr.render()
+            if playlist is None:
+                raise FileNotFoundError(filename)
+            return send_stream_bytes(playlist.encode(), name)
+        
+        file_path = safe_join(Config.STREAM_DIR, filename)
+        if file_path is None:
+            raise FileNotFoundError(filename)
+        
+        # Hot playlists and segments are served from memory; the cache
+        # revalidates against the file's mtime and size on every request
+        cached = segment_cache.get(file_path)
+        if cached.data is not None:
+            return send_stream_bytes(cached.data, filename, cached.etag)
+        
+        # Too large to cache: stream from disk (sendfile via wsgi.file_wrapper or X-Sendfile)
+        mimetype = HLS_MIMETYPES.get(os.path.splitext(filename)[1])
+        response = send_from_directory(Config.STREAM_DIR, filename, mimetype=mimetype)
+        response.headers['Cache-Control'] = cache_control_for(filename)
+        return response
             
-    except FileNotFoundError:
+    except ValueError as e:
+        logger.warning(f"Invalid stream file request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except (FileNotFoundError, LookupError):
         logger.warning(f"Stream file not found: {filename}")
         return jsonify({
             'success': False,
-            'error': 'File not found'
+            'error': f'File not found: {filename}'
         }), 404
         
+    except UpstreamError as e:
+        logger.error(f"Error relaying stream file: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Upstream fetch failed: {str(e)}'
+        }), 502
+        
     except Exception as e:
         logger.error(f"Error serving stream file: {str(e)}")
         return jsonify({
@@ -526,26 +1168,69 @@ def health_check():
     }), 200
 
 
-if __name__ == '__main__':
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Metrics endpoint for Prometheus scraping.
+    
+    Returns:
+        Per-stream FFmpeg, segment cache, overlay raster cache, segment
+        storage, snapshot cache, recording job and HLS relay upstream
+        metrics in the text exposition format
+    """
+    body = render_prometheus(
+        stream_manager.list(), segment_cache.stats(), overlay_rasters.stats(),
+        segment_storage.stats(), snapshot_cache.stats(), recording_pool.stats(),
+        upstream_pool.stats()
+    )
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def initialize_services(server_name):
+    """
+    Open the overlay store, prepare segment storage, resume unfinished
+    recordings, pre-warm configured streams and log startup configuration.
+    Shared by the development server (app.py) and the async server (server.py).
+    
+    Args:
+        server_name (str): Server description for the startup log
+    """
     logger.info("="*60)
     logger.info("RTSP Livestream Overlay Application - Starting...")
     logger.info("="*60)
     
-    # Initialize MongoDB connection
-    logger.info("Initializing MongoDB connection...")
-    success, error_msg = init_db_connection()
+    # Initialize overlay storage
+    logger.info(f"Initializing {Config.OVERLAY_STORE} overlay store...")
+    success, error_msg = init_overlay_store()
     
-    if success:
+    if Config.OVERLAY_STORE != 'mongodb':
+        logger.info(f"✅ Overlays stored in {Config.OVERLAY_STORE}")
+    elif success:
         logger.info("✅ MongoDB connected successfully!")
     else:
-        logger.warning("⚠️  MongoDB connection failed - running with in-memory storage")
+        logger.warning("⚠️  MongoDB connection failed - storing overlays locally until it is reachable")
         logger.warning(f"Error: {error_msg}")
-        logger.warning("Overlays will not be persisted between restarts")
+        logger.warning(f"Local changes are kept in {Config.LOCAL_STORE_PATH} and synced on reconnect")
     
-    logger.info(f"Starting Flask server on {Config.HOST}:{Config.PORT}")
+    logger.info(f"Starting {server_name} on {Config.HOST}:{Config.PORT}")
     logger.info(f"Debug mode: {Config.DEBUG}")
-    logger.info(f"Stream directory: {Config.STREAM_DIR}")
+    segment_storage.prepare(Config.STREAM_STORAGE)
+    logger.info(
+        f"Segment limits: {Config.STREAM_MAX_BYTES or 'unlimited'} bytes per stream, "
+        f"{Config.STREAM_STORAGE_MAX_BYTES or 'unlimited'} bytes total"
+    )
+    logger.info(f"Recording directory: {Config.RECORDING_DIR}")
+    recording_pool.recover()
+    logger.info(f"Max concurrent streams: {Config.MAX_CONCURRENT_STREAMS}")
+    prewarm_streams = parse_prewarm_streams(Config.PREWARM_STREAMS)
+    if prewarm_streams:
+        logger.info(f"Pre-warming streams: {', '.join(stream_id for stream_id, _ in prewarm_streams)}")
+        stream_manager.prewarm(prewarm_streams)
     logger.info("="*60)
+
+
+if __name__ == '__main__':
+    initialize_services('Flask server')
     
     app.run(
         host=Config.HOST,
@@ -0,0 +1,473 @@
+"""
+Load test of HLS serving and the overlay API.
+Starts the backend (server.py) as a subprocess on a free port with its own
+stream directory, starts streams from a synthetic FFmpeg testsrc source,
+then runs simulated HLS viewers (polling the playlist and fetching new
+segments like a player at the live edge) and overlay CRUD workers against
+it over HTTP for a fixed duration. Reports throughput and p50/p95/p99
+latency per request type, and CPU and RSS of the backend and of each
+FFmpeg process.
+
+The default run measures serving only: backend HLS delivery and the
+overlay API. No FFmpeg runs per stream, so it says nothing about the CPU a
+camera costs. Use --rtsp-url to include per-stream transcoding.
+
+Sources:
+    (default)   testsrc written as HLS to a temporary directory once, served
+                by a local HTTP origin and relayed by each stream with
+                "proxy": true; serving only, no per-stream FFmpeg
+    --rtsp-url  Each stream converts an RTSP source with its own FFmpeg. With
+                --publish, testsrc is first published to that URL, which needs
+                an RTSP server such as MediaMTX listening there
+    --hls-url   Relay an existing HLS source instead of generating one
+
+Overlays use the store in OVERLAY_STORE (MongoDB in MONGODB_URI by default)
+unless --store is given. CPU and RSS are read from /proc, so Linux only.
+
+Usage:
+    # Serving only
+    python benchmarks/load_test.py --streams 4 --viewers 50 --duration 60
+    # Serving plus one FFmpeg per stream
+    python benchmarks/load_test.py --rtsp-url rtsp://127.0.0.1:8554/bench --publish --streams 2
+    python benchmarks/load_test.py --store memory --viewers 0 --overlay-workers 20
+"""
+import argparse
+import collections
+import functools
+import http.client
+import http.server
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from overlay_writes import BACKEND_DIR, percentile
+
+SOURCE_PLAYLIST = 'index.m3u8'
+STARTUP_TIMEOUT_SECONDS = 30
+UPDATES_PER_OVERLAY = 10
+SAMPLE_INTERVAL_SECONDS = 1
+
+URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=1, help='Streams to start (default 1)')
+    parser.add_argument('--viewers', type=int, default=20, help='HLS viewers per stream (default 20)')
+    parser.add_argument('--overlay-workers', type=int, default=5, help='Concurrent overlay CRUD workers (default 5)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run the load (default 30)')
+    parser.add_argument('--size', default='1280x720', help='testsrc frame size (default 1280x720)')
+    parser.add_argument('--rtsp-url', help='RTSP source; each stream runs its own FFmpeg')
+    parser.add_argument('--publish', action='store_true', help='Publish testsrc to --rtsp-url first')
+    parser.add_argument('--hls-url', help='Existing HLS source to relay')
+    parser.add_argument('--codec-mode', choices=('auto', 'copy', 'transcode'), help='codec_mode for RTSP streams')
+    parser.add_argument('--store', choices=('mongodb', 'sqlite', 'memory'), help='Override OVERLAY_STORE')
+    args = parser.parse_args()
+    if args.publish and not args.rtsp_url:
+        parser.error('--publish needs --rtsp-url')
+    if args.rtsp_url and args.hls_url:
+        parser.error('--rtsp-url and --hls-url cannot be combined')
+    return args
+
+
+class Results:
+    """Thread-safe latencies, bytes and errors per request type."""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.bytes = collections.Counter()
+        self.errors = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, kind, seconds, size):
+        with self._lock:
+            self.latencies[kind].append(seconds)
+            self.bytes[kind] += size
+
+    def error(self, kind, message):
+        with self._lock:
+            self.errors[kind].append(message)
+
+
+def call(connection, method, path, results, kind, payload=None):
+    """
+    Send one request over a keep-alive connection and record its latency.
+
+    Returns:
+        tuple: (status, body), or (None, None) on connection errors
+    """
+    # bytes, so headers and body go out in one packet (no Nagle/delayed-ACK stall)
+    body = json.dumps(payload).encode() if payload is not None else None
+    headers = {'Content-Type': 'application/json'} if payload is not None else {}
+    started = time.perf_counter()
+    try:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+    except (http.client.HTTPException, OSError) as e:
+        connection.close()  # Reconnects on the next request
+        results.error(kind, str(e))
+        return None, None
+    elapsed = time.perf_counter() - started
+
+    if response.status >= 400:
+        results.error(kind, f'HTTP {response.status}: {data[:200].decode(errors="replace")}')
+    else:
+        results.record(kind, elapsed, len(data))
+    return response.status, data
+
+
+def viewer(port, playlist_path, stop, results):
+    """Poll a playlist and fetch each new segment once, like a player at the live edge."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    fetched = set()
+    reload_interval = 1.0
+    while not stop.is_set():
+        status, body = call(connection, 'GET', playlist_path, results, 'playlist')
+        if status != 200:
+            stop.wait(reload_interval)
+            continue
+
+        text = body.decode(errors='replace')
+        base = playlist_path.rsplit('/', 1)[0]
+        uris = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith('#')]
+        if '#EXT-X-STREAM-INF' in text:
+            # Master playlist: follow the first variant
+            playlist_path = f'{base}/{uris[0]}'
+            continue
+
+        target = re.search(r'#EXT-X-TARGETDURATION:(\d+)', text)
+        if target:
+            # Players reload about every target duration; half keeps the edge close
+            reload_interval = max(int(target.group(1)) / 2, 0.5)
+
+        # Init segments once, then start three segments from the live edge
+        for uri in URI_ATTRIBUTE.findall(text) + uris[-3:]:
+            if uri not in fetched and not stop.is_set():
+                call(connection, 'GET', f'{base}/{uri}', results, 'segment')
+                fetched.add(uri)
+        stop.wait(reload_interval)
+    connection.close()
+
+
+def overlay_worker(port, stream_id, stop, results):
+    """Create an overlay, move it, list the stream's overlays and delete it, until stopped."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    n = 0
+    while not stop.is_set():
+        status, body = call(connection, 'POST', '/api/overlays', results, 'overlay_create', {
+            'type': 'text',
+            'content': 'load test',
+            'streamId': stream_id
+        })
+        if status != 201:
+            stop.wait(0.5)
+            continue
+
+        overlay_id = json.loads(body)['id']
+        for _ in range(UPDATES_PER_OVERLAY):
+            n += 1
+            call(connection, 'PUT', f'/api/overlays/{overlay_id}', results, 'overlay_update', {
+                'positionPercent': {'x': n % 90, 'y': (n * 7) % 90}
+            })
+        call(connection, 'GET', f'/api/stream/{stream_id}/overlays', results, 'overlay_list')
+        call(connection, 'DELETE', f'/api/overlays/{overlay_id}', results, 'overlay_delete')
+    connection.close()
+
+
+def read_process(pid):
+    """
+    Read a process's CPU time and resident memory from /proc.
+
+    Returns:
+        tuple: (CPU seconds, RSS bytes), or None if the process has exited
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the parenthesised command name; utime and stime are 14 and 15
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+    except (FileNotFoundError, ProcessLookupError, StopIteration):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, rss_kb * 1024
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU and RSS of the backend, the source and each stream's FFmpeg."""
+
+    def __init__(self, port, fixed_processes, stop):
+        super().__init__(daemon=True)
+        self.port = port
+        self.fixed_processes = fixed_processes
+        self.stop = stop
+        # label -> [first sample time, first CPU seconds, last time, last CPU seconds, max RSS]
+        self.samples = {}
+
+    def run(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=10)
+        while not self.stop.is_set():
+            processes = dict(self.fixed_processes)
+            try:
+                connection.request('GET', '/api/stream/status')
+                for stream in json.loads(connection.getresponse().read())['streams']:
+                    if stream['pid']:
+                        # A restarted FFmpeg is reported separately
+                        processes[f"{stream['stream_id']} ffmpeg (pid {stream['pid']})"] = stream['pid']
+            except (http.client.HTTPException, OSError, ValueError, KeyError):
+                connection.close()
+
+            now = time.monotonic()
+            for label, pid in processes.items():
+                sample = read_process(pid)
+                if sample is None:
+                    continue
+                cpu, rss = sample
+                if label not in self.samples:
+                    self.samples[label] = [now, cpu, now, cpu, rss]
+                else:
+                    entry = self.samples[label]
+                    entry[2], entry[3], entry[4] = now, cpu, max(entry[4], rss)
+            self.stop.wait(SAMPLE_INTERVAL_SECONDS)
+        connection.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout, what):
+    """Poll until condition() is true, exiting with an error after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out after {timeout}s waiting for {what}")
+        time.sleep(0.2)
+
+
+def http_status(port, path):
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        connection.request('GET', path)
+        status = connection.getresponse().status
+        connection.close()
+        return status
+    except (http.client.HTTPException, OSError):
+        return None
+
+
+def start_source(ffmpeg_path, args, work_dir):
+    """
+    Start the synthetic testsrc source.
+
+    Returns:
+        tuple: (FFmpeg process, URL streams are started from, HTTP origin server or None)
+    """
+    command = [
+        ffmpeg_path,
+        '-loglevel', 'error',
+        '-re',
+        '-f', 'lavfi', '-i', f'testsrc2=size={args.size}:rate=25',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-g', '50', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '64k'
+    ]
+    if args.publish:
+        process = subprocess.Popen(command + ['-f', 'rtsp', '-rtsp_transport', 'tcp', args.rtsp_url])
+        return process, args.rtsp_url, None
+
+    source_dir = os.path.join(work_dir, 'source')
+    os.makedirs(source_dir)
+    process = subprocess.Popen(command + [
+        '-f', 'hls', '-hls_time', '2', '-hls_list_size', '6', '-hls_flags', 'delete_segments',
+        os.path.join(source_dir, SOURCE_PLAYLIST)
+    ])
+
+    handler = functools.partial(QuietHandler, directory=source_dir)
+    origin = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    wait_for(
+        lambda: os.path.exists(os.path.join(source_dir, SOURCE_PLAYLIST)),
+        STARTUP_TIMEOUT_SECONDS, 'the testsrc source'
+    )
+    return process, f'http://127.0.0.1:{origin.server_address[1]}/{SOURCE_PLAYLIST}', origin
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """Keep-alive static file handler without access logs."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_backend(port, args, work_dir):
+    """Start server.py with its own stream directory and wait until it answers."""
+    env = dict(
+        os.environ, HOST='127.0.0.1', PORT=str(port), STREAM_DIR=os.path.join(work_dir, 'stream'),
+        HLS_PROXY_ALLOWED_HOSTS='127.0.0.1'  # The local origin
+    )
+    if args.store is not None:
+        env['OVERLAY_STORE'] = args.store
+    log_path = os.path.join(work_dir, 'backend.log')
+    process = subprocess.Popen(
+        [sys.executable, 'server.py'], cwd=BACKEND_DIR, env=env,
+        stdout=open(log_path, 'w'), stderr=subprocess.STDOUT
+    )
+    try:
+        wait_for(lambda: http_status(port, '/health') == 200, STARTUP_TIMEOUT_SECONDS, 'the backend')
+    except RuntimeError:
+        process.kill()
+        with open(log_path) as f:
+            sys.exit(f"Backend did not start:\n{f.read()}")
+    return process
+
+
+def start_streams(port, source_url, args, results):
+    """
+    Start each stream and wait for its first playlist.
+
+    Returns:
+        list: (stream_id, playlist path, seconds until the playlist was served)
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=STARTUP_TIMEOUT_SECONDS)
+    streams = []
+    for i in range(args.streams):
+        stream_id = f'bench-{i}'
+        payload = {'stream_id': stream_id}
+        if source_url.startswith(('http://', 'https://')):
+            # Distinct URLs, so each stream gets its own relay rather than sharing one
+            payload.update(rtsp_url=f'{source_url}{"&" if "?" in source_url else "?"}stream={i}', proxy=True)
+        else:
+            payload['rtsp_url'] = source_url
+            if args.codec_mode:
+                payload['codec_mode'] = args.codec_mode
+
+        started = time.monotonic()
+        status, body = call(connection, 'POST', '/api/stream/start', results, 'stream_start', payload)
+        if status != 200:
+            sys.exit(f"Could not start {stream_id}: {body.decode() if body else 'no response'}")
+        playlist_path = urllib.parse.urlsplit(json.loads(body)['hls_url']).path
+        wait_for(lambda: http_status(port, playlist_path) == 200, STARTUP_TIMEOUT_SECONDS, f'{stream_id} playlist')
+        streams.append((stream_id, playlist_path, time.monotonic() - started))
+    connection.close()
+    return streams
+
+
+def stop_process(process):
+    if process is None or process.poll() is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def report(args, store, source_url, streams, results, sampler, duration):
+    """Print the run's settings, request statistics and process usage."""
+    mode = 'rtsp, one FFmpeg per stream' if source_url.startswith('rtsp') else 'hls relay, serving only'
+    print(f"Source:         {source_url} ({mode})")
+    print(f"Load:           {len(streams)} streams, {args.viewers} viewers each, "
+          f"{args.overlay_workers} overlay workers, store {store}, {duration:.1f}s")
+    print("Startup (s):    " + '  '.join(f'{stream_id} {seconds:.2f}' for stream_id, _, seconds in streams))
+    print()
+
+    print(f"{'Request':<16}{'ok':>8}{'errors':>8}{'req/s':>9}{'MB/s':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    kinds = sorted(set(results.latencies) | set(results.errors))
+    for kind in kinds:
+        latencies = sorted(results.latencies[kind])
+        errors = len(results.errors[kind])
+        line = (f"{kind:<16}{len(latencies):>8}{errors:>8}{len(latencies) / duration:>9.1f}"
+                f"{results.bytes[kind] / duration / 1e6:>8.2f}")
+        if latencies:
+            line += ''.join(
+                f"{value * 1000:>9.1f}" for value in (
+                    percentile(latencies, 0.50), percentile(latencies, 0.95),
+                    percentile(latencies, 0.99), latencies[-1]
+                )
+            )
+        print(line)
+    print()
+
+    print(f"{'Process':<40}{'CPU %':>8}{'max RSS MB':>12}")
+    for label, (first_time, first_cpu, last_time, last_cpu, rss) in sorted(sampler.samples.items()):
+        elapsed = last_time - first_time
+        cpu = f'{(last_cpu - first_cpu) / elapsed * 100:.1f}' if elapsed > 0 else '-'
+        print(f"{label:<40}{cpu:>8}{rss / 1e6:>12.1f}")
+
+    for kind in kinds:
+        if results.errors[kind]:
+            print(f"First {kind} error: {results.errors[kind][0]}")
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, BACKEND_DIR)
+    from config import Config
+
+    work_dir = tempfile.mkdtemp(prefix='rtsp-load-test-')
+    results = Results()
+    source = origin = backend = None
+    stop = threading.Event()
+    try:
+        if args.hls_url or (args.rtsp_url and not args.publish):
+            source_url = args.hls_url or args.rtsp_url
+        else:
+            source, source_url, origin = start_source(Config.FFMPEG_PATH, args, work_dir)
+
+        port = free_port()
+        backend = start_backend(port, args, work_dir)
+        streams = start_streams(port, source_url, args, results)
+
+        fixed_processes = {f'backend (pid {backend.pid})': backend.pid}
+        if source:
+            fixed_processes[f'source ffmpeg (pid {source.pid})'] = source.pid
+        sampler = ProcessSampler(port, fixed_processes, stop)
+
+        workers = [
+            threading.Thread(target=viewer, args=(port, playlist_path, stop, results))
+            for _, playlist_path, _ in streams
+            for _ in range(args.viewers)
+        ]
+        workers += [
+            threading.Thread(target=overlay_worker, args=(port, streams[i % len(streams)][0], stop, results))
+            for i in range(args.overlay_workers)
+        ]
+
+        started = time.perf_counter()
+        sampler.start()
+        for worker in workers:
+            worker.start()
+        time.sleep(args.duration)
+        stop.set()
+        for worker in workers:
+            worker.join()
+        duration = time.perf_counter() - started
+        sampler.join()
+
+        report(args, args.store or Config.OVERLAY_STORE, source_url, streams, results, sampler, duration)
+    finally:
+        stop.set()
+        stop_process(backend)
+        stop_process(source)
+        if origin:
+            origin.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark overlay update latency under concurrent writers.
+Creates a set of overlays, then many workers update their positions
+through models.update_overlay (the same path as PUT /api/overlays/<id>),
+and reports latency percentiles and throughput. The overlays are deleted
+afterwards.
+
+Runs against the store in OVERLAY_STORE (MongoDB in MONGODB_URI by
+default); pool and write concern settings come from the environment unless
+overridden below.
+
+Usage:
+    python benchmarks/overlay_writes.py --workers 50 --updates 5000
+    python benchmarks/overlay_writes.py --gevent --workers 500
+    python benchmarks/overlay_writes.py --coalesce-ms 0 --geometry-write-concern majority
+    python benchmarks/overlay_writes.py --store memory
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--overlays', type=int, default=20, help='Overlays to create (default 20)')
+    parser.add_argument('--workers', type=int, default=50, help='Concurrent writers (default 50)')
+    parser.add_argument('--updates', type=int, default=2000, help='Total updates (default 2000)')
+    parser.add_argument('--store', choices=('mongodb', 'sqlite', 'memory'), help='Override OVERLAY_STORE')
+    parser.add_argument('--gevent', action='store_true', help='Run writers as greenlets, as under server.py')
+    parser.add_argument('--coalesce-ms', type=float, help='Override OVERLAY_UPDATE_COALESCE_MS')
+    parser.add_argument('--geometry-write-concern', help='Override MONGODB_GEOMETRY_WRITE_CONCERN')
+    parser.add_argument('--max-pool-size', type=int, help='Override MONGODB_MAX_POOL_SIZE')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.gevent:
+        # Must happen before pymongo and threading are imported
+        from gevent import monkey
+        monkey.patch_all()
+
+    import threading
+    sys.path.insert(0, BACKEND_DIR)
+    from config import Config
+
+    if args.store is not None:
+        Config.OVERLAY_STORE = args.store
+    if args.coalesce_ms is not None:
+        Config.OVERLAY_UPDATE_COALESCE_MS = args.coalesce_ms
+    if args.geometry_write_concern is not None:
+        Config.MONGODB_GEOMETRY_WRITE_CONCERN = args.geometry_write_concern
+    if args.max_pool_size is not None:
+        Config.MONGODB_MAX_POOL_SIZE = args.max_pool_size
+
+    import models
+
+    connected, error = models.init_overlay_store()
+    if not connected:
+        sys.exit(f"MongoDB unavailable: {error}")
+
+    overlay_ids = [
+        models.create_overlay({'type': 'text', 'content': f'benchmark {i}'})['id']
+        for i in range(args.overlays)
+    ]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(args.updates))
+
+    def writer():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            overlay_id = overlay_ids[n % len(overlay_ids)]
+            data = {'positionPercent': {'x': n % 90, 'y': (n * 7) % 90}}
+            started = time.perf_counter()
+            try:
+                models.update_overlay(overlay_id, data)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    try:
+        started = time.perf_counter()
+        if args.gevent:
+            import gevent
+            gevent.joinall([gevent.spawn(writer) for _ in range(args.workers)])
+        else:
+            threads = [threading.Thread(target=writer) for _ in range(args.workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        duration = time.perf_counter() - started
+    finally:
+        for overlay_id in overlay_ids:
+            models.delete_overlay(overlay_id)
+
+    latencies.sort()
+    print(f"Store:          {Config.OVERLAY_STORE}")
+    print(f"Mode:           {'gevent' if args.gevent else 'threads'}, {args.workers} writers, {args.overlays} overlays")
+    if Config.OVERLAY_STORE == 'mongodb':
+        print(f"Pool:           {Config.MONGODB_MIN_POOL_SIZE}-{Config.MONGODB_MAX_POOL_SIZE} connections")
+        print(f"Write concern:  {Config.MONGODB_GEOMETRY_WRITE_CONCERN} (geometry), coalesce {Config.OVERLAY_UPDATE_COALESCE_MS} ms")
+    print(f"Updates:        {len(latencies)} ok, {len(errors)} failed in {duration:.2f}s "
+          f"({len(latencies) / duration:.0f}/s)")
+    if latencies:
+        print(f"Latency (ms):   p50 {percentile(latencies, 0.50) * 1000:.1f}  "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f}  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}  "
+              f"max {latencies[-1] * 1000:.1f}")
+    if errors:
+        print(f"First error:    {errors[0]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,27 @@ load_dotenv()
 class Config:
     """Application configuration class."""
     
+    # Overlay Storage Configuration
+    OVERLAY_STORE = os.getenv('OVERLAY_STORE', 'mongodb')  # mongodb, sqlite or memory
+    OVERLAY_SQLITE_PATH = os.getenv('OVERLAY_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'data', 'overlays.sqlite3'))
+    
     # MongoDB Configuration
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     MONGODB_DB_NAME = os.getenv('MONGODB_DB_NAME', 'rtsp_overlay_db')
+    MONGODB_TIMEOUT_MS = int(os.getenv('MONGODB_TIMEOUT_MS', 10000))  # Server selection, connect and socket
+    MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 2))  # Kept open so bursts skip the handshake
+    MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 300000))
+    # How long a request waits for a free pooled connection before failing
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 5000))
+    MONGODB_WRITE_CONCERN = os.getenv('MONGODB_WRITE_CONCERN', 'majority')
+    # Updates that only move, resize or fade overlays are superseded within
+    # seconds, so they don't wait for replication
+    MONGODB_GEOMETRY_WRITE_CONCERN = os.getenv('MONGODB_GEOMETRY_WRITE_CONCERN', '1')
+    
+    # Local Overlay Store Configuration (used while MongoDB is unavailable)
+    LOCAL_STORE_PATH = os.getenv('LOCAL_STORE_PATH', os.path.join(os.path.dirname(__file__), 'data', 'overlays.db'))
+    LOCAL_STORE_RETRY_SECONDS = float(os.getenv('LOCAL_STORE_RETRY_SECONDS', 15))  # MongoDB reconnect interval
     
     # Flask Configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -22,7 +40,96 @@ class Config:
         print("WARNING: Using default SECRET_KEY. Change this in production!")
     
     # Stream Configuration
-    STREAM_DIR = os.path.join(os.path.dirname(__file__), 'static', 'stream')
+    # disk, or memory to keep segments on a tmpfs/RAM disk (default /dev/shm/rtsp-livestream)
+    STREAM_STORAGE = os.getenv('STREAM_STORAGE', 'disk')
+    STREAM_DIR = os.getenv('STREAM_DIR') or (
+        '/dev/shm/rtsp-livestream' if STREAM_STORAGE == 'memory'
+        else os.path.join(os.path.dirname(__file__), 'static', 'stream')
+    )
+    FFMPEG_PATH = os.getenv('FFMPEG_PATH', '/opt/homebrew/bin/ffmpeg')
+    FFPROBE_PATH = os.getenv('FFPROBE_PATH', '/opt/homebrew/bin/ffprobe')
+    STREAM_CODEC_MODE = os.getenv('STREAM_CODEC_MODE', 'auto')  # auto, copy or transcode
+    PROBE_TIMEOUT_SECONDS = float(os.getenv('PROBE_TIMEOUT_SECONDS', 10))
+
+    # Startup Latency Configuration
+    # FFmpeg reads this much of an RTSP input before writing output (its defaults are 5 MB and 5 s; 0 keeps them)
+    RTSP_PROBESIZE = int(os.getenv('RTSP_PROBESIZE', 500000))
+    RTSP_ANALYZEDURATION_MS = int(os.getenv('RTSP_ANALYZEDURATION_MS', 1000))
+    HLS_INIT_SEGMENT_SECONDS = float(os.getenv('HLS_INIT_SEGMENT_SECONDS', 0.5))  # First playlist's segments; 0 disables
+    STREAM_START_WAIT_SECONDS = float(os.getenv('STREAM_START_WAIT_SECONDS', 15))  # Limit for "wait": true
+    # Streams kept running without viewers: comma-separated stream_id=url
+    PREWARM_STREAMS = os.getenv('PREWARM_STREAMS', '')
+
+    # Low-latency HLS Configuration
+    LL_HLS_PART_DURATION = float(os.getenv('LL_HLS_PART_DURATION', 0.5))
+    LL_HLS_PARTS_PER_SEGMENT = int(os.getenv('LL_HLS_PARTS_PER_SEGMENT', 4))
+    LL_HLS_BLOCK_TIMEOUT_SECONDS = float(os.getenv('LL_HLS_BLOCK_TIMEOUT_SECONDS', 6))
+
+    # DVR Configuration (opt-in per stream with "dvr": true)
+    DVR_WINDOW_SECONDS = float(os.getenv('DVR_WINDOW_SECONDS', 2 * 60 * 60))  # How far back viewers can seek
+
+    # Adaptive Bitrate Configuration: comma-separated name:height:video_bitrate
+    ABR_LADDER = os.getenv('ABR_LADDER', '1080p:1080:5000k,720p:720:2800k,360p:360:800k')
+
+    # Segment Cache Configuration
+    SEGMENT_CACHE_MAX_BYTES = int(os.getenv('SEGMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+    SEGMENT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('SEGMENT_CACHE_MAX_ENTRY_BYTES', 16 * 1024 * 1024))
+    SEGMENT_CACHE_MAX_AGE_SECONDS = int(os.getenv('SEGMENT_CACHE_MAX_AGE_SECONDS', 30))
+    # Let a fronting nginx/Apache send uncached files with sendfile
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+    MAX_CONCURRENT_STREAMS = int(os.getenv('MAX_CONCURRENT_STREAMS', 32))
+    STREAM_IDLE_GRACE_SECONDS = float(os.getenv('STREAM_IDLE_GRACE_SECONDS', 30))
+
+    # Segment Retention Configuration (0 disables a limit); oldest segments are evicted first
+    STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', 256 * 1024 * 1024))  # Per stream
+    STREAM_STORAGE_MAX_BYTES = int(os.getenv('STREAM_STORAGE_MAX_BYTES', 1024 * 1024 * 1024))  # All streams
+    STREAM_STORAGE_CHECK_SECONDS = float(os.getenv('STREAM_STORAGE_CHECK_SECONDS', 2))
+
+    # Recording Configuration (opt-in per stream with "record": true)
+    RECORDING_DIR = os.getenv('RECORDING_DIR', os.path.join(os.path.dirname(__file__), 'data', 'recordings'))
+    RECORDING_WORKERS = int(os.getenv('RECORDING_WORKERS', 2))  # Concurrent hourly MP4 remuxes
+
+    # HLS Relay Configuration (HTTP(S) sources started with "proxy": true)
+    HLS_PROXY_DEFAULT = os.getenv('HLS_PROXY_DEFAULT', 'false').lower() == 'true'  # Relay HTTP(S) sources by default
+    HLS_PROXY_PLAYLIST_MAX_AGE_SECONDS = float(os.getenv('HLS_PROXY_PLAYLIST_MAX_AGE_SECONDS', 1))  # Upstream re-fetch interval
+    HLS_PROXY_TIMEOUT_SECONDS = float(os.getenv('HLS_PROXY_TIMEOUT_SECONDS', 10))
+    HLS_PROXY_MAX_IDLE_CONNECTIONS = int(os.getenv('HLS_PROXY_MAX_IDLE_CONNECTIONS', 8))  # Kept open per upstream host
+    HLS_PROXY_ALLOWED_HOSTS = os.getenv('HLS_PROXY_ALLOWED_HOSTS', '')  # Private hosts that may be relayed
+
+    # Snapshot Configuration (GET /api/stream/<id>/snapshot)
+    SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv('SNAPSHOT_MAX_AGE_SECONDS', 5))  # Reused for this long per stream
+    SNAPSHOT_WIDTH = int(os.getenv('SNAPSHOT_WIDTH', 320))
+    SNAPSHOT_JPEG_QUALITY = int(os.getenv('SNAPSHOT_JPEG_QUALITY', 5))  # FFmpeg -q:v, 2 (best) to 31
+    SNAPSHOT_TIMEOUT_SECONDS = float(os.getenv('SNAPSHOT_TIMEOUT_SECONDS', 5))
+
+    # Transcoder Supervisor Configuration
+    STREAM_STALL_TIMEOUT_SECONDS = float(os.getenv('STREAM_STALL_TIMEOUT_SECONDS', 20))  # No new output for this long
+    STREAM_RESTART_BACKOFF_SECONDS = float(os.getenv('STREAM_RESTART_BACKOFF_SECONDS', 1))
+    STREAM_RESTART_BACKOFF_MAX_SECONDS = float(os.getenv('STREAM_RESTART_BACKOFF_MAX_SECONDS', 30))
+    # A process that stays healthy this long resets the backoff
+    STREAM_RESTART_RESET_SECONDS = float(os.getenv('STREAM_RESTART_RESET_SECONDS', 60))
+    
+    # Overlay Update Configuration
+    # Updates arriving within this window share one MongoDB write; 0 disables coalescing
+    OVERLAY_UPDATE_COALESCE_MS = float(os.getenv('OVERLAY_UPDATE_COALESCE_MS', 20))
+    OVERLAY_BULK_MAX_UPDATES = int(os.getenv('OVERLAY_BULK_MAX_UPDATES', 500))
+    OVERLAY_PAGE_SIZE = int(os.getenv('OVERLAY_PAGE_SIZE', 100))  # Default page of GET /api/stream/<id>/overlays
+    OVERLAY_PAGE_MAX_SIZE = int(os.getenv('OVERLAY_PAGE_MAX_SIZE', 1000))
+    
+    # Overlay Events (SSE) Configuration
+    OVERLAY_EVENTS_MAX_PENDING = int(os.getenv('OVERLAY_EVENTS_MAX_PENDING', 1000))  # Per client before resync
+    OVERLAY_EVENTS_KEEPALIVE_SECONDS = float(os.getenv('OVERLAY_EVENTS_KEEPALIVE_SECONDS', 15))
+    
+    # Overlay Burn-in Configuration (opt-in per stream with "burn_overlays": true)
+    BURN_IN_LAYER_FPS = float(os.getenv('BURN_IN_LAYER_FPS', 4))  # How often FFmpeg re-reads the layer
+    BURN_IN_DEBOUNCE_SECONDS = float(os.getenv('BURN_IN_DEBOUNCE_SECONDS', 0.1))
+    OVERLAY_FONT_PATH = os.getenv('OVERLAY_FONT_PATH')  # TrueType font; Pillow's bundled font when unset
+    OVERLAY_IMAGE_FETCH_TIMEOUT_SECONDS = float(os.getenv('OVERLAY_IMAGE_FETCH_TIMEOUT_SECONDS', 5))
+    OVERLAY_IMAGE_ALLOWED_HOSTS = os.getenv('OVERLAY_IMAGE_ALLOWED_HOSTS', '')  # Private hosts images may come from
+    
+    # Overlay Raster Cache Configuration (decoded and pre-scaled image overlays)
+    OVERLAY_RASTER_CACHE_MAX_BYTES = int(os.getenv('OVERLAY_RASTER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    OVERLAY_IMAGE_TTL_SECONDS = float(os.getenv('OVERLAY_IMAGE_TTL_SECONDS', 300))  # Re-download sources after this
     
     # Environment Configuration
     FLASK_ENV = os.getenv('FLASK_ENV', 'development')
@@ -31,3 +138,4 @@ class Config:
     # Server Configuration
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', 5000))
+    SERVER_MAX_CONNECTIONS = int(os.getenv('SERVER_MAX_CONNECTIONS', 10000))  # server.py only
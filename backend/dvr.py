@@ -0,0 +1,310 @@
+"""
+DVR (time-shift) playlists.
+In DVR mode FFmpeg keeps writing a short live playlist but no longer deletes
+segments. Each session's DvrIndex follows that playlist, keeps a rolling
+index of segment wall-clock start times over Config.DVR_WINDOW_SECONDS,
+deletes segments that fall out of the window, and renders the full DVR
+playlist or one starting at any time within it, without listing the
+output directory.
+"""
+import bisect
+import collections
+import logging
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from segment_cache import segment_cache
+
+logger = logging.getLogger(__name__)
+
+LIVE_PLAYLIST = 'playlist.m3u8'
+DVR_PLAYLIST = 'dvr.m3u8'
+SEGMENT_FILENAME = re.compile(r'^segment(\d+)\.ts$')
+
+# How much video must be indexed before the window's size is projected from its bitrate
+FIT_CHECK_SECONDS = 30
+
+DvrSegment = collections.namedtuple('DvrSegment', ['sequence', 'start', 'duration', 'name', 'discontinuity', 'size'])
+
+
+def parse_time(value):
+    """
+    Parse a seek time.
+
+    Args:
+        value (str): ISO 8601 timestamp, Unix time in seconds, or a negative
+            number of seconds before now
+
+    Returns:
+        float: Unix time in seconds
+
+    Raises:
+        ValueError: If the value is not a valid time
+    """
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid time: {value!r}. Use ISO 8601, Unix seconds, or negative seconds before now")
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid time: {value!r}")
+    return time.time() + seconds if seconds < 0 else seconds
+
+
+def read_live_playlist(output_dir):
+    """
+    Parse the live playlist written by FFmpeg with program_date_time.
+
+    Args:
+        output_dir (str): Stream output directory
+
+    Returns:
+        list: (sequence, start or None, duration, name, discontinuity) tuples,
+            oldest first. start is the EXT-X-PROGRAM-DATE-TIME as Unix time
+    """
+    try:
+        with open(os.path.join(output_dir, LIVE_PLAYLIST)) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+    segments = []
+    duration = None
+    start = None
+    discontinuity = False
+    for line in lines:
+        line = line.strip()
+        if line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            start = _parse_program_date_time(line[len('#EXT-X-PROGRAM-DATE-TIME:'):])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            match = SEGMENT_FILENAME.match(os.path.basename(line))
+            if match:
+                segments.append((int(match.group(1)), start, duration, os.path.basename(line), discontinuity))
+            duration = None
+            start = None
+            discontinuity = False
+
+    return segments
+
+
+def _parse_program_date_time(value):
+    """Parse FFmpeg's EXT-X-PROGRAM-DATE-TIME, e.g. 2026-01-15T10:30:00.123+0000."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z').timestamp()
+    except ValueError:
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            return None
+
+
+class DvrIndex:
+    """
+    Rolling index of one stream's segments by wall-clock time.
+    refresh() is cheap when nothing changed, so it can be called on every
+    playlist request as well as periodically by the stream supervisor.
+    """
+
+    def __init__(self, output_dir, window_seconds, max_bytes=0):
+        self.output_dir = output_dir
+        self.window_seconds = window_seconds
+        # Storage the window should fit in; checked once enough video is indexed
+        self.max_bytes = max_bytes
+        self._fit_checked = not max_bytes
+        self._bytes = 0
+        self._seconds = 0.0
+        self._segments = []
+        self._starts = []
+        self._trimmed = False
+        self._trimmed_discontinuities = 0
+        self._live_version = None
+        self._rendered = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Index segments FFmpeg has added and delete those older than the window."""
+        path = os.path.join(self.output_dir, LIVE_PLAYLIST)
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+
+        with self._lock:
+            if version is not None and version != self._live_version:
+                self._live_version = version
+                last_sequence = self._segments[-1].sequence if self._segments else -1
+                for sequence, start, duration, name, discontinuity in read_live_playlist(self.output_dir):
+                    if sequence <= last_sequence:
+                        continue
+                    if start is None:
+                        # Without a program date, continue from the previous segment
+                        start = (
+                            self._segments[-1].start + self._segments[-1].duration
+                            if self._segments and not discontinuity else time.time() - duration
+                        )
+                    try:
+                        size = os.stat(os.path.join(self.output_dir, name)).st_size
+                    except FileNotFoundError:
+                        size = 0
+                    self._segments.append(DvrSegment(sequence, start, duration, name, discontinuity, size))
+                    self._starts.append(start)
+                    self._bytes += size
+                    self._seconds += duration
+                    last_sequence = sequence
+            self._trim()
+            if not self._fit_checked and self._seconds >= FIT_CHECK_SECONDS:
+                self._fit_checked = True
+                projected = self._bytes / self._seconds * self.window_seconds
+                if projected > self.max_bytes:
+                    logger.warning(
+                        f"DVR window of {os.path.basename(self.output_dir)} needs about {projected / 1e6:.0f} MB "
+                        f"at its current bitrate, over the {self.max_bytes / 1e6:.0f} MB storage limit; "
+                        f"the oldest segments will be evicted before they leave the "
+                        f"{self.window_seconds:g}s window"
+                    )
+
+    def discard(self, names):
+        """
+        Forget segments the storage limits deleted. They are the oldest, so
+        the index is cut after the newest of them and stays contiguous.
+
+        Args:
+            names (set): Deleted segment filenames
+        """
+        with self._lock:
+            positions = [index for index, segment in enumerate(self._segments) if segment.name in names]
+            if positions:
+                self._drop(positions[-1] + 1)
+
+    def render(self):
+        """
+        Render the DVR playlist covering the whole window. It is an EVENT
+        playlist until the first segment leaves the window, and a sliding
+        live playlist after that.
+
+        Returns:
+            str: Playlist text, or None if no segment has been written yet
+        """
+        with self._lock:
+            if not self._segments:
+                return None
+            key = (self._segments[0].sequence, self._segments[-1].sequence)
+            if self._rendered and self._rendered[0] == key:
+                return self._rendered[1]
+            playlist = self._render(0)
+            self._rendered = (key, playlist)
+            return playlist
+
+    def render_from(self, timestamp, uri_prefix=''):
+        """
+        Render a playlist starting at the segment that covers a point in time,
+        running to the live edge. Players start playback at its beginning.
+        Times outside the window are clamped to its oldest or newest segment.
+
+        Args:
+            timestamp (float): Unix time in seconds
+            uri_prefix (str): Prefix for segment URIs, for playlists not
+                served from the stream directory
+
+        Returns:
+            str: Playlist text, or None if no segment has been written yet
+        """
+        with self._lock:
+            if not self._segments:
+                return None
+            index = min(max(bisect.bisect_right(self._starts, timestamp) - 1, 0), len(self._segments) - 1)
+            return self._render(index, uri_prefix, start_here=True)
+
+    def window(self):
+        """
+        Return the time range the index covers.
+
+        Returns:
+            dict: {'start': float, 'end': float} Unix times, or None if empty
+        """
+        with self._lock:
+            if not self._segments:
+                return None
+            last = self._segments[-1]
+            return {'start': self._segments[0].start, 'end': last.start + last.duration}
+
+    def _render(self, index, uri_prefix='', start_here=False):
+        """Render the playlist from segment index onwards. Caller holds the lock."""
+        segments = self._segments[index:]
+        discontinuities = self._trimmed_discontinuities + sum(
+            1 for segment in self._segments[1:index + 1] if segment.discontinuity
+        )
+        target_duration = max(math.ceil(segment.duration) for segment in segments)
+
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target_duration}',
+            f'#EXT-X-MEDIA-SEQUENCE:{segments[0].sequence}',
+            f'#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuities}'
+        ]
+        if not self._trimmed:
+            lines.append('#EXT-X-PLAYLIST-TYPE:EVENT')
+        if start_here:
+            lines.append('#EXT-X-START:TIME-OFFSET=0,PRECISE=YES')
+
+        for position, segment in enumerate(segments):
+            if segment.discontinuity and position > 0:
+                lines.append('#EXT-X-DISCONTINUITY')
+            if position == 0 or segment.discontinuity:
+                start = datetime.fromtimestamp(segment.start, timezone.utc)
+                lines.append(f'#EXT-X-PROGRAM-DATE-TIME:{start.isoformat(timespec="milliseconds")}')
+            lines.append(f'#EXTINF:{segment.duration:.3f},')
+            lines.append(uri_prefix + segment.name)
+
+        return '\n'.join(lines) + '\n'
+
+    def _trim(self):
+        """
+        Drop segments older than the window, deleting their files, and any
+        the storage limits already deleted. Caller holds the lock.
+        """
+        cutoff = time.time() - self.window_seconds
+        removed = 0
+        # The segment at the live edge is kept even if the stream has stalled
+        for segment in self._segments[:-1]:
+            # Storage limits evict the oldest segments first, so only the head can be missing
+            path = os.path.join(self.output_dir, segment.name)
+            if segment.start + segment.duration >= cutoff and os.path.exists(path):
+                break
+            removed += 1
+        if removed:
+            self._drop(removed)
+
+    def _drop(self, count):
+        """Remove the oldest count segments and their files. Caller holds the lock."""
+        for segment in self._segments[:count]:
+            path = os.path.join(self.output_dir, segment.name)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            segment_cache.discard(path)
+            self._bytes -= segment.size
+            self._seconds -= segment.duration
+
+        self._trimmed_discontinuities += sum(
+            1 for segment in self._segments[1:count + 1] if segment.discontinuity
+        )
+        del self._segments[:count]
+        del self._starts[:count]
+        self._trimmed = True
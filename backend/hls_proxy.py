@@ -0,0 +1,422 @@
+"""
+Relay for HTTP(S) HLS sources.
+Instead of handing an http(s) playlist URL back to every browser, a relay
+session fetches the upstream playlists and segments once, over pooled
+keep-alive connections, and writes them into its stream directory, where
+serve_stream_file and the segment cache serve them to any number of local
+viewers. Playlists are rewritten so every URI points back at the relay,
+and concurrent requests for the same missing file share one upstream fetch.
+"""
+import hashlib
+import http.client
+import logging
+import os
+import re
+import shutil
+import ssl
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from config import Config
+from segment_cache import segment_cache
+from segment_storage import segment_storage
+from snapshots import snapshot_cache
+from stream_metrics import RelayMetrics
+from url_guard import check_url, parse_allowed_hosts
+
+logger = logging.getLogger(__name__)
+
+ENTRY_PLAYLIST = 'playlist.m3u8'
+MAX_RESOURCE_BYTES = 64 * 1024 * 1024
+MAX_REDIRECTS = 3
+
+ALLOWED_HOSTS = parse_allowed_hosts(Config.HLS_PROXY_ALLOWED_HOSTS)
+
+# An origin's address is re-checked this often, not on every fetch
+HOST_CHECK_SECONDS = 60
+
+# Upstream files are remembered this long after a playlist last listed them
+# (or, for playlists, a viewer last requested them)
+RESOURCE_RETENTION_SECONDS = 60
+
+# Requests for the same file share one lock, and therefore one fetch
+FETCH_LOCK_STRIPES = 64
+
+URI_ATTRIBUTE = re.compile(r'URI="([^"]+)"')
+SAFE_EXTENSION = re.compile(r'^\.[A-Za-z0-9]{1,5}$')
+
+
+class UpstreamError(RuntimeError):
+    """Raised when an upstream playlist or segment cannot be fetched."""
+
+
+class UpstreamPool:
+    """Keep-alive HTTP(S) connections to upstream origins, reused across fetches."""
+
+    def __init__(self, max_idle_per_host, timeout):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.requests = 0
+        self.reused_connections = 0
+        self.fetched_bytes = 0
+        self._idle = {}
+        self._checked_hosts = {}
+        self._ssl_context = ssl.create_default_context()
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        """
+        GET a URL, following redirects. The host of the URL and of every
+        redirect target must be public or in HLS_PROXY_ALLOWED_HOSTS.
+
+        Args:
+            url (str): http(s) URL
+
+        Returns:
+            tuple: (final URL after redirects, response body)
+
+        Raises:
+            UpstreamError: On disallowed hosts, connection errors, non-200
+                responses or oversized bodies
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            self._check_host(url)
+            status, headers, body = self._request(url)
+            location = headers.get('Location')
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if status != 200:
+                raise UpstreamError(f"Upstream returned {status} for {url}")
+            return url, body
+        raise UpstreamError(f"Too many redirects for {url}")
+
+    def stats(self):
+        """Return fetch counters for monitoring."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'reused_connections': self.reused_connections,
+                'fetched_bytes': self.fetched_bytes
+            }
+
+    def _check_host(self, url):
+        """Check an origin with url_guard, remembering hosts that passed for HOST_CHECK_SECONDS."""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        now = time.monotonic()
+        with self._lock:
+            checked_at = self._checked_hosts.get(key)
+        if checked_at is not None and now - checked_at < HOST_CHECK_SECONDS:
+            return
+        try:
+            check_url(url, ALLOWED_HOSTS)
+        except ValueError as e:
+            raise UpstreamError(str(e))
+        with self._lock:
+            self._checked_hosts[key] = now
+
+    def _request(self, url):
+        """Send one GET over a pooled connection, retrying once if an idle connection was closed."""
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise UpstreamError(f"Unsupported upstream URL: {url}")
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+        for attempt in range(2):
+            connection, reused = self._checkout(key, parts)
+            try:
+                connection.request('GET', path, headers={'Accept-Encoding': 'identity'})
+                response = connection.getresponse()
+                body = response.read(MAX_RESOURCE_BYTES + 1)
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if reused and attempt == 0:
+                    continue  # The origin closed the idle connection
+                raise UpstreamError(f"Could not fetch {url}: {str(e)}")
+
+            if len(body) > MAX_RESOURCE_BYTES:
+                connection.close()
+                raise UpstreamError(f"Upstream file larger than {MAX_RESOURCE_BYTES} bytes: {url}")
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(key, connection)
+
+            with self._lock:
+                self.requests += 1
+                self.reused_connections += int(reused)
+                self.fetched_bytes += len(body)
+            return response.status, response.headers, body
+
+    def _checkout(self, key, parts):
+        """Return (connection, reused): an idle pooled connection, or a new one."""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        if parts.scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                parts.hostname, parts.port, timeout=self.timeout, context=self._ssl_context
+            )
+        else:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=self.timeout)
+        return connection, False
+
+    def _checkin(self, key, connection):
+        """Return a connection to the pool, closing it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+
+def validate_source_url(url):
+    """
+    Check a source URL before relaying it.
+
+    Raises:
+        ValueError: If its host is neither public nor in HLS_PROXY_ALLOWED_HOSTS
+    """
+    check_url(url, ALLOWED_HOSTS)
+
+
+def is_master_playlist(text):
+    """Return True for a master (multivariant) playlist."""
+    return '#EXT-X-STREAM-INF' in text
+
+
+class ProxySession:
+    """
+    An HTTP(S) HLS source relayed to local viewers.
+    Registered with the StreamManager like a StreamSession, so viewers share
+    it and the stop and status endpoints work the same; there is no FFmpeg
+    process.
+    """
+
+    low_latency = False
+    abr = False
+    burn_overlays = False
+    dvr = None
+    recorder = None
+    codec_mode = None
+    codec_plan = None
+    source_codecs = None
+    renditions = []
+    restart_count = 0
+    proxy = True
+
+    def __init__(self, stream_id, source_url):
+        self.stream_id = stream_id
+        self.rtsp_url = source_url
+        self.output_dir = os.path.join(Config.STREAM_DIR, stream_id)
+        self.playlist_name = ENTRY_PLAYLIST
+        self.viewers = 0
+        self.teardown_timer = None
+        self.pinned = False
+        self.started_at = None
+        self.first_segment_at = None
+        self.metrics = RelayMetrics()
+        self.last_failure = None
+        # Local name -> (upstream URL, is playlist, time last listed)
+        self._resources = {ENTRY_PLAYLIST: (source_url, True, float('inf'))}
+        self._resources_lock = threading.Lock()
+        self._fetch_locks = [threading.Lock() for _ in range(FETCH_LOCK_STRIPES)]
+
+    @property
+    def share_key(self):
+        """Viewers of the same upstream URL share one relay."""
+        return proxy_share_key(self.rtsp_url)
+
+    def is_active(self):
+        return True
+
+    def is_ready(self):
+        """Return True once the upstream playlist has been fetched."""
+        if self.first_segment_at is None:
+            if not os.path.exists(os.path.join(self.output_dir, ENTRY_PLAYLIST)):
+                return False
+            self.first_segment_at = time.time()
+        return True
+
+    def wait_until_ready(self, timeout):
+        """
+        Fetch the upstream playlist now, so the first viewer is served from
+        the relay. Bounded by HLS_PROXY_TIMEOUT_SECONDS rather than timeout.
+
+        Returns:
+            bool: True if the playlist was fetched
+        """
+        try:
+            self.prepare(ENTRY_PLAYLIST)
+        except UpstreamError as e:
+            logger.warning(f"Relay {self.stream_id} not ready: {str(e)}")
+            return False
+        return self.is_ready()
+
+    def start(self):
+        """Create the output directory. Upstream files are fetched on first request."""
+        # Relayed files are expired by _rewrite_playlist, not the storage limits
+        segment_storage.exclude(self.stream_id)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = datetime.utcnow()
+        logger.info(f"Relaying {self.rtsp_url} as stream {self.stream_id}")
+
+    def stop(self):
+        """Remove everything fetched for this relay."""
+        segment_storage.release(self.stream_id)
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        segment_cache.discard_dir(self.output_dir)
+        snapshot_cache.discard(self.stream_id)
+
+    def prepare(self, name):
+        """
+        Make sure a file is in the stream directory before it is served:
+        playlists are re-fetched once older than HLS_PROXY_PLAYLIST_MAX_AGE_SECONDS,
+        other files are fetched once. If a playlist refresh fails, the
+        previous copy is served.
+
+        Args:
+            name (str): Filename within the stream directory
+
+        Raises:
+            LookupError: If the name was not listed by any relayed playlist
+            UpstreamError: If the file cannot be fetched and no copy exists
+        """
+        with self._resources_lock:
+            resource = self._resources.get(name)
+            if resource is not None and resource[1]:
+                # Players keep polling a variant without re-fetching its master,
+                # so a requested playlist counts as listed
+                resource = self._resources[name] = (resource[0], True, max(resource[2], time.time()))
+        if resource is None:
+            raise LookupError(f"File not found: {name}")
+        url, is_playlist, _ = resource
+        path = os.path.join(self.output_dir, name)
+
+        if self._is_fresh(path, is_playlist):
+            return
+        with self._fetch_locks[hash(name) % FETCH_LOCK_STRIPES]:
+            # Another request may have fetched it while this one waited
+            if self._is_fresh(path, is_playlist):
+                return
+            try:
+                final_url, body = upstream_pool.fetch(url)
+            except UpstreamError as e:
+                self.metrics.record_error()
+                self.last_failure = str(e)
+                if is_playlist and os.path.exists(path):
+                    logger.warning(f"Serving previous playlist of relay {self.stream_id}: {str(e)}")
+                    return
+                raise
+            self.metrics.record_fetch(len(body))
+
+            if is_playlist:
+                body = self._rewrite_playlist(body.decode('utf-8', errors='replace'), final_url).encode()
+            _write_atomic(path, body)
+
+    def to_dict(self):
+        """Serialize relay state for API responses."""
+        return {
+            'stream_id': self.stream_id,
+            'rtsp_url': self.rtsp_url,
+            'active': True,
+            'ready': self.is_ready(),
+            'proxy': True,
+            'pinned': self.pinned,
+            'viewers': self.viewers,
+            'low_latency': False,
+            'abr': False,
+            'burn_overlays': False,
+            'dvr': None,
+            'recording': False,
+            'renditions': [],
+            'codec_mode': None,
+            'codec_plan': None,
+            'source_codecs': None,
+            'pid': None,
+            'restarts': 0,
+            'last_failure': self.last_failure,
+            'startedAt': self.started_at.isoformat() if self.started_at else None
+        }
+
+    def _is_fresh(self, path, is_playlist):
+        """Return True if a fetched copy exists and, for playlists, is recent enough."""
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+        return not is_playlist or time.time() - modified < Config.HLS_PROXY_PLAYLIST_MAX_AGE_SECONDS
+
+    def _rewrite_playlist(self, text, base_url):
+        """
+        Point every URI in a playlist at a local name and remember the upstream
+        URL behind it. Files no playlist has listed, and playlists no viewer
+        has requested, for a while are forgotten and deleted.
+        """
+        master = is_master_playlist(text)
+        now = time.time()
+        listed = {}
+
+        def local_name(uri, is_playlist):
+            url = urllib.parse.urljoin(base_url, uri)
+            extension = os.path.splitext(urllib.parse.urlsplit(url).path)[1]
+            if is_playlist:
+                extension = '.m3u8'
+            elif not SAFE_EXTENSION.match(extension):
+                extension = ''
+            name = hashlib.blake2b(url.encode(), digest_size=8).hexdigest() + extension
+            listed[name] = (url, is_playlist, now)
+            return name
+
+        lines = []
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith('#'):
+                # Renditions and I-frame playlists are playlists; keys, maps and parts are not
+                nested_playlist = master and stripped.startswith(('#EXT-X-MEDIA:', '#EXT-X-I-FRAME-STREAM-INF:'))
+                line = URI_ATTRIBUTE.sub(lambda match: f'URI="{local_name(match.group(1), nested_playlist)}"', line)
+            elif stripped:
+                # In a master playlist, plain URIs are variant playlists
+                line = local_name(stripped, master)
+            lines.append(line)
+
+        with self._resources_lock:
+            self._resources.update(listed)
+            expired = [
+                name for name, (_, _, last_listed) in self._resources.items()
+                if now - last_listed > RESOURCE_RETENTION_SECONDS
+            ]
+            for name in expired:
+                del self._resources[name]
+
+        for name in expired:
+            path = os.path.join(self.output_dir, name)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            segment_cache.discard(path)
+
+        return '\n'.join(lines) + '\n'
+
+
+def proxy_share_key(source_url):
+    """Build the StreamManager sharing key of a relay."""
+    return ('proxy', source_url)
+
+
+def _write_atomic(path, data):
+    """Write a file under a temporary name and rename it, so readers never see it partially written."""
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+upstream_pool = UpstreamPool(Config.HLS_PROXY_MAX_IDLE_CONNECTIONS, Config.HLS_PROXY_TIMEOUT_SECONDS)
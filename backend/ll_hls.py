@@ -0,0 +1,206 @@
+"""
+Low-latency HLS (LL-HLS) playlist generation.
+FFmpeg writes short fMP4/CMAF parts with its own playlist; this module groups
+them into full segments and renders the LL-HLS media playlist with
+EXT-X-PART, EXT-X-PRELOAD-HINT and blocking playlist reload support.
+"""
+import math
+import os
+import re
+import time
+from config import Config
+
+PARTS_PLAYLIST = 'parts.m3u8'
+INIT_SEGMENT = 'init.mp4'
+PART_PATTERN = 'part%05d.m4s'
+PART_FILENAME = re.compile(r'^part(\d+)\.m4s$')
+SEGMENT_FILENAME = re.compile(r'^segment(\d+)\.m4s$')
+
+# Only the most recent segments need their parts listed
+PART_LISTED_SEGMENTS = 3
+
+POLL_INTERVAL_SECONDS = 0.05
+
+
+def read_parts(output_dir):
+    """
+    Parse the parts playlist written by FFmpeg.
+
+    Args:
+        output_dir (str): Stream output directory
+
+    Returns:
+        list: (sequence_number, duration, uri, discontinuity) tuples, oldest first.
+            discontinuity is True for the first part written after a restart
+    """
+    try:
+        with open(os.path.join(output_dir, PARTS_PLAYLIST)) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+    parts = []
+    duration = None
+    discontinuity = False
+    for line in lines:
+        line = line.strip()
+        if line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line and not line.startswith('#') and duration is not None:
+            match = PART_FILENAME.match(os.path.basename(line))
+            if match:
+                parts.append((int(match.group(1)), duration, os.path.basename(line), discontinuity))
+            duration = None
+            discontinuity = False
+
+    return parts
+
+
+def render_playlist(parts, discontinuity_count=0):
+    """
+    Render the LL-HLS media playlist for a list of parts.
+
+    Args:
+        parts (list): Result of read_parts
+        discontinuity_count (int): Discontinuities since the stream started,
+            including any still listed in parts
+
+    Returns:
+        str: Playlist text, or None if no complete segment boundary exists yet
+    """
+    per_segment = Config.LL_HLS_PARTS_PER_SEGMENT
+
+    # Skip a leading segment whose first parts FFmpeg has already deleted
+    first_sequence = _first_full_segment(parts) * per_segment
+    parts = [part for part in parts if part[0] >= first_sequence]
+    if not parts:
+        return None
+
+    segments = {}
+    for part in parts:
+        segments.setdefault(part[0] // per_segment, []).append(part)
+    msns = sorted(segments)
+    listed_discontinuities = sum(1 for msn in msns if segments[msn][0][3])
+
+    part_target = max([Config.LL_HLS_PART_DURATION] + [part[1] for part in parts])
+    target_duration = max(
+        [math.ceil(part_target * per_segment)]
+        + [math.ceil(sum(part[1] for part in segments[msn])) for msn in msns]
+    )
+
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:9',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        f'#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={part_target * 3:.3f}',
+        f'#EXT-X-PART-INF:PART-TARGET={part_target:.3f}',
+        f'#EXT-X-MEDIA-SEQUENCE:{msns[0]}',
+        f'#EXT-X-DISCONTINUITY-SEQUENCE:{max(discontinuity_count - listed_discontinuities, 0)}',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+        f'#EXT-X-MAP:URI="{INIT_SEGMENT}"'
+    ]
+
+    for msn in msns:
+        segment_parts = segments[msn]
+        if segment_parts[0][3]:
+            lines.append('#EXT-X-DISCONTINUITY')
+        if msn >= msns[-1] - PART_LISTED_SEGMENTS:
+            for _, duration, uri, _ in segment_parts:
+                # FFmpeg only cuts parts on keyframes, so every part is independent
+                lines.append(f'#EXT-X-PART:DURATION={duration:.3f},URI="{uri}",INDEPENDENT=YES')
+        if len(segment_parts) == per_segment:
+            lines.append(f'#EXTINF:{sum(part[1] for part in segment_parts):.3f},')
+            lines.append(f'segment{msn}.m4s')
+
+    next_part = PART_PATTERN % (parts[-1][0] + 1)
+    lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="{next_part}"')
+    return '\n'.join(lines) + '\n'
+
+
+def wait_for_playlist(output_dir, msn=None, part=None, discontinuity_count=0):
+    """
+    Blocking playlist reload: wait until the requested segment/part is listed.
+
+    Args:
+        output_dir (str): Stream output directory
+        msn (int): Media sequence number from _HLS_msn (optional)
+        part (int): Part index from _HLS_part (optional)
+        discontinuity_count (int): Passed through to render_playlist
+
+    Returns:
+        str: Playlist text, or None if nothing is available before the timeout
+
+    Raises:
+        ValueError: If the request is more than two segments ahead of the live edge
+    """
+    per_segment = Config.LL_HLS_PARTS_PER_SEGMENT
+    deadline = time.monotonic() + Config.LL_HLS_BLOCK_TIMEOUT_SECONDS
+
+    while True:
+        parts = read_parts(output_dir)
+        if msn is None:
+            playlist = render_playlist(parts, discontinuity_count)
+            if playlist:
+                return playlist
+        else:
+            wanted = msn * per_segment + (part if part is not None else per_segment - 1)
+            latest = parts[-1][0] if parts else -1
+            if latest >= wanted:
+                return render_playlist(parts, discontinuity_count)
+            if parts and msn > latest // per_segment + 2:
+                raise ValueError("Requested media sequence is too far ahead of the live edge")
+
+        if time.monotonic() >= deadline:
+            return render_playlist(parts, discontinuity_count)
+        time.sleep(POLL_INTERVAL_SECONDS)
+
+
+def wait_for_part(output_dir, filename):
+    """
+    Wait for a hinted part to be written. FFmpeg writes parts to a temporary
+    file and renames them, so an existing part is always complete.
+
+    Returns:
+        bool: True if the part exists before the timeout
+    """
+    path = os.path.join(output_dir, filename)
+    deadline = time.monotonic() + Config.LL_HLS_BLOCK_TIMEOUT_SECONDS
+
+    while not os.path.exists(path):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL_SECONDS)
+    return True
+
+
+def read_segment(output_dir, msn):
+    """
+    Assemble a full segment by concatenating its fMP4 parts.
+
+    Args:
+        output_dir (str): Stream output directory
+        msn (int): Media sequence number
+
+    Returns:
+        bytes: Segment data, or None if any part is missing
+    """
+    per_segment = Config.LL_HLS_PARTS_PER_SEGMENT
+    chunks = []
+    for sequence in range(msn * per_segment, (msn + 1) * per_segment):
+        try:
+            with open(os.path.join(output_dir, PART_PATTERN % sequence), 'rb') as f:
+                chunks.append(f.read())
+        except FileNotFoundError:
+            return None
+    return b''.join(chunks)
+
+
+def _first_full_segment(parts):
+    """Return the media sequence number of the first segment with all parts present."""
+    per_segment = Config.LL_HLS_PARTS_PER_SEGMENT
+    if not parts:
+        return 0
+    first = parts[0][0]
+    return first // per_segment + (1 if first % per_segment else 0)
@@ -1,13 +1,28 @@
 """
-MongoDB models and database operations for overlay management.
+Overlay models and database operations for overlay management.
+Overlays are stored through the OverlayRepository selected by
+Config.OVERLAY_STORE. With MongoDB, overlays are read from and written to a
+durable local store while it is unreachable, and local changes are replayed
+once it recovers.
 """
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, OperationFailure
+from pymongo.errors import (
+    ConnectionFailure, ServerSelectionTimeoutError, OperationFailure, PyMongoError, WaitQueueTimeoutError
+)
 from bson import ObjectId
 from datetime import datetime
 from config import Config
+from overlay_events import overlay_events
+from overlay_repository import (
+    MemoryOverlayRepository, MongoOverlayRepository, SqliteOverlayRepository, write_concern_w
+)
 import logging
+import math
+import os
+import threading
+import time
 import urllib.parse
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,83 +32,337 @@ logger = logging.getLogger(__name__)
 _client = None
 _db = None
 _connection_attempted = False
-_temp_overlays = {}  # In-memory storage when MongoDB is unavailable
+
+# Repository for the sqlite and memory stores, opened on first use
+_repository = None
+_repository_lock = threading.Lock()
+
+# Local store used while MongoDB is unavailable, opened on first use.
+# Held while switching between MongoDB and the store, and for every local
+# operation, so no local write can land after its changes were replayed.
+_store_lock = threading.RLock()
+_local_store = None
+_reconnect_thread = None
+
+# Write-through read cache of the overlays collection, loaded on first read.
+# Every write bumps the version; the epoch keeps ETags from an earlier
+# process from matching after a restart.
+_cache_lock = threading.RLock()
+_cache_overlays = None  # {id: overlay} once loaded
+_cache_list = None  # Snapshot returned by get_all_overlays, rebuilt after writes
+_cache_version = 0
+_cache_epoch = uuid.uuid4().hex[:8]
+
+# Overlay updates waiting for the current coalescing window to close
+_pending_lock = threading.Lock()
+_pending_updates = None
+
+# Fields a client may change after creation
+UPDATABLE_FIELDS = ('position', 'size', 'content', 'opacity', 'positionPercent', 'sizePercent')
+
+# Percentage geometry fields and the numeric keys each must contain
+PERCENT_FIELDS = {'positionPercent': ('x', 'y'), 'sizePercent': ('width', 'height')}
+
+OVERLAY_STORES = ('mongodb', 'sqlite', 'memory')
+
+# Fields a per-stream list may be limited to ('id' is always returned)
+LIST_FIELDS = (
+    'type', 'content', 'position', 'size', 'positionPercent', 'sizePercent',
+    'opacity', 'streamId', 'createdAt', 'updatedAt'
+)
+
+
+class OverlayStoreUnavailableError(RuntimeError):
+    """
+    Raised while MongoDB is unreachable and the local store has no full copy
+    of the overlays, because they were never loaded before it went down.
+    """
+
+
+def init_overlay_store():
+    """
+    Open the storage backend selected by Config.OVERLAY_STORE.
+    Should be called once at application startup.
+    
+    Returns:
+        tuple: (success: bool, error_message: str or None)
+        
+    Raises:
+        ValueError: If OVERLAY_STORE is not a known backend
+    """
+    if Config.OVERLAY_STORE not in OVERLAY_STORES:
+        raise ValueError(f"OVERLAY_STORE must be one of {', '.join(OVERLAY_STORES)}")
+    
+    if Config.OVERLAY_STORE == 'mongodb':
+        return init_db_connection()
+    
+    _get_repository()
+    return (True, None)
+
+
+def _get_repository():
+    """Open the sqlite or memory repository on first use."""
+    global _repository
+    
+    with _repository_lock:
+        if _repository is None:
+            if Config.OVERLAY_STORE == 'sqlite':
+                _repository = SqliteOverlayRepository(Config.OVERLAY_SQLITE_PATH)
+            else:
+                _repository = MemoryOverlayRepository()
+            logger.info(f"Using {Config.OVERLAY_STORE} overlay store")
+        return _repository
 
 
 def init_db_connection():
     """
     Initialize MongoDB database connection with proper error handling.
-    Should be called once at application startup.
+    Should be called once at application startup. If MongoDB is unreachable,
+    overlays are kept in the local store and the connection is retried in
+    the background.
     
     Returns:
         tuple: (success: bool, error_message: str or None)
     """
-    global _client, _db, _connection_attempted
+    global _connection_attempted
     
     if _connection_attempted:
         return (_db is not None, None if _db else "Connection already attempted and failed")
     
     _connection_attempted = True
     
+    connected, error_msg = _restore_db()
+    if not connected:
+        logger.warning(f"Storing overlays locally in {Config.LOCAL_STORE_PATH} until MongoDB is reachable")
+        _start_reconnect()
+    return (connected, error_msg)
+
+
+def _connect_db():
+    """
+    Connect to MongoDB and prepare the overlays collection.
+    The client is created once and reused by later attempts, since it keeps
+    rediscovering the server in the background.
+    
+    Returns:
+        tuple: (database or None, error_message: str or None)
+    """
+    global _client
+    
     try:
         # Log connection attempt (without exposing password)
         safe_uri = Config.MONGODB_URI.split('@')[1] if '@' in Config.MONGODB_URI else Config.MONGODB_URI
         logger.info(f"Attempting to connect to MongoDB Atlas: {safe_uri}")
         logger.info(f"Database name: {Config.MONGODB_DB_NAME}")
         
-        # Create MongoDB client with recommended settings for Atlas
-        _client = MongoClient(
-            Config.MONGODB_URI,
-            serverSelectionTimeoutMS=10000,  # 10 second timeout
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000,
-            retryWrites=True,
-            w='majority'
-        )
+        # Create MongoDB client with recommended settings for Atlas. Under
+        # server.py the pool is shared by greenlets, so maxPoolSize bounds
+        # concurrent database calls and the rest queue for a connection
+        if _client is None:
+            _client = MongoClient(
+                Config.MONGODB_URI,
+                serverSelectionTimeoutMS=Config.MONGODB_TIMEOUT_MS,
+                connectTimeoutMS=Config.MONGODB_TIMEOUT_MS,
+                socketTimeoutMS=Config.MONGODB_TIMEOUT_MS,
+                minPoolSize=Config.MONGODB_MIN_POOL_SIZE,
+                maxPoolSize=Config.MONGODB_MAX_POOL_SIZE,
+                maxIdleTimeMS=Config.MONGODB_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=Config.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+                retryWrites=True,
+                w=write_concern_w(Config.MONGODB_WRITE_CONCERN)
+            )
         
         # Test connection by pinging the server
         _client.admin.command('ping')
         
         # Get database reference
-        _db = _client[Config.MONGODB_DB_NAME]
+        db = _client[Config.MONGODB_DB_NAME]
         
         # Verify database access by listing collections
-        collections = _db.list_collection_names()
+        collections = db.list_collection_names()
         logger.info(f"✅ Successfully connected to MongoDB Atlas!")
         logger.info(f"Database: {Config.MONGODB_DB_NAME}")
         logger.info(f"Existing collections: {collections if collections else 'None (will be created)'}")
+        logger.info(
+            f"Connection pool: {Config.MONGODB_MIN_POOL_SIZE}-{Config.MONGODB_MAX_POOL_SIZE} connections, "
+            f"write concern {Config.MONGODB_WRITE_CONCERN} (geometry {Config.MONGODB_GEOMETRY_WRITE_CONCERN})"
+        )
         
         # Create indexes for better performance
         try:
-            _db.overlays.create_index([("createdAt", -1)])
-            logger.info("Created index on overlays.createdAt")
+            db.overlays.create_index([("createdAt", -1)])
+            # Per-stream lists filter on streamId and page through _id
+            db.overlays.create_index([("streamId", 1), ("_id", 1)])
+            logger.info("Created indexes on overlays.createdAt and overlays.streamId")
         except Exception as e:
             logger.warning(f"Could not create index: {e}")
         
-        return (True, None)
+        return (db, None)
         
     except ServerSelectionTimeoutError as e:
         error_msg = f"Connection timeout - could not reach MongoDB Atlas. Check: 1) Network connectivity, 2) IP whitelist in Atlas Network Access"
         logger.error(f"❌ {error_msg}")
         logger.error(f"Details: {str(e)}")
-        return (False, error_msg)
+        return (None, error_msg)
         
     except OperationFailure as e:
         error_msg = f"Authentication failed. Check: 1) Username and password are correct, 2) User has access to database '{Config.MONGODB_DB_NAME}'"
         logger.error(f"❌ {error_msg}")
         logger.error(f"Details: {str(e)}")
-        return (False, error_msg)
+        return (None, error_msg)
         
     except ConnectionFailure as e:
         error_msg = f"Connection failed: {str(e)}"
         logger.error(f"❌ {error_msg}")
-        return (False, error_msg)
+        return (None, error_msg)
         
     except Exception as e:
         error_msg = f"Unexpected error connecting to MongoDB: {str(e)}"
         logger.error(f"❌ {error_msg}")
         logger.exception("Full traceback:")
+        return (None, error_msg)
+
+
+def _restore_db():
+    """
+    Connect to MongoDB, replay changes made in the local store while it was
+    unavailable, and switch reads and writes back to MongoDB.
+    
+    Returns:
+        tuple: (success: bool, error_message: str or None)
+    """
+    global _db
+    
+    db, error_msg = _connect_db()
+    if db is None:
         return (False, error_msg)
+    
+    with _store_lock:
+        try:
+            _replay_local_changes(db)
+        except PyMongoError as e:
+            error_msg = f"Could not replay local overlay changes: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            return (False, error_msg)
+        _db = db
+        _reset_cache()
+    return (True, None)
+
+
+def _get_local_store():
+    """Open the local store on first use."""
+    global _local_store
+    
+    with _store_lock:
+        if _local_store is None:
+            _local_store = SqliteOverlayRepository(Config.LOCAL_STORE_PATH, track_changes=True)
+        return _local_store
+
+
+def _replay_local_changes(db):
+    """
+    Write overlays created, updated or deleted in the local store to MongoDB,
+    then empty the store. Changes are applied in order; local versions win.
+    """
+    if _local_store is None and not os.path.exists(Config.LOCAL_STORE_PATH):
+        return
+    
+    store = _get_local_store()
+    changes = store.changes()
+    if changes:
+        MongoOverlayRepository(db).apply_changes(changes)
+        logger.info(f"Replayed {len(changes)} overlay changes made while MongoDB was unavailable")
+    store.clear()
+
+
+def _start_reconnect():
+    """Start retrying MongoDB in the background, if not already."""
+    global _reconnect_thread
+    
+    with _store_lock:
+        if _reconnect_thread is None:
+            _reconnect_thread = threading.Thread(target=_reconnect_loop, daemon=True)
+            _reconnect_thread.start()
+
+
+def _reconnect_loop():
+    """Retry MongoDB until it is reachable and the local changes are replayed."""
+    global _reconnect_thread
+    
+    while True:
+        time.sleep(Config.LOCAL_STORE_RETRY_SECONDS)
+        connected, _ = _restore_db()
+        if connected:
+            break
+    
+    with _store_lock:
+        _reconnect_thread = None
+    logger.info("✅ Reconnected to MongoDB")
+    # MongoDB may hold changes made by other processes during the outage
+    overlay_events.publish('reset', {})
+
+
+def _fail_over(error):
+    """
+    Switch to the local store after a MongoDB operation could not reach
+    the server. If the read cache is loaded, its overlays are copied into the
+    store so they stay readable and editable. Otherwise the store has no
+    full copy, and operations other than creates fail until MongoDB is back
+    rather than showing an empty or partial list.
+    """
+    global _db
+    
+    with _store_lock:
+        if _db is None:
+            return
+        logger.error(f"❌ Lost connection to MongoDB, storing overlays locally: {str(error)}")
+        _db = None
+        with _cache_lock:
+            cached = list(_cache_overlays.values()) if _cache_overlays is not None else None
+        if cached is not None:
+            _get_local_store().seed(cached)
+        else:
+            logger.warning("Overlays were not loaded before MongoDB went down; reads fail until it is back")
+        _start_reconnect()
+
+
+def _run(operation, needs_all=True):
+    """
+    Run a storage operation against the configured repository. With MongoDB,
+    the local store is used while it is unavailable, and an operation that
+    cannot reach the server fails over and runs again.
+    
+    Args:
+        operation (callable): Called with an OverlayRepository
+        needs_all (bool): The operation reads or changes existing overlays,
+            so the local store must hold all of them
+        
+    Returns:
+        The operation's result
+        
+    Raises:
+        OverlayStoreUnavailableError: If MongoDB is down and the local store
+            is not a full copy
+    """
+    if Config.OVERLAY_STORE != 'mongodb':
+        return operation(_get_repository())
+    
+    with _store_lock:
+        db = get_db_connection()
+        if db is None:
+            store = _get_local_store()
+            if needs_all and not store.seeded:
+                raise OverlayStoreUnavailableError("Overlay database is unavailable, try again later")
+            return operation(store)
+    
+    try:
+        return operation(MongoOverlayRepository(db))
+    except WaitQueueTimeoutError:
+        # The pool is busy, not down
+        raise
+    except ConnectionFailure as e:
+        _fail_over(e)
+        return _run(operation, needs_all)
 
 
 def get_db_connection():
@@ -111,12 +380,58 @@ def get_db_connection():
     return _db
 
 
+def get_overlays_etag():
+    """
+    Return an ETag for the current overlay list. It changes on every write,
+    so clients can revalidate with If-None-Match instead of refetching.
+    
+    Returns:
+        str: Opaque ETag value
+    """
+    with _cache_lock:
+        return f"{_cache_epoch}-{_cache_version}"
+
+
+def _cache_store(overlay):
+    """Write a created or updated overlay through to the read cache."""
+    global _cache_list, _cache_version
+    
+    with _cache_lock:
+        if _cache_overlays is not None:
+            _cache_overlays[overlay['id']] = overlay
+        _cache_list = None
+        _cache_version += 1
+
+
+def _reset_cache():
+    """Drop the read cache so the next read reloads every overlay."""
+    global _cache_overlays, _cache_list, _cache_version
+    
+    with _cache_lock:
+        _cache_overlays = None
+        _cache_list = None
+        _cache_version += 1
+
+
+def _cache_remove(overlay_id):
+    """Drop a deleted overlay from the read cache."""
+    global _cache_list, _cache_version
+    
+    with _cache_lock:
+        if _cache_overlays is not None:
+            _cache_overlays.pop(overlay_id, None)
+        _cache_list = None
+        _cache_version += 1
+
+
 def create_overlay(data):
     """
     Create a new overlay in the database.
     
     Args:
-        data (dict): Overlay data containing type, content, position, size
+        data (dict): Overlay data containing type, content, position, size,
+            and optionally the streamId it belongs to (shown on every stream
+            when omitted)
         
     Returns:
         dict: Created overlay document with string ID
@@ -134,6 +449,11 @@ def create_overlay(data):
     if not data.get('content'):
         raise ValueError("Overlay content is required")
     
+    if data.get('streamId') is not None and not isinstance(data['streamId'], str):
+        raise ValueError("streamId must be a string")
+    
+    _validate_overlay_fields(data)
+    
     # Set defaults
     overlay_doc = {
         'type': data['type'],
@@ -143,24 +463,17 @@ def create_overlay(data):
         'positionPercent': data.get('positionPercent'),  # Store percentage-based position
         'sizePercent': data.get('sizePercent'),  # Store percentage-based size
         'opacity': data.get('opacity', 1.0),  # Default to fully opaque (1.0)
+        'streamId': data.get('streamId'),  # None for overlays shared by all streams
         'createdAt': datetime.utcnow(),
         'updatedAt': datetime.utcnow()
     }
     
-    db = get_db_connection()
-    if db is None:
-        # Store in memory when DB is unavailable
-        overlay_id = 'temp_' + str(datetime.utcnow().timestamp())
-        overlay_doc['id'] = overlay_id
-        _temp_overlays[overlay_id] = overlay_doc
-        logger.warning("MongoDB unavailable - overlay stored in memory")
-        return overlay_doc
-    
-    result = db.overlays.insert_one(overlay_doc)
-    
-    # Convert ObjectId to string for JSON serialization
-    overlay_doc['id'] = str(result.inserted_id)
-    del overlay_doc['_id']
+    # Assigned here so an overlay created locally keeps its ID in MongoDB
+    overlay_doc['id'] = str(ObjectId())
+    # New IDs cannot clash, so creates work even without a full local copy
+    _run(lambda repository: repository.insert(overlay_doc), needs_all=False)
+    _cache_store(overlay_doc)
+    overlay_events.publish('created', {'overlay': overlay_doc})
     
     logger.info(f"Created overlay: {overlay_doc['id']}")
     return overlay_doc
@@ -168,25 +481,34 @@ def create_overlay(data):
 
 def get_all_overlays():
     """
-    Retrieve all overlays from the database.
+    Retrieve all overlays. They are read from the repository once and then
+    served from the write-through cache.
     
     Returns:
-        list: List of overlay documents with string IDs
+        list: List of overlay documents with string IDs. The list is shared
+            between callers until the next write and must not be modified
+        
+    Raises:
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
     """
-    db = get_db_connection()
-    if db is None:
-        # Return in-memory overlays
-        return list(_temp_overlays.values())
-    
-    overlays = list(db.overlays.find())
-    
-    # Convert ObjectId to string
-    for overlay in overlays:
-        overlay['id'] = str(overlay['_id'])
-        del overlay['_id']
-    
-    logger.info(f"Retrieved {len(overlays)} overlays")
-    return overlays
+    global _cache_overlays, _cache_list
+    
+    while True:
+        with _cache_lock:
+            if _cache_overlays is not None:
+                if _cache_list is None:
+                    _cache_list = list(_cache_overlays.values())
+                return _cache_list
+            version = _cache_version
+        
+        # Loaded without holding the cache lock, which failing over takes
+        overlays = _run(lambda repository: repository.all())
+        
+        with _cache_lock:
+            # A write during the load makes it stale; load again
+            if _cache_overlays is None and _cache_version == version:
+                _cache_overlays = {overlay['id']: overlay for overlay in overlays}
+                logger.info(f"Loaded {len(overlays)} overlays into cache")
 
 
 def get_overlay_by_id(overlay_id):
@@ -202,31 +524,188 @@ def get_overlay_by_id(overlay_id):
     Raises:
         ValueError: If ID format is invalid
         LookupError: If overlay not found
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
     """
     try:
         object_id = ObjectId(overlay_id)
     except Exception:
-        # Check if it's a temp ID in memory
-        if overlay_id.startswith('temp_') and overlay_id in _temp_overlays:
-            return _temp_overlays[overlay_id]
         raise ValueError(f"Invalid overlay ID format: {overlay_id}")
     
-    db = get_db_connection()
-    if db is None:
-        raise LookupError("MongoDB unavailable")
+    with _cache_lock:
+        if _cache_overlays is not None:
+            if str(object_id) not in _cache_overlays:
+                raise LookupError(f"Overlay not found: {overlay_id}")
+            return _cache_overlays[str(object_id)]
     
-    overlay = db.overlays.find_one({'_id': object_id})
+    overlay = _run(lambda repository: repository.get(str(object_id)))
     
     if not overlay:
         raise LookupError(f"Overlay not found: {overlay_id}")
     
-    # Convert ObjectId to string
-    overlay['id'] = str(overlay['_id'])
-    del overlay['_id']
-    
     return overlay
 
 
+def get_stream_overlays(stream_id, after=None, limit=None, fields=None):
+    """
+    Retrieve one page of the overlays shown on a stream: its own overlays
+    plus those shared by all streams, in creation order. Queries the store
+    directly through its per-stream index rather than the full-list cache.
+    
+    Args:
+        stream_id (str): Stream ID
+        after (str): ID of the last overlay of the previous page (optional)
+        limit (int): Page size (defaults to Config.OVERLAY_PAGE_SIZE)
+        fields (list): Fields to return besides 'id' (optional, all by default)
+        
+    Returns:
+        tuple: (overlays, ID to pass as after for the next page or None)
+        
+    Raises:
+        ValueError: If after, limit or fields are invalid
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
+    """
+    if limit is None:
+        limit = Config.OVERLAY_PAGE_SIZE
+    if not 1 <= limit <= Config.OVERLAY_PAGE_MAX_SIZE:
+        raise ValueError(f"limit must be between 1 and {Config.OVERLAY_PAGE_MAX_SIZE}")
+    
+    if after is not None:
+        if not ObjectId.is_valid(after):
+            raise ValueError(f"Invalid overlay ID format: {after}")
+        after = str(ObjectId(after))
+    
+    unknown = [field for field in fields or [] if field not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    overlays = _run(lambda repository: repository.list_for_stream(stream_id, after, limit, fields))
+    next_after = overlays[-1]['id'] if len(overlays) == limit else None
+    return overlays, next_after
+
+
+def _is_number(value):
+    """Return True for finite ints and floats, but not bools."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _validate_overlay_fields(data):
+    """
+    Check the overlay fields present in data. The burn-in renderer draws
+    stored overlays as they are, so malformed values are rejected here.
+    
+    Raises:
+        ValueError: If content, opacity or the percentage geometry is invalid
+    """
+    if 'content' in data and (not isinstance(data['content'], str) or not data['content']):
+        raise ValueError("Overlay content must be a non-empty string")
+    
+    if 'opacity' in data and not (_is_number(data['opacity']) and 0 <= data['opacity'] <= 1):
+        raise ValueError("opacity must be a number between 0 and 1")
+    
+    for field, keys in PERCENT_FIELDS.items():
+        value = data.get(field)
+        # None keeps the frontend's default geometry
+        if value is None:
+            continue
+        if not isinstance(value, dict) or not all(_is_number(value.get(key)) for key in keys):
+            raise ValueError(f"{field} must be an object with numeric {' and '.join(keys)}")
+
+
+def _build_update_doc(data):
+    """
+    Build a $set document from the updatable fields present in data.
+    
+    Raises:
+        ValueError: If a field is invalid
+    """
+    _validate_overlay_fields(data)
+    update_doc = {'updatedAt': datetime.utcnow()}
+    for field in UPDATABLE_FIELDS:
+        if field in data:
+            update_doc[field] = data[field]
+    return update_doc
+
+
+def _apply_updates(updates):
+    """
+    Write updates in one batch and publish the updated overlays.
+    
+    Args:
+        updates (dict): {overlay_id: $set document}
+        
+    Returns:
+        dict: {overlay_id: updated overlay}; overlays that do not exist are omitted
+    """
+    results = _run(lambda repository: repository.update_many(updates))
+    
+    for overlay in results.values():
+        _cache_store(overlay)
+        overlay_events.publish('updated', {'overlay': overlay})
+    
+    logger.info(f"Updated {len(results)} of {len(updates)} overlays in one batch")
+    return results
+
+
+class _PendingUpdates:
+    """Updates collected during one coalescing window, written together."""
+    
+    def __init__(self):
+        self.updates = {}
+        self.results = {}
+        self.error = None
+        self.done = threading.Event()
+
+
+def _flush_pending_updates():
+    """Write the current coalescing window's updates in one batch."""
+    global _pending_updates
+    
+    with _pending_lock:
+        batch, _pending_updates = _pending_updates, None
+    
+    try:
+        batch.results = _apply_updates(batch.updates)
+    except Exception as e:
+        batch.error = e
+    finally:
+        batch.done.set()
+
+
+def _submit_updates(updates):
+    """
+    Write updates, coalescing them with other updates made within
+    Config.OVERLAY_UPDATE_COALESCE_MS. Updates to the same overlay in one
+    window are merged (later fields win) into a single write.
+    
+    Only MongoDB writes are coalesced; the other stores write directly.
+    
+    Args:
+        updates (dict): {overlay_id: $set document}
+        
+    Returns:
+        dict: {overlay_id: updated overlay}; overlays that do not exist are omitted
+    """
+    global _pending_updates
+    
+    if Config.OVERLAY_UPDATE_COALESCE_MS <= 0 or Config.OVERLAY_STORE != 'mongodb':
+        return _apply_updates(updates)
+    
+    with _pending_lock:
+        batch = _pending_updates
+        if batch is None:
+            batch = _pending_updates = _PendingUpdates()
+            timer = threading.Timer(Config.OVERLAY_UPDATE_COALESCE_MS / 1000, _flush_pending_updates)
+            timer.daemon = True
+            timer.start()
+        for overlay_id, update_doc in updates.items():
+            batch.updates.setdefault(overlay_id, {}).update(update_doc)
+    
+    batch.done.wait()
+    if batch.error:
+        raise batch.error
+    return {overlay_id: batch.results[overlay_id] for overlay_id in updates if overlay_id in batch.results}
+
+
 def update_overlay(overlay_id, data):
     """
     Update an existing overlay.
@@ -239,71 +718,58 @@ def update_overlay(overlay_id, data):
         dict: Updated overlay document with string ID
         
     Raises:
-        ValueError: If ID format is invalid
+        ValueError: If ID format or a field is invalid
         LookupError: If overlay not found
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
     """
     try:
         object_id = ObjectId(overlay_id)
     except Exception:
-        # Handle temp IDs
-        if overlay_id.startswith('temp_') and overlay_id in _temp_overlays:
-            # Update in-memory overlay
-            update_doc = {'updatedAt': datetime.utcnow()}
-            if 'position' in data:
-                update_doc['position'] = data['position']
-            if 'size' in data:
-                update_doc['size'] = data['size']
-            if 'content' in data:
-                update_doc['content'] = data['content']
-            if 'opacity' in data:
-                update_doc['opacity'] = data['opacity']
-            if 'positionPercent' in data:
-                update_doc['positionPercent'] = data['positionPercent']
-            if 'sizePercent' in data:
-                update_doc['sizePercent'] = data['sizePercent']
-            
-            _temp_overlays[overlay_id].update(update_doc)
-            logger.info(f"Updated in-memory overlay: {overlay_id}")
-            return _temp_overlays[overlay_id]
         raise ValueError(f"Invalid overlay ID format: {overlay_id}")
     
-    # Build update document
-    update_doc = {'updatedAt': datetime.utcnow()}
-    
-    if 'position' in data:
-        update_doc['position'] = data['position']
-    
-    if 'size' in data:
-        update_doc['size'] = data['size']
-    
-    if 'content' in data:
-        update_doc['content'] = data['content']
-    
-    if 'opacity' in data:
-        update_doc['opacity'] = data['opacity']
+    results = _submit_updates({str(object_id): _build_update_doc(data)})
     
-    if 'positionPercent' in data:
-        update_doc['positionPercent'] = data['positionPercent']
-    
-    if 'sizePercent' in data:
-        update_doc['sizePercent'] = data['sizePercent']
-    
-    db = get_db_connection()
-    if db is None:
-        raise LookupError("MongoDB unavailable")
-    
-    result = db.overlays.update_one(
-        {'_id': object_id},
-        {'$set': update_doc}
-    )
-    
-    if result.matched_count == 0:
+    if str(object_id) not in results:
         raise LookupError(f"Overlay not found: {overlay_id}")
     
-    logger.info(f"Updated overlay: {overlay_id}")
+    return results[str(object_id)]
+
+
+def update_overlays(updates):
+    """
+    Apply partial updates to several overlays in one batch.
     
-    # Return updated document
-    return get_overlay_by_id(overlay_id)
+    Args:
+        updates (list): Dicts with an 'id' plus the fields to update. Several
+            updates to the same overlay are merged in order
+        
+    Returns:
+        tuple: (updated overlays in request order, IDs that were not found)
+        
+    Raises:
+        ValueError: If the list or any ID is invalid; nothing is written
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
+    """
+    if not isinstance(updates, list) or not updates:
+        raise ValueError("Updates must be a non-empty list")
+    
+    if len(updates) > Config.OVERLAY_BULK_MAX_UPDATES:
+        raise ValueError(f"At most {Config.OVERLAY_BULK_MAX_UPDATES} updates per request")
+    
+    # Validate everything before writing anything
+    merged = {}
+    for data in updates:
+        if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+            raise ValueError("Each update must be an object with an 'id'")
+        if not ObjectId.is_valid(data['id']):
+            raise ValueError(f"Invalid overlay ID format: {data['id']}")
+        overlay_id = str(ObjectId(data['id']))
+        merged.setdefault(overlay_id, {}).update(_build_update_doc(data))
+    
+    overlays = _submit_updates(merged)
+    
+    not_found = [overlay_id for overlay_id in merged if overlay_id not in overlays]
+    return [overlays[overlay_id] for overlay_id in merged if overlay_id in overlays], not_found
 
 
 def delete_overlay(overlay_id):
@@ -316,24 +782,18 @@ def delete_overlay(overlay_id):
     Raises:
         ValueError: If ID format is invalid
         LookupError: If overlay not found
+        OverlayStoreUnavailableError: If MongoDB is down and the overlays were never loaded
     """
     try:
         object_id = ObjectId(overlay_id)
     except Exception:
-        # Handle temp IDs
-        if overlay_id.startswith('temp_') and overlay_id in _temp_overlays:
-            del _temp_overlays[overlay_id]
-            logger.info(f"Deleted in-memory overlay: {overlay_id}")
-            return
         raise ValueError(f"Invalid overlay ID format: {overlay_id}")
     
-    db = get_db_connection()
-    if db is None:
-        raise LookupError("MongoDB unavailable")
-    
-    result = db.overlays.delete_one({'_id': object_id})
+    deleted = _run(lambda repository: repository.delete(str(object_id)))
     
-    if result.deleted_count == 0:
+    if not deleted:
         raise LookupError(f"Overlay not found: {overlay_id}")
     
+    _cache_remove(str(object_id))
+    overlay_events.publish('deleted', {'id': str(object_id)})
     logger.info(f"Deleted overlay: {overlay_id}")
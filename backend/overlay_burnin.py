@@ -0,0 +1,250 @@
+"""
+Server-side overlay burn-in.
+All overlays are composited into one transparent PNG per stream, which
+FFmpeg reads as a looping image input and blends over the video. The layer
+is re-rendered whenever overlays change, so edits show up in the HLS output
+without restarting FFmpeg.
+"""
+import logging
+import os
+import threading
+import time
+from PIL import Image, ImageDraw, ImageFont
+from config import Config
+from models import get_all_overlays
+from overlay_events import OverlayEvent, overlay_events
+from overlay_rasters import overlay_rasters
+
+logger = logging.getLogger(__name__)
+
+LAYER_FILENAME = 'overlays.png'
+
+# Layer size when the source resolution could not be probed;
+# FFmpeg scales the layer to the video either way
+DEFAULT_LAYER_SIZE = (1280, 720)
+
+# Frontend defaults for overlays saved without percentage geometry
+DEFAULT_POSITION_PERCENT = {'x': 10, 'y': 10}
+DEFAULT_SIZE_PERCENT = {'width': 20, 'height': 15}
+
+# Matches the frontend's semi-transparent text background
+TEXT_BACKGROUND = (0, 0, 0, 90)
+
+MAX_RENDER_DELAY_SECONDS = 1.0
+
+
+def overlay_box(overlay, width, height):
+    """
+    Return an overlay's pixel box within a frame, from its percentage geometry.
+
+    Returns:
+        tuple: (left, top, box_width, box_height)
+    """
+    position = overlay.get('positionPercent') or DEFAULT_POSITION_PERCENT
+    size = overlay.get('sizePercent') or DEFAULT_SIZE_PERCENT
+    return (
+        round(position['x'] * width / 100),
+        round(position['y'] * height / 100),
+        max(round(size['width'] * width / 100), 1),
+        max(round(size['height'] * height / 100), 1)
+    )
+
+
+def _load_font(size):
+    """Load the configured TrueType font, or Pillow's bundled font."""
+    if Config.OVERLAY_FONT_PATH:
+        return ImageFont.truetype(Config.OVERLAY_FONT_PATH, size)
+    return ImageFont.load_default(size=size)
+
+
+def _wrap_text(draw, text, font, max_width):
+    """Greedily wrap text into lines no wider than max_width."""
+    lines = []
+    for paragraph in text.splitlines() or ['']:
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = f'{line} {word}' if line else word
+            if line and draw.textlength(candidate, font=font) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def _draw_text(layer, overlay, box):
+    """Draw a text overlay: centered white text on a translucent rounded box."""
+    _, _, box_width, box_height = box
+    tile = Image.new('RGBA', (box_width, box_height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    draw.rounded_rectangle(
+        (0, 0, box_width - 1, box_height - 1),
+        radius=max(min(box_width, box_height) // 12, 1),
+        fill=TEXT_BACKGROUND
+    )
+
+    # Start from the frontend's relative size and shrink until the text fits
+    padding = max(box_height // 10, 2)
+    font_size = max(round(layer.width * 0.03), 10)
+    while True:
+        font = _load_font(font_size)
+        lines = _wrap_text(draw, overlay['content'], font, box_width - 2 * padding)
+        text = '\n'.join(lines)
+        bbox = draw.multiline_textbbox((0, 0), text, font=font, align='center')
+        fits = bbox[2] - bbox[0] <= box_width - 2 * padding and bbox[3] - bbox[1] <= box_height - 2 * padding
+        if fits or font_size <= 8:
+            break
+        font_size -= 2
+
+    origin = ((box_width - (bbox[2] - bbox[0])) / 2 - bbox[0], (box_height - (bbox[3] - bbox[1])) / 2 - bbox[1])
+    draw.multiline_text(
+        origin, text, font=font, fill=(255, 255, 255, 255), align='center',
+        stroke_width=max(font_size // 16, 1), stroke_fill=(0, 0, 0, 200)
+    )
+    return tile
+
+
+def _render_tile(layer, overlay, width, height):
+    """
+    Draw one overlay with its opacity applied.
+
+    Returns:
+        tuple: (RGBA tile or None for unknown types, pixel box)
+    """
+    box = overlay_box(overlay, width, height)
+    if overlay.get('type') == 'text':
+        tile = _draw_text(layer, overlay, box)
+    elif overlay.get('type') == 'image':
+        tile = overlay_rasters.get_raster(overlay['content'], box[2], box[3]).image
+    else:
+        return None, box
+
+    opacity = overlay.get('opacity', 1.0)
+    if opacity < 1:
+        alpha = tile.getchannel('A').point(lambda value: round(value * opacity))
+        tile.putalpha(alpha)
+    return tile, box
+
+
+def render_layer(overlays, width, height):
+    """
+    Composite overlays into a transparent layer the size of the video.
+    Image overlays that cannot be loaded and malformed overlays are skipped.
+
+    Args:
+        overlays (list): Overlay documents, drawn in order
+        width (int): Layer width in pixels
+        height (int): Layer height in pixels
+
+    Returns:
+        Image: RGBA layer
+    """
+    layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+
+    for overlay in overlays:
+        # One malformed overlay must not blank the others or stop the render thread
+        try:
+            tile, box = _render_tile(layer, overlay, width, height)
+            if tile is not None:
+                layer.alpha_composite(tile, (box[0], box[1]))
+        except Exception as e:
+            logger.warning(f"Skipping overlay {overlay.get('id')}: {str(e)}")
+
+    return layer
+
+
+def _write_layer(path, layer):
+    """Save a layer PNG. FFmpeg re-reads the file for every frame, so replace it atomically."""
+    temp_path = path + '.tmp'
+    try:
+        layer.save(temp_path, format='PNG')
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Could not write overlay layer {path}: {str(e)}")
+
+
+class BurnInRenderer:
+    """
+    Keeps the overlay layer of every burn-in stream up to date.
+    A single background thread listens for overlay events and re-renders all
+    layers, waiting for a short quiet period so a burst of updates renders
+    once, but at least every MAX_RENDER_DELAY_SECONDS during a long burst.
+    """
+
+    def __init__(self, debounce_seconds):
+        self.debounce_seconds = debounce_seconds
+        self._layers = {}
+        self._lock = threading.Lock()
+        self._render_lock = threading.Lock()
+        self._subscription = None
+
+    def register(self, key, path, width=None, height=None):
+        """
+        Write a blank layer for a stream and keep it updated until unregistered.
+        Overlays are drawn by the background thread shortly after, so callers
+        holding locks never wait on the overlay store or image fetches.
+
+        Args:
+            key (str): Stream ID
+            path (str): PNG path FFmpeg reads the layer from
+            width (int): Video width, if known
+            height (int): Video height, if known
+        """
+        size = (width, height) if width and height else DEFAULT_LAYER_SIZE
+        # FFmpeg cannot start without the layer, even if overlays fail to load.
+        # The stream is not registered yet, so no render writes this path now
+        _write_layer(path, Image.new('RGBA', size, (0, 0, 0, 0)))
+
+        with self._lock:
+            self._layers[key] = (path, size)
+            if self._subscription is None:
+                self._subscription = overlay_events.subscribe()
+                threading.Thread(target=self._run, args=(self._subscription,), daemon=True).start()
+        # Wake the render thread as an overlay change would
+        self._subscription.put(OverlayEvent(None, 'render', {}))
+
+    def unregister(self, key):
+        """Stop updating a stream's layer."""
+        with self._lock:
+            self._layers.pop(key, None)
+
+    def render_all(self):
+        """Render each registered layer with its stream's overlays and the shared ones."""
+        with self._lock:
+            layers = list(self._layers.items())
+        if not layers:
+            return
+
+        try:
+            overlays = get_all_overlays()
+        except Exception as e:
+            logger.error(f"Could not load overlays for burn-in: {str(e)}")
+            return
+
+        with self._render_lock:
+            for key, (path, (width, height)) in layers:
+                stream_overlays = [overlay for overlay in overlays if overlay.get('streamId') in (key, None)]
+                _write_layer(path, render_layer(stream_overlays, width, height))
+
+    def _run(self, subscription):
+        """Re-render layers after overlay changes and new registrations."""
+        while True:
+            if subscription.get(timeout=None) is None:
+                continue
+            # Let a burst of updates settle before rendering
+            deadline = time.monotonic() + MAX_RENDER_DELAY_SECONDS
+            while time.monotonic() < deadline:
+                if subscription.get(timeout=self.debounce_seconds) is None:
+                    break
+            started = time.monotonic()
+            try:
+                self.render_all()
+            except Exception as e:
+                # Keep the thread alive; the next overlay change renders again
+                logger.error(f"Overlay burn-in render failed: {str(e)}")
+                continue
+            logger.debug(f"Rendered overlay layers in {time.monotonic() - started:.3f}s")
+
+
+burn_in_renderer = BurnInRenderer(Config.BURN_IN_DEBOUNCE_SECONDS)
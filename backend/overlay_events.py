@@ -0,0 +1,115 @@
+"""
+Overlay change notifications for Server-Sent Events (SSE) clients.
+models.py publishes a delta for every overlay create, update and delete;
+each connected viewer has a bounded queue the /api/overlays/events route
+drains.
+"""
+import collections
+import itertools
+import queue
+import threading
+from config import Config
+
+# Recent events kept so a reconnecting client can resume from Last-Event-ID
+REPLAY_BUFFER_SIZE = 256
+
+OverlayEvent = collections.namedtuple('OverlayEvent', ['id', 'type', 'data'])
+
+
+class Subscription:
+    """One connected client's pending events."""
+
+    def __init__(self, max_pending):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def put(self, event):
+        """Queue an event; a client that falls too far behind is told to resync instead."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """
+        Wait for the next event.
+
+        Returns:
+            OverlayEvent: The next event, a 'reset' event after an overflow,
+                or None if nothing arrived before the timeout
+        """
+        if self.overflowed:
+            self.overflowed = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return OverlayEvent(None, 'reset', {})
+
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class OverlayEventBroker:
+    """Fan-out of overlay events to every subscribed client."""
+
+    def __init__(self, max_pending):
+        self.max_pending = max_pending
+        self._subscriptions = set()
+        self._recent = collections.deque(maxlen=REPLAY_BUFFER_SIZE)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a client.
+
+        Args:
+            last_event_id (int): ID of the last event the client received
+                before reconnecting (optional)
+
+        Returns:
+            Subscription: Queue of events for this client. Missed events are
+                replayed, or a 'reset' is queued if they are no longer buffered
+        """
+        subscription = Subscription(self.max_pending)
+        with self._lock:
+            if last_event_id is not None:
+                oldest = self._recent[0].id if self._recent else None
+                latest = self._recent[-1].id if self._recent else 0
+                # Too old to replay, or from before a backend restart
+                if (oldest is not None and last_event_id < oldest - 1) or last_event_id > latest:
+                    subscription.overflowed = True
+                else:
+                    for event in self._recent:
+                        if event.id > last_event_id:
+                            subscription.put(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a disconnected client."""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type, data):
+        """
+        Send an event to every subscribed client.
+
+        Args:
+            event_type (str): 'created', 'updated' or 'deleted'
+            data (dict): Event payload
+        """
+        with self._lock:
+            event = OverlayEvent(next(self._ids), event_type, data)
+            self._recent.append(event)
+            for subscription in self._subscriptions:
+                subscription.put(event)
+
+    def subscriber_count(self):
+        """Return the number of connected clients."""
+        with self._lock:
+            return len(self._subscriptions)
+
+
+overlay_events = OverlayEventBroker(Config.OVERLAY_EVENTS_MAX_PENDING)
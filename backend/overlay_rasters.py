@@ -0,0 +1,262 @@
+"""
+Cache of decoded and pre-scaled image overlay sources.
+Each image URL is downloaded and decoded once; scaled rasters are keyed by
+the source's content hash and target box, so overlays sharing an image
+share rasters. Used by overlay burn-in and served to browsers so they
+download an image already scaled to the size it is shown at.
+"""
+import collections
+import hashlib
+import io
+import logging
+import threading
+import time
+import urllib.request
+from PIL import Image
+from config import Config
+from url_guard import check_url, parse_allowed_hosts
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# A small file can declare a huge canvas; refuse to decode beyond 8K UHD
+MAX_IMAGE_PIXELS = 7680 * 4320
+
+# Box sizes are rounded up to this many pixels so near-identical sizes share a raster
+SIZE_STEP = 8
+
+MAX_RASTER_DIMENSION = 7680
+
+# A URL that failed to load is not retried for this long, so a broken
+# image cannot stall every burn-in render on the fetch timeout
+FAILED_FETCH_RETRY_SECONDS = 30
+
+# Failed URLs remembered at once; the oldest are forgotten first
+MAX_FAILED_FETCHES = 1000
+
+SourceImage = collections.namedtuple('SourceImage', ['content_hash', 'image', 'fetched_at'])
+Raster = collections.namedtuple('Raster', ['image', 'png', 'etag'])
+
+ALLOWED_HOSTS = parse_allowed_hosts(Config.OVERLAY_IMAGE_ALLOWED_HOSTS)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Apply the same host check to every redirect target."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl, ALLOWED_HOSTS)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+
+def fetch_image(url):
+    """
+    Download an image overlay source.
+
+    Args:
+        url (str): http(s) image URL
+
+    Returns:
+        bytes: Encoded image data
+
+    Raises:
+        ValueError: If the URL is not http(s), its host is not public or
+            allowlisted, or the image is too large
+        OSError: If the download fails
+    """
+    check_url(url, ALLOWED_HOSTS)
+
+    with _opener.open(url, timeout=Config.OVERLAY_IMAGE_FETCH_TIMEOUT_SECONDS) as response:
+        data = response.read(MAX_IMAGE_BYTES + 1)
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes: {url}")
+    return data
+
+
+def box_for(size_percent, width, height):
+    """
+    Return the pixel box an overlay occupies in a frame of the given size,
+    rounded up to SIZE_STEP.
+
+    Args:
+        size_percent (dict): Overlay sizePercent ({width, height} in percent)
+        width (int): Frame width in pixels
+        height (int): Frame height in pixels
+
+    Returns:
+        tuple: (box_width, box_height)
+    """
+    def step(value):
+        return max(-(-round(value) // SIZE_STEP) * SIZE_STEP, SIZE_STEP)
+
+    return step(size_percent['width'] * width / 100), step(size_percent['height'] * height / 100)
+
+
+class OverlayRasterCache:
+    """
+    Thread-safe LRU of decoded sources and scaled rasters, bounded by the
+    memory their pixels and encoded PNGs take.
+    """
+
+    def __init__(self, max_bytes, source_ttl_seconds):
+        self.max_bytes = max_bytes
+        self.source_ttl_seconds = source_ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._sources = collections.OrderedDict()
+        self._rasters = collections.OrderedDict()
+        # URL -> (failed at, error), oldest first
+        self._failures = collections.OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_source(self, url):
+        """
+        Return a decoded source image, downloading it only if it is not
+        cached or older than the source TTL.
+
+        Raises:
+            ValueError: If the URL is unsupported or the image is invalid
+            OSError: If the download fails
+        """
+        with self._lock:
+            source = self._sources.get(url)
+            if source and time.monotonic() - source.fetched_at < self.source_ttl_seconds:
+                self._sources.move_to_end(url)
+                return source
+            failure = self._failures.get(url)
+            if failure and time.monotonic() - failure[0] < FAILED_FETCH_RETRY_SECONDS:
+                raise failure[1]
+
+        try:
+            data = fetch_image(url)
+            try:
+                image = Image.open(io.BytesIO(data))
+            except Exception as e:
+                raise ValueError(f"Invalid image {url}: {str(e)}")
+            # open() only reads the header; check its size before decoding
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ValueError(f"Image larger than {MAX_IMAGE_PIXELS} pixels: {url}")
+            try:
+                image.load()
+            except Exception as e:
+                raise ValueError(f"Invalid image {url}: {str(e)}")
+        except (ValueError, OSError) as e:
+            with self._lock:
+                self._record_failure(url, e)
+            raise
+
+        source = SourceImage(
+            hashlib.blake2b(data, digest_size=16).hexdigest(),
+            image.convert('RGBA'),
+            time.monotonic()
+        )
+        with self._lock:
+            self._failures.pop(url, None)
+            previous = self._sources.pop(url, None)
+            if previous:
+                self._total_bytes -= _image_bytes(previous.image)
+            self._sources[url] = source
+            self._total_bytes += _image_bytes(source.image)
+            self._evict()
+        return source
+
+    def get_raster(self, url, box_width, box_height):
+        """
+        Return an image source scaled to fit a box, preserving aspect ratio
+        and centered on a transparent background of exactly the box size.
+
+        Args:
+            url (str): Image URL
+            box_width (int): Box width in pixels
+            box_height (int): Box height in pixels
+
+        Returns:
+            Raster: Scaled image, its PNG encoding and a strong ETag
+
+        Raises:
+            ValueError: If the URL or box is invalid
+            OSError: If the download fails
+        """
+        if not (0 < box_width <= MAX_RASTER_DIMENSION and 0 < box_height <= MAX_RASTER_DIMENSION):
+            raise ValueError(f"Raster size must be between 1 and {MAX_RASTER_DIMENSION} pixels")
+
+        source = self.get_source(url)
+        key = (source.content_hash, box_width, box_height)
+
+        with self._lock:
+            raster = self._rasters.get(key)
+            if raster:
+                self._rasters.move_to_end(key)
+                self.hits += 1
+                return raster
+            self.misses += 1
+
+        image = source.image
+        scale = min(box_width / image.width, box_height / image.height)
+        scaled = image.resize(
+            (max(round(image.width * scale), 1), max(round(image.height * scale), 1)),
+            Image.LANCZOS
+        )
+        tile = Image.new('RGBA', (box_width, box_height), (0, 0, 0, 0))
+        tile.paste(scaled, ((box_width - scaled.width) // 2, (box_height - scaled.height) // 2))
+
+        encoded = io.BytesIO()
+        tile.save(encoded, format='PNG')
+        raster = Raster(tile, encoded.getvalue(), f'{source.content_hash}-{box_width}x{box_height}')
+
+        with self._lock:
+            if key not in self._rasters:
+                self._rasters[key] = raster
+                self._total_bytes += _raster_bytes(raster)
+                self._evict()
+        return raster
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            return {
+                'sources': len(self._sources),
+                'rasters': len(self._rasters),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _record_failure(self, url, error):
+        """Remember a failed fetch and forget expired or excess ones. Caller holds the lock."""
+        now = time.monotonic()
+        self._failures.pop(url, None)
+        self._failures[url] = (now, error)
+        while self._failures:
+            failed_at, _ = next(iter(self._failures.values()))
+            if now - failed_at < FAILED_FETCH_RETRY_SECONDS and len(self._failures) <= MAX_FAILED_FETCHES:
+                break
+            self._failures.popitem(last=False)
+
+    def _evict(self):
+        """Drop least recently used rasters, then sources, until under the cap. Caller holds the lock."""
+        while self._total_bytes > self.max_bytes and self._rasters:
+            _, raster = self._rasters.popitem(last=False)
+            self._total_bytes -= _raster_bytes(raster)
+        while self._total_bytes > self.max_bytes and len(self._sources) > 1:
+            _, source = self._sources.popitem(last=False)
+            self._total_bytes -= _image_bytes(source.image)
+
+
+def _image_bytes(image):
+    """Approximate memory used by an RGBA image's pixels."""
+    return image.width * image.height * 4
+
+
+def _raster_bytes(raster):
+    return _image_bytes(raster.image) + len(raster.png)
+
+
+overlay_rasters = OverlayRasterCache(
+    Config.OVERLAY_RASTER_CACHE_MAX_BYTES,
+    Config.OVERLAY_IMAGE_TTL_SECONDS
+)
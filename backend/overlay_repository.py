@@ -0,0 +1,412 @@
+"""
+Overlay storage backends.
+models.py holds the overlay logic (validation, caching, change events) and
+reads and writes through an OverlayRepository, selected with
+Config.OVERLAY_STORE:
+- mongodb: MongoOverlayRepository, falling back to a change-tracking
+  SqliteOverlayRepository while MongoDB is unavailable
+- sqlite: SqliteOverlayRepository, an embedded store in one file
+- memory: MemoryOverlayRepository, fastest but lost on restart
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne, ReturnDocument, UpdateOne, WriteConcern
+from config import Config
+
+# Updates limited to these fields use Config.MONGODB_GEOMETRY_WRITE_CONCERN
+GEOMETRY_FIELDS = frozenset(('position', 'size', 'opacity', 'positionPercent', 'sizePercent', 'updatedAt'))
+
+# Overlay fields stored by SQLite as ISO 8601 strings and restored as datetimes
+DATETIME_FIELDS = ('createdAt', 'updatedAt')
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS overlays (
+    id TEXT PRIMARY KEY,
+    document TEXT,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    stream_id TEXT
+);
+CREATE INDEX IF NOT EXISTS overlays_dirty ON overlays (dirty) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS store_state (
+    name TEXT PRIMARY KEY
+);
+"""
+
+# Created after the stream_id column is added to databases from older versions
+SQLITE_STREAM_INDEX = 'CREATE INDEX IF NOT EXISTS overlays_stream ON overlays (stream_id, id)'
+
+
+def write_concern_w(value):
+    """Parse a write concern config value: a node count or a tag such as 'majority'."""
+    return int(value) if value.isdigit() else value
+
+
+class OverlayRepository:
+    """
+    Storage interface for overlays. Overlays are dicts with a string 'id';
+    returned overlays are never modified afterwards, so callers may cache
+    and share them.
+    """
+
+    def all(self):
+        """Return every overlay, oldest first."""
+        raise NotImplementedError
+
+    def get(self, overlay_id):
+        """
+        Return one overlay.
+
+        Returns:
+            dict: The overlay, or None if it does not exist
+        """
+        raise NotImplementedError
+
+    def insert(self, overlay):
+        """Store a new overlay whose 'id' was assigned by the caller."""
+        raise NotImplementedError
+
+    def update_many(self, updates):
+        """
+        Apply $set-style updates.
+
+        Args:
+            updates (dict): {overlay_id: fields to set}
+
+        Returns:
+            dict: {overlay_id: updated overlay}; overlays that do not exist are omitted
+        """
+        raise NotImplementedError
+
+    def delete(self, overlay_id):
+        """
+        Delete an overlay.
+
+        Returns:
+            bool: False if the overlay did not exist
+        """
+        raise NotImplementedError
+
+    def list_for_stream(self, stream_id, after, limit, fields=None):
+        """
+        Return one page of a stream's overlays: those with its streamId plus
+        shared overlays without one, ordered by ID (creation order).
+
+        Args:
+            stream_id (str): Stream ID
+            after (str): Return overlays with IDs after this one (None for the first page)
+            limit (int): Maximum overlays to return
+            fields (list): Fields to return besides 'id' (None for all)
+
+        Returns:
+            list: Overlays
+        """
+        raise NotImplementedError
+
+
+class MongoOverlayRepository(OverlayRepository):
+    """Overlays in the MongoDB 'overlays' collection."""
+
+    def __init__(self, db):
+        self.collection = db.overlays
+
+    def all(self):
+        return [_document_to_overlay(document) for document in self.collection.find()]
+
+    def get(self, overlay_id):
+        document = self.collection.find_one({'_id': ObjectId(overlay_id)})
+        return _document_to_overlay(document) if document else None
+
+    def insert(self, overlay):
+        self.collection.insert_one(_overlay_to_document(overlay))
+
+    def update_many(self, updates):
+        """
+        A single update uses find_one_and_update; several use one unordered
+        bulk_write followed by one find for the updated documents.
+        """
+        collection = self._collection_for(updates)
+        if len(updates) == 1:
+            (overlay_id, update_doc), = updates.items()
+            # Returns the updated document in the same round trip
+            document = collection.find_one_and_update(
+                {'_id': ObjectId(overlay_id)},
+                {'$set': update_doc},
+                return_document=ReturnDocument.AFTER
+            )
+            documents = [document] if document else []
+        else:
+            collection.bulk_write(
+                [UpdateOne({'_id': ObjectId(overlay_id)}, {'$set': update_doc})
+                 for overlay_id, update_doc in updates.items()],
+                ordered=False
+            )
+            documents = list(collection.find({'_id': {'$in': [ObjectId(overlay_id) for overlay_id in updates]}}))
+
+        overlays = [_document_to_overlay(document) for document in documents]
+        return {overlay['id']: overlay for overlay in overlays}
+
+    def delete(self, overlay_id):
+        return self.collection.delete_one({'_id': ObjectId(overlay_id)}).deleted_count > 0
+
+    def list_for_stream(self, stream_id, after, limit, fields=None):
+        # null also matches overlays saved before streamId existed; served by the (streamId, _id) index
+        query = {'streamId': {'$in': [stream_id, None]}}
+        if after:
+            query['_id'] = {'$gt': ObjectId(after)}
+        projection = {field: 1 for field in fields} if fields else None
+        cursor = self.collection.find(query, projection).sort('_id', 1).limit(limit)
+        return [_document_to_overlay(document) for document in cursor]
+
+    def apply_changes(self, changes):
+        """
+        Write changes recorded by a change-tracking SqliteOverlayRepository,
+        in order; the recorded versions replace what MongoDB holds.
+
+        Args:
+            changes (list): (overlay_id, overlay or None for a deletion) tuples
+        """
+        requests = []
+        for overlay_id, overlay in changes:
+            if overlay is None:
+                requests.append(DeleteOne({'_id': ObjectId(overlay_id)}))
+            else:
+                requests.append(ReplaceOne({'_id': ObjectId(overlay_id)}, _overlay_to_document(overlay), upsert=True))
+        if requests:
+            self.collection.bulk_write(requests, ordered=True)
+
+    def _collection_for(self, updates):
+        """
+        Return the collection with the write concern for a batch: the
+        geometry write concern if every update only moves, resizes or fades
+        overlays, otherwise the default.
+        """
+        if all(GEOMETRY_FIELDS.issuperset(update_doc) for update_doc in updates.values()):
+            return self.collection.with_options(
+                write_concern=WriteConcern(w=write_concern_w(Config.MONGODB_GEOMETRY_WRITE_CONCERN))
+            )
+        return self.collection
+
+
+class MemoryOverlayRepository(OverlayRepository):
+    """Overlays in a dict. Nothing is persisted; intended for edge deployments and benchmarks."""
+
+    def __init__(self):
+        self._overlays = {}
+        self._lock = threading.Lock()
+
+    def all(self):
+        with self._lock:
+            return list(self._overlays.values())
+
+    def get(self, overlay_id):
+        with self._lock:
+            return self._overlays.get(overlay_id)
+
+    def insert(self, overlay):
+        with self._lock:
+            self._overlays[overlay['id']] = dict(overlay)
+
+    def update_many(self, updates):
+        results = {}
+        with self._lock:
+            for overlay_id, update_doc in updates.items():
+                if overlay_id in self._overlays:
+                    # Replaced rather than modified, since callers share returned overlays
+                    self._overlays[overlay_id] = results[overlay_id] = {**self._overlays[overlay_id], **update_doc}
+        return results
+
+    def delete(self, overlay_id):
+        with self._lock:
+            return self._overlays.pop(overlay_id, None) is not None
+
+    def list_for_stream(self, stream_id, after, limit, fields=None):
+        with self._lock:
+            overlays = [
+                overlay for overlay_id, overlay in self._overlays.items()
+                if overlay.get('streamId') in (stream_id, None) and overlay_id > (after or '')
+            ]
+        overlays.sort(key=lambda overlay: overlay['id'])
+        return [_project(overlay, fields) for overlay in overlays[:limit]]
+
+
+class SqliteOverlayRepository(OverlayRepository):
+    """
+    Overlays in an SQLite database in WAL mode.
+    With track_changes, every write marks its row dirty and deletions keep a
+    tombstone (a row whose document is NULL), so the changes can be replayed
+    into MongoDB later. seeded is True while the store holds a full copy of
+    MongoDB's overlays, persisted so it survives a restart.
+    """
+
+    def __init__(self, path, track_changes=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.track_changes = track_changes
+        self._lock = threading.Lock()
+        # Autocommit; multi-row changes open explicit transactions
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last commits on power loss, not corruption
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SQLITE_SCHEMA)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(overlays)')]
+        if 'stream_id' not in columns:
+            self._conn.execute('ALTER TABLE overlays ADD COLUMN stream_id TEXT')
+        self._conn.execute(SQLITE_STREAM_INDEX)
+        self.seeded = self._conn.execute("SELECT 1 FROM store_state WHERE name = 'seeded'").fetchone() is not None
+
+    def all(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, document FROM overlays WHERE document IS NOT NULL ORDER BY rowid'
+            ).fetchall()
+        return [_decode(overlay_id, data) for overlay_id, data in rows]
+
+    def get(self, overlay_id):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT document FROM overlays WHERE id = ? AND document IS NOT NULL', (overlay_id,)
+            ).fetchone()
+        return _decode(overlay_id, row[0]) if row else None
+
+    def insert(self, overlay):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO overlays (id, document, dirty, stream_id) VALUES (?, ?, ?, ?)',
+                (overlay['id'], _encode(overlay), int(self.track_changes), overlay.get('streamId'))
+            )
+
+    def update_many(self, updates):
+        results = {}
+        with self._lock, self._transaction('IMMEDIATE'):
+            for overlay_id, update_doc in updates.items():
+                row = self._conn.execute(
+                    'SELECT document FROM overlays WHERE id = ? AND document IS NOT NULL', (overlay_id,)
+                ).fetchone()
+                if not row:
+                    continue
+                overlay = _decode(overlay_id, row[0])
+                overlay.update(update_doc)
+                self._conn.execute(
+                    'UPDATE overlays SET document = ?, dirty = ? WHERE id = ?',
+                    (_encode(overlay), int(self.track_changes), overlay_id)
+                )
+                results[overlay_id] = overlay
+        return results
+
+    def delete(self, overlay_id):
+        with self._lock:
+            if self.track_changes:
+                cursor = self._conn.execute(
+                    'UPDATE overlays SET document = NULL, dirty = 1 WHERE id = ? AND document IS NOT NULL',
+                    (overlay_id,)
+                )
+            else:
+                cursor = self._conn.execute('DELETE FROM overlays WHERE id = ?', (overlay_id,))
+        return cursor.rowcount > 0
+
+    def list_for_stream(self, stream_id, after, limit, fields=None):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, document FROM overlays '
+                'WHERE (stream_id = ? OR stream_id IS NULL) AND id > ? AND document IS NOT NULL '
+                'ORDER BY id LIMIT ?',
+                (stream_id, after or '', limit)
+            ).fetchall()
+        return [_project(_decode(overlay_id, data), fields) for overlay_id, data in rows]
+
+    def seed(self, overlays):
+        """
+        Add every overlay in MongoDB, keeping any unsynced local version,
+        and mark the store as a full copy.
+        """
+        with self._lock:
+            with self._transaction():
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO overlays (id, document, dirty, stream_id) VALUES (?, ?, 0, ?)',
+                    [(overlay['id'], _encode(overlay), overlay.get('streamId')) for overlay in overlays]
+                )
+                self._conn.execute("INSERT OR IGNORE INTO store_state (name) VALUES ('seeded')")
+            self.seeded = True
+
+    def changes(self):
+        """
+        Return changes not yet written to MongoDB, in the order they were first made.
+
+        Returns:
+            list: (overlay_id, overlay or None for a deletion) tuples
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, document FROM overlays WHERE dirty = 1 ORDER BY rowid'
+            ).fetchall()
+        return [(overlay_id, _decode(overlay_id, data) if data else None) for overlay_id, data in rows]
+
+    def clear(self):
+        """Remove everything once MongoDB holds all changes again."""
+        with self._lock:
+            with self._transaction():
+                self._conn.execute('DELETE FROM overlays')
+                self._conn.execute('DELETE FROM store_state')
+            self.seeded = False
+
+    @contextlib.contextmanager
+    def _transaction(self, mode=''):
+        """
+        Run statements in one transaction: committed if they all succeed,
+        rolled back otherwise, so a failed batch leaves no partial writes and
+        no open transaction behind. Caller holds the lock.
+        """
+        self._conn.execute(f'BEGIN {mode}')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+
+def _document_to_overlay(document):
+    """Convert a MongoDB document to an overlay dict with a string ID."""
+    document['id'] = str(document.pop('_id'))
+    return document
+
+
+def _overlay_to_document(overlay):
+    """Convert an overlay dict to a MongoDB document with an ObjectId."""
+    document = {key: value for key, value in overlay.items() if key != 'id'}
+    document['_id'] = ObjectId(overlay['id'])
+    return document
+
+
+def _project(overlay, fields):
+    """Limit an overlay to the requested fields, always keeping 'id'."""
+    if not fields:
+        return overlay
+    return {key: value for key, value in overlay.items() if key == 'id' or key in fields}
+
+
+def _encode(overlay):
+    """Serialize an overlay to JSON for SQLite."""
+    document = {key: value for key, value in overlay.items() if key != 'id'}
+    for field in DATETIME_FIELDS:
+        if isinstance(document.get(field), datetime):
+            document[field] = document[field].isoformat()
+    return json.dumps(document)
+
+
+def _decode(overlay_id, data):
+    """Deserialize an overlay stored by SQLite."""
+    overlay = json.loads(data)
+    for field in DATETIME_FIELDS:
+        if isinstance(overlay.get(field), str):
+            overlay[field] = datetime.fromisoformat(overlay[field])
+    overlay['id'] = overlay_id
+    return overlay
@@ -0,0 +1,250 @@
+"""
+Recording of live streams into hourly MP4 files.
+A recording session follows its stream's media playlist and hands every
+completed segment to the recording directory with a hard link, so the
+live transcode does no extra work and FFmpeg deleting the segment later
+does not affect the recording. When an hour is complete (or the stream
+stops), a bounded worker pool remuxes that hour's segments into one MP4
+without re-encoding.
+"""
+import collections
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SEQUENCE = re.compile(r'(\d+)\.ts$')
+
+# Hours are named in UTC, e.g. 2026-01-15_10
+HOUR_FORMAT = '%Y-%m-%d_%H'
+
+RecordedSegment = collections.namedtuple('RecordedSegment', ['sequence', 'name'])
+
+
+def read_playlist_segments(playlist_path):
+    """
+    List the MPEG-TS segments in a media playlist.
+
+    Returns:
+        list: RecordedSegment tuples, oldest first
+    """
+    try:
+        with open(playlist_path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+    segments = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            match = SEGMENT_SEQUENCE.search(line)
+            if match:
+                segments.append(RecordedSegment(int(match.group(1)), os.path.basename(line)))
+    return segments
+
+
+def mux_hour(segment_dir, output_path):
+    """
+    Remux one hour of MPEG-TS segments into an MP4 without re-encoding.
+    The MP4 is written under a temporary name and renamed when complete.
+
+    Args:
+        segment_dir (str): Directory holding the hour's segments
+        output_path (str): MP4 file to create
+
+    Raises:
+        RuntimeError: If FFmpeg fails
+    """
+    names = sorted(
+        (name for name in os.listdir(segment_dir) if SEGMENT_SEQUENCE.search(name)),
+        key=lambda name: int(SEGMENT_SEQUENCE.search(name).group(1))
+    )
+    if not names:
+        return
+
+    list_path = os.path.join(segment_dir, 'segments.txt')
+    with open(list_path, 'w') as f:
+        f.writelines(f"file '{name}'\n" for name in names)
+
+    temp_path = output_path + '.tmp'
+    command = [
+        Config.FFMPEG_PATH,
+        '-loglevel', 'error',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', list_path,
+        '-map', '0',
+        '-c', 'copy',
+        '-movflags', '+faststart',
+        '-f', 'mp4',
+        '-y', temp_path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise RuntimeError(result.stderr.strip() or f"FFmpeg exited with code {result.returncode}")
+    os.replace(temp_path, output_path)
+
+
+class RecordingPool:
+    """
+    Bounded pool of workers that remux recorded hours into MP4 files,
+    off the request path and the stream supervisors.
+    """
+
+    def __init__(self, root, workers):
+        self.root = root
+        self.completed = 0
+        self.failed = 0
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recording')
+        self._lock = threading.Lock()
+
+    def submit(self, stream_id, segment_dir, hour):
+        """
+        Queue an hour of segments for remuxing into <root>/<stream_id>/<hour>.mp4.
+
+        Args:
+            stream_id (str): Stream ID
+            segment_dir (str): Directory holding the hour's segments
+            hour (str): Hour name in HOUR_FORMAT
+        """
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._mux, stream_id, segment_dir, hour)
+
+    def recover(self):
+        """Queue hours left unmuxed by a previous run, e.g. after a crash."""
+        try:
+            stream_ids = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for stream_id in stream_ids:
+            stream_dir = os.path.join(self.root, stream_id)
+            if not os.path.isdir(stream_dir):
+                continue
+            for name in os.listdir(stream_dir):
+                if name.startswith('.'):
+                    logger.info(f"Recovering unfinished recording {stream_id}/{name}")
+                    self.submit(stream_id, os.path.join(stream_dir, name), name[1:].split('.')[0])
+
+    def stats(self):
+        """Return job counters for monitoring."""
+        with self._lock:
+            return {'pending': self._pending, 'completed': self.completed, 'failed': self.failed}
+
+    def _mux(self, stream_id, segment_dir, hour):
+        """Remux one hour and remove its segments. Runs on a worker thread."""
+        started = time.monotonic()
+        stream_dir = os.path.join(self.root, stream_id)
+        output_path = os.path.join(stream_dir, f'{hour}.mp4')
+        # A stream restarted within the hour gets a second file
+        counter = 1
+        while os.path.exists(output_path):
+            counter += 1
+            output_path = os.path.join(stream_dir, f'{hour}_{counter}.mp4')
+
+        try:
+            mux_hour(segment_dir, output_path)
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            with self._lock:
+                self.completed += 1
+            logger.info(f"Recorded {output_path} in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # The segments are kept so the hour can be recovered on the next start
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Failed to record {stream_id} hour {hour}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+class StreamRecorder:
+    """
+    Hands one stream's completed segments to the recording directory.
+    refresh() is called periodically by the stream supervisor.
+    """
+
+    def __init__(self, stream_id, playlist_path, pool):
+        self.stream_id = stream_id
+        self.playlist_path = playlist_path
+        self.pool = pool
+        self._started = int(time.time())
+        self._hour = None
+        self._segment_dir = None
+        self._last_sequence = -1
+        self._playlist_version = None
+        self._warned_copy = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Hand off segments FFmpeg has completed since the last call."""
+        try:
+            stat = os.stat(self.playlist_path)
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            version = (stat.st_mtime_ns, stat.st_size)
+            if version == self._playlist_version:
+                return
+            self._playlist_version = version
+
+            for segment in read_playlist_segments(self.playlist_path):
+                if segment.sequence <= self._last_sequence:
+                    continue
+                self._last_sequence = segment.sequence
+                self._hand_off(segment)
+
+    def finish(self):
+        """Hand off the last segments and queue the unfinished hour for remuxing."""
+        self.refresh()
+        with self._lock:
+            if self._segment_dir:
+                self.pool.submit(self.stream_id, self._segment_dir, self._hour)
+            self._hour = None
+            self._segment_dir = None
+
+    def _hand_off(self, segment):
+        """Link a segment into the current hour's directory. Caller holds the lock."""
+        hour = datetime.now(timezone.utc).strftime(HOUR_FORMAT)
+        if hour != self._hour:
+            if self._segment_dir:
+                self.pool.submit(self.stream_id, self._segment_dir, self._hour)
+            self._hour = hour
+            # Hidden until muxed; named per recorder so a restarted stream cannot collide
+            self._segment_dir = os.path.join(self.pool.root, self.stream_id, f'.{hour}.{self._started}')
+            os.makedirs(self._segment_dir, exist_ok=True)
+
+        source = os.path.join(os.path.dirname(self.playlist_path), segment.name)
+        target = os.path.join(self._segment_dir, f'{segment.sequence:08d}.ts')
+        try:
+            os.link(source, target)
+        except FileNotFoundError:
+            logger.warning(f"Segment {segment.name} of stream {self.stream_id} was deleted before recording")
+        except OSError:
+            # Hard links cannot cross filesystems, e.g. from a tmpfs STREAM_DIR
+            if not self._warned_copy:
+                logger.warning(
+                    f"Copying segments of stream {self.stream_id}: RECORDING_DIR is on a different "
+                    f"filesystem than STREAM_DIR"
+                )
+                self._warned_copy = True
+            try:
+                shutil.copyfile(source, target)
+            except FileNotFoundError:
+                logger.warning(f"Segment {segment.name} of stream {self.stream_id} was deleted before recording")
+
+
+recording_pool = RecordingPool(Config.RECORDING_DIR, Config.RECORDING_WORKERS)
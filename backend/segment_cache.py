@@ -0,0 +1,109 @@
+"""
+Bounded in-memory cache for HLS playlists and segments.
+Entries are validated against the file's mtime and size on every lookup, so
+files rewritten by FFmpeg are never served stale.
+"""
+import collections
+import hashlib
+import os
+import threading
+from config import Config
+
+# data is None when the file is too large to cache and must be sent from disk
+CachedFile = collections.namedtuple('CachedFile', ['data', 'etag', 'version'])
+
+
+class SegmentCache:
+    """Thread-safe LRU of file contents, bounded by total bytes."""
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """
+        Return a file's contents, reading from disk only if it changed.
+
+        Args:
+            path (str): Absolute file path
+
+        Returns:
+            CachedFile: Cached contents and strong ETag
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.discard(path)
+            raise
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry.version == version:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        if stat.st_size > self.max_entry_bytes:
+            return CachedFile(None, None, version)
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        entry = CachedFile(data, hashlib.blake2b(data, digest_size=16).hexdigest(), version)
+
+        # A segment still being written changes between stat and read; serve it uncached
+        stat = os.stat(path)
+        if (stat.st_mtime_ns, stat.st_size) != version or len(data) != stat.st_size:
+            return entry
+
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous:
+                self._total_bytes -= len(previous.data)
+            self._entries[path] = entry
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted.data)
+
+        return entry
+
+    def discard(self, path):
+        """Drop a single cached file."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry:
+                self._total_bytes -= len(entry.data)
+
+    def discard_dir(self, directory):
+        """Drop every cached file under a directory, e.g. when a stream stops."""
+        prefix = os.path.join(directory, '')
+        with self._lock:
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                self._total_bytes -= len(self._entries.pop(path).data)
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+segment_cache = SegmentCache(
+    Config.SEGMENT_CACHE_MAX_BYTES,
+    Config.SEGMENT_CACHE_MAX_ENTRY_BYTES
+)
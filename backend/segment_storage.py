@@ -0,0 +1,279 @@
+"""
+Retention limits for HLS output.
+Every stream writes under Config.STREAM_DIR, which can point at a tmpfs/RAM
+disk so segment writes and reads never touch a physical disk. FFmpeg's
+delete_segments only trims each playlist's window; this module also caps
+each stream's bytes and the total across streams, deleting the oldest
+segments first, so a runaway stream cannot fill the host.
+"""
+import logging
+import os
+import threading
+import time
+from config import Config
+from segment_cache import segment_cache
+from stream_metrics import SEGMENT_SEQUENCE
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ('disk', 'memory')
+
+# Filesystems backed by RAM
+MEMORY_FILESYSTEMS = {'tmpfs', 'ramfs'}
+
+
+def filesystem_type(path):
+    """
+    Return the type of the filesystem a path is on, from /proc/mounts.
+
+    Returns:
+        str: Filesystem type such as 'tmpfs' or 'ext4', or None where
+            /proc/mounts is unavailable (e.g. macOS)
+    """
+    path = os.path.realpath(path)
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) > 2]
+    except OSError:
+        return None
+
+    best = None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+            if best is None or len(mount_point) >= len(best[0]):
+                best = (mount_point, fs_type)
+    return best[1] if best else None
+
+
+def is_segment(name):
+    """Return True for media segments and parts, which may be evicted; playlists and init segments are kept."""
+    return SEGMENT_SEQUENCE.search(name) is not None
+
+
+def evictable_segments(segments):
+    """
+    Drop the newest segment of each output from a stream's segments.
+    Outputs are told apart by the name without its sequence number, so every
+    ABR rendition keeps the segment FFmpeg may still be writing.
+
+    Args:
+        segments (list): (path, size, mtime) tuples, oldest first
+
+    Returns:
+        list: Segments that may be deleted, oldest first
+    """
+    newest = {}
+    for segment in segments:
+        newest[SEGMENT_SEQUENCE.sub('', os.path.basename(segment[0]))] = segment[0]
+    protected = set(newest.values())
+    return [segment for segment in segments if segment[0] not in protected]
+
+
+class SegmentStorage:
+    """
+    Enforces per-stream and total byte limits on the stream directory.
+    A background thread re-checks usage every check_interval seconds.
+    """
+
+    def __init__(self, root, stream_max_bytes, max_total_bytes, check_interval):
+        self.root = root
+        self.stream_max_bytes = stream_max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.check_interval = check_interval
+        self.evicted_segments = 0
+        self.evicted_bytes = 0
+        self._total_bytes = 0
+        self._exempt = {}
+        self._excluded = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def prepare(self, mode):
+        """
+        Create the stream directory and check it suits the storage mode.
+
+        Args:
+            mode (str): 'disk', or 'memory' to expect a RAM-backed filesystem
+
+        Raises:
+            ValueError: If the mode is unknown
+            OSError: If the directory cannot be created
+        """
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Invalid stream storage. Must be one of: {', '.join(STORAGE_MODES)}")
+
+        os.makedirs(self.root, exist_ok=True)
+        fs_type = filesystem_type(self.root)
+        if mode == 'memory' and fs_type not in MEMORY_FILESYSTEMS:
+            logger.warning(
+                f"STREAM_STORAGE is memory but {self.root} is on {fs_type or 'an unknown filesystem'}; "
+                f"mount a tmpfs there or point STREAM_DIR at one"
+            )
+        logger.info(f"Stream storage: {self.root} ({fs_type or 'unknown filesystem'})")
+
+    def start(self):
+        """Start enforcing limits, if any are configured. Safe to call repeatedly."""
+        if not (self.stream_max_bytes or self.max_total_bytes):
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def exempt(self, stream_id, on_evict):
+        """
+        Exempt a stream that bounds its own output, such as a DVR window,
+        from the per-stream quota. It still counts towards the total limit.
+
+        Args:
+            stream_id (str): Stream ID
+            on_evict (callable): Called with the set of segment names deleted
+                from the stream to enforce the total limit
+        """
+        with self._lock:
+            self._exempt[stream_id] = on_evict
+
+    def exclude(self, stream_id):
+        """
+        Leave a stream's directory out of both limits. For HTTP(S) relays,
+        whose files are named by hash and expired by the relay itself.
+        """
+        with self._lock:
+            self._excluded.add(stream_id)
+
+    def release(self, stream_id):
+        """Apply both limits to a stream again."""
+        with self._lock:
+            self._exempt.pop(stream_id, None)
+            self._excluded.discard(stream_id)
+
+    def enforce(self):
+        """
+        Delete the oldest segments until every stream is within its quota
+        and all streams together are within the total limit. The newest
+        segment of each stream output (e.g. ABR rendition) is never deleted,
+        as FFmpeg may still be writing it.
+
+        Returns:
+            int: Number of segments deleted
+        """
+        streams = self._scan()
+        with self._lock:
+            exempt = dict(self._exempt)
+        evictable = []
+        total = 0
+        evicted = 0
+
+        for stream_id, (used, segments) in streams.items():
+            candidates = evictable_segments(segments)
+            if self.stream_max_bytes and used > self.stream_max_bytes and stream_id not in exempt:
+                logger.warning(
+                    f"Stream {stream_id} uses {used} bytes, over its {self.stream_max_bytes} byte quota"
+                )
+                while candidates and used > self.stream_max_bytes:
+                    path, size, _ = candidates.pop(0)
+                    if self._delete(path, size):
+                        used -= size
+                        evicted += 1
+            total += used
+            evictable += candidates
+
+        if self.max_total_bytes and total > self.max_total_bytes:
+            logger.warning(f"Streams use {total} bytes, over the {self.max_total_bytes} byte limit")
+            evictable.sort(key=lambda segment: segment[2])
+            evicted_from_exempt = {}
+            for path, size, _ in evictable:
+                if total <= self.max_total_bytes:
+                    break
+                if self._delete(path, size):
+                    total -= size
+                    evicted += 1
+                    stream_id = os.path.basename(os.path.dirname(path))
+                    if stream_id in exempt:
+                        evicted_from_exempt.setdefault(stream_id, set()).add(os.path.basename(path))
+            for stream_id, names in evicted_from_exempt.items():
+                logger.warning(f"Evicted {len(names)} segments of stream {stream_id} to stay within the total limit")
+                exempt[stream_id](names)
+
+        with self._lock:
+            self._total_bytes = total
+        return evicted
+
+    def stats(self):
+        """Return usage and eviction counters for monitoring."""
+        with self._lock:
+            return {
+                'bytes': self._total_bytes,
+                'evicted_segments': self.evicted_segments,
+                'evicted_bytes': self.evicted_bytes
+            }
+
+    def _scan(self):
+        """
+        Measure every stream directory that is not excluded.
+
+        Returns:
+            dict: stream ID -> (bytes used, [(path, size, mtime)] segments oldest first)
+        """
+        streams = {}
+        with self._lock:
+            excluded = set(self._excluded)
+        try:
+            with os.scandir(self.root) as entries:
+                stream_dirs = [entry for entry in entries if entry.is_dir() and entry.name not in excluded]
+        except FileNotFoundError:
+            return streams
+
+        for stream_dir in stream_dirs:
+            used = 0
+            segments = []
+            try:
+                with os.scandir(stream_dir.path) as entries:
+                    for entry in entries:
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue  # Deleted by FFmpeg mid-scan
+                        used += stat.st_size
+                        if is_segment(entry.name):
+                            segments.append((entry.path, stat.st_size, stat.st_mtime))
+            except FileNotFoundError:
+                continue  # Stream stopped mid-scan
+            segments.sort(key=lambda segment: segment[2])
+            streams[stream_dir.name] = (used, segments)
+        return streams
+
+    def _delete(self, path, size):
+        """Delete one segment, returning False if it was already gone."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Could not evict segment {path}: {str(e)}")
+            return False
+        segment_cache.discard(path)
+        with self._lock:
+            self.evicted_segments += 1
+            self.evicted_bytes += size
+        return True
+
+    def _run(self):
+        """Re-check limits periodically."""
+        while True:
+            try:
+                evicted = self.enforce()
+                if evicted:
+                    logger.info(f"Evicted {evicted} segments to stay within storage limits")
+            except Exception as e:
+                logger.error(f"Error enforcing stream storage limits: {str(e)}")
+            time.sleep(self.check_interval)
+
+
+segment_storage = SegmentStorage(
+    Config.STREAM_DIR,
+    Config.STREAM_MAX_BYTES,
+    Config.STREAM_STORAGE_MAX_BYTES,
+    Config.STREAM_STORAGE_CHECK_SECONDS
+)
@@ -0,0 +1,59 @@
+"""
+Async production server for the RTSP Livestream Overlay backend.
+Runs the Flask app on gevent's event loop, so thousands of concurrent
+playlist and segment requests share one process without a thread each.
+All routes from app.py are served unchanged.
+
+Usage:
+    python server.py
+"""
+# Monkey patching must happen before anything imports socket, threading or subprocess
+from gevent import monkey
+monkey.patch_all()
+
+import signal
+import socket
+import gevent
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIHandler, WSGIServer
+from config import Config
+from app import app, cleanup_ffmpeg, initialize_services, logger
+
+
+class NoDelayHandler(WSGIHandler):
+    """
+    Disables Nagle's algorithm on each connection. Without it, every response
+    after the first on a keep-alive connection waits ~40 ms for the client's
+    delayed ACK.
+    """
+
+    def handle(self):
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().handle()
+
+
+def main():
+    """Start the gevent WSGI server."""
+    initialize_services('gevent server')
+    logger.info(f"Max concurrent connections: {Config.SERVER_MAX_CONNECTIONS}")
+
+    server = WSGIServer(
+        (Config.HOST, Config.PORT),
+        app,
+        spawn=Pool(Config.SERVER_MAX_CONNECTIONS),
+        handler_class=NoDelayHandler,
+        log=None  # Per-request access logs cost more than serving a cached segment
+    )
+
+    # app.py's signal handlers would run inside the event loop, where stopping
+    # FFmpeg cannot block; gevent runs these in their own greenlet instead
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        gevent.signal_handler(signum, server.stop)
+
+    server.serve_forever()
+    logger.info("Server stopped, shutting down...")
+    cleanup_ffmpeg()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Still JPEG snapshots of live streams for dashboards.
+A snapshot is the first keyframe of a stream's newest segment, decoded by
+a short FFmpeg run and cached per stream for Config.SNAPSHOT_MAX_AGE_SECONDS,
+so any number of viewers costs one decode per stream per max-age, and
+nothing while no one is looking.
+"""
+import collections
+import hashlib
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from config import Config
+import ll_hls
+
+logger = logging.getLogger(__name__)
+
+Snapshot = collections.namedtuple('Snapshot', ['jpeg', 'etag', 'taken_at'])
+
+BANDWIDTH_ATTRIBUTE = re.compile(r'[:,]BANDWIDTH=(\d+)')
+MAP_URI = re.compile(r'^#EXT-X-MAP:.*URI="([^"]+)"')
+
+
+def _read_lines(path):
+    """Return a playlist's lines, or [] if it does not exist."""
+    try:
+        with open(path) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def _last_entry(playlist_path):
+    """Return the filename of the last segment listed in a media playlist, or None."""
+    for line in reversed(_read_lines(playlist_path)):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            return os.path.basename(line)
+    return None
+
+
+def _relayed_segment_names(session):
+    """
+    Fetch the files of a relay's newest segment through session.prepare().
+    A master playlist is followed to its lowest-bandwidth variant, which is
+    cheapest to decode.
+
+    Returns:
+        list: Names to concatenate (fMP4 init segment first), or None if the
+            playlist lists no segment yet
+
+    Raises:
+        LookupError: If a listed file is no longer known to the relay
+        UpstreamError: If a file cannot be fetched
+    """
+    playlist = 'playlist.m3u8'
+    session.prepare(playlist)
+    lines = _read_lines(os.path.join(session.output_dir, playlist))
+
+    if any(line.startswith('#EXT-X-STREAM-INF') for line in lines):
+        variants = []
+        for index, line in enumerate(lines[:-1]):
+            if line.startswith('#EXT-X-STREAM-INF'):
+                bandwidth = BANDWIDTH_ATTRIBUTE.search(line)
+                variants.append((int(bandwidth.group(1)) if bandwidth else 0, lines[index + 1].strip()))
+        if not variants:
+            return None
+        playlist = min(variants)[1]
+        session.prepare(playlist)
+        lines = _read_lines(os.path.join(session.output_dir, playlist))
+
+    init = None
+    segment = None
+    for line in lines:
+        line = line.strip()
+        map_uri = MAP_URI.match(line)
+        if map_uri:
+            init = map_uri.group(1)
+        elif line and not line.startswith('#'):
+            segment = line
+    if segment is None:
+        return None
+
+    names = [init, segment] if init else [segment]
+    for name in names:
+        session.prepare(name)
+    return names
+
+
+def latest_segment(session):
+    """
+    Read the newest complete segment of a session.
+    ABR sessions use the smallest rendition, which is cheapest to decode.
+    Relays fetch it from upstream if no viewer has requested it yet.
+
+    Args:
+        session (StreamSession): Stream session, or a relay's ProxySession
+
+    Returns:
+        bytes: Segment data FFmpeg can decode on its own, or None if none exists yet
+    """
+    if session.proxy:
+        names = _relayed_segment_names(session)
+        if names is None:
+            return None
+    elif session.low_latency:
+        parts = ll_hls.read_parts(session.output_dir)
+        if not parts:
+            return None
+        # Parts start on keyframes but need the init segment to be decodable
+        names = [ll_hls.INIT_SEGMENT, parts[-1][2]]
+    else:
+        playlist = f'{session.renditions[-1]["name"]}.m3u8' if session.abr else 'playlist.m3u8'
+        name = _last_entry(os.path.join(session.output_dir, playlist))
+        if name is None:
+            return None
+        names = [name]
+
+    chunks = []
+    for name in names:
+        try:
+            with open(os.path.join(session.output_dir, name), 'rb') as f:
+                chunks.append(f.read())
+        except FileNotFoundError:
+            return None  # Deleted since the playlist was read
+    return b''.join(chunks)
+
+
+def decode_keyframe(segment, width):
+    """
+    Decode the first keyframe of a segment into a JPEG.
+
+    Args:
+        segment (bytes): MPEG-TS or fMP4 segment data
+        width (int): Output width in pixels; height keeps the aspect ratio
+
+    Returns:
+        bytes: JPEG data
+
+    Raises:
+        RuntimeError: If FFmpeg fails or produces no image
+        FileNotFoundError: If the FFmpeg binary cannot be found
+    """
+    command = [
+        Config.FFMPEG_PATH,
+        '-loglevel', 'error',
+        '-skip_frame', 'nokey',  # Decode keyframes only
+        '-i', 'pipe:0',
+        '-frames:v', '1',
+        '-vf', f'scale={width}:-2',
+        '-q:v', str(Config.SNAPSHOT_JPEG_QUALITY),
+        '-f', 'image2pipe',
+        '-c:v', 'mjpeg',
+        'pipe:1'
+    ]
+    try:
+        result = subprocess.run(
+            command, input=segment, capture_output=True, timeout=Config.SNAPSHOT_TIMEOUT_SECONDS
+        )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"Snapshot decode timed out after {Config.SNAPSHOT_TIMEOUT_SECONDS}s")
+
+    if result.returncode != 0 or not result.stdout:
+        raise RuntimeError(f"Snapshot decode failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+
+class SnapshotCache:
+    """
+    Per-stream snapshots, refreshed on demand once older than max_age.
+    Concurrent requests for a stale snapshot share one decode.
+    """
+
+    def __init__(self, max_age_seconds, width):
+        self.max_age_seconds = max_age_seconds
+        self.width = width
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = {}
+        self._refresh_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, session):
+        """
+        Return a snapshot no older than max_age, decoding a new one if needed.
+        If decoding fails, the previous snapshot is returned while one exists.
+
+        Args:
+            session (StreamSession): Stream session
+
+        Returns:
+            Snapshot: JPEG data, strong ETag and the time it was taken
+
+        Raises:
+            LookupError: If the stream has not written a segment yet
+            RuntimeError: If decoding fails and there is no previous snapshot
+        """
+        stream_id = session.stream_id
+        with self._lock:
+            snapshot = self._fresh(stream_id)
+            if snapshot:
+                self.hits += 1
+                return snapshot
+            refresh_lock = self._refresh_locks.setdefault(stream_id, threading.Lock())
+
+        with refresh_lock:
+            # Another request may have refreshed it while this one waited
+            with self._lock:
+                snapshot = self._fresh(stream_id)
+                if snapshot:
+                    self.hits += 1
+                    return snapshot
+                self.misses += 1
+                previous = self._snapshots.get(stream_id)
+
+            try:
+                segment = latest_segment(session)
+                if segment is None:
+                    raise LookupError(f"No segment available yet for stream {stream_id}")
+                jpeg = decode_keyframe(segment, self.width)
+            except (RuntimeError, LookupError) as e:
+                if previous is None:
+                    raise
+                logger.warning(f"Serving previous snapshot of stream {stream_id}: {str(e)}")
+                return previous
+
+            snapshot = Snapshot(jpeg, hashlib.blake2b(jpeg, digest_size=16).hexdigest(), time.time())
+            with self._lock:
+                # Not stored if the stream stopped while decoding
+                if stream_id in self._refresh_locks:
+                    self._snapshots[stream_id] = snapshot
+            return snapshot
+
+    def discard(self, stream_id):
+        """Drop a stream's snapshot when it stops."""
+        with self._lock:
+            self._snapshots.pop(stream_id, None)
+            self._refresh_locks.pop(stream_id, None)
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            return {
+                'entries': len(self._snapshots),
+                'bytes': sum(len(snapshot.jpeg) for snapshot in self._snapshots.values()),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _fresh(self, stream_id):
+        """Return the cached snapshot if it is younger than max_age. Caller holds the lock."""
+        snapshot = self._snapshots.get(stream_id)
+        if snapshot and time.time() - snapshot.taken_at < self.max_age_seconds:
+            return snapshot
+        return None
+
+
+snapshot_cache = SnapshotCache(Config.SNAPSHOT_MAX_AGE_SECONDS, Config.SNAPSHOT_WIDTH)
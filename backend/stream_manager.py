@@ -0,0 +1,821 @@
+"""
+Stream registry for concurrent RTSP to HLS conversion.
+Each stream owns one FFmpeg process and an output directory under Config.STREAM_DIR,
+and a supervisor thread that restarts FFmpeg when it exits or stalls.
+"""
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime
+from config import Config
+from dvr import DVR_PLAYLIST, LIVE_PLAYLIST, DvrIndex
+from hls_proxy import ProxySession, proxy_share_key, validate_source_url
+import ll_hls
+from overlay_burnin import LAYER_FILENAME, burn_in_renderer
+from recorder import StreamRecorder, recording_pool
+from segment_cache import segment_cache
+from segment_storage import segment_storage
+from snapshots import snapshot_cache
+from stream_metrics import OPENING_FILE, StreamMetrics, monitor_ffmpeg_progress
+from transcoder import (
+    build_ffmpeg_command,
+    probe_source_codecs,
+    select_codec_plan,
+    select_renditions,
+    validate_codec_mode,
+    write_master_playlist
+)
+
+logger = logging.getLogger(__name__)
+
+# How often wait_until_ready checks for the first segment
+READY_POLL_SECONDS = 0.1
+
+# Stream IDs double as directory names, so keep them filesystem- and URL-safe
+STREAM_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# FFmpeg runs with -loglevel level+info, which tags each line with its level
+FFMPEG_LOG_LEVEL = re.compile(r'\[(panic|fatal|error|warning)\]')
+
+
+class StreamLimitError(RuntimeError):
+    """Raised when starting a stream would exceed Config.MAX_CONCURRENT_STREAMS."""
+
+
+def validate_stream_id(stream_id):
+    """
+    Validate a client-supplied stream ID.
+
+    Args:
+        stream_id (str): Stream ID to validate
+
+    Raises:
+        ValueError: If the ID contains characters outside [A-Za-z0-9_-]
+    """
+    if not isinstance(stream_id, str) or not STREAM_ID_PATTERN.match(stream_id):
+        raise ValueError("Invalid stream ID. Use 1-64 letters, digits, '-' or '_'")
+
+
+def normalize_rtsp_url(rtsp_url):
+    """
+    Normalize an RTSP URL so equivalent spellings share one transcode.
+    Lowercases scheme and host, drops the default port 554 and a trailing slash.
+
+    Args:
+        rtsp_url (str): RTSP source URL
+
+    Returns:
+        str: Normalized URL used as the sharing key
+    """
+    parts = urllib.parse.urlsplit(rtsp_url.strip())
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'  # Re-bracket IPv6 literals
+    if parts.port and parts.port != 554:
+        host = f'{host}:{parts.port}'
+    if parts.username is not None:
+        credentials = parts.username
+        if parts.password is not None:
+            credentials = f'{credentials}:{parts.password}'
+        host = f'{credentials}@{host}'
+    path = parts.path.rstrip('/') or '/'
+    return urllib.parse.urlunsplit((parts.scheme.lower(), host, path, parts.query, ''))
+
+
+def parse_stream_options(data):
+    """
+    Validate per-stream output options from a start request.
+
+    Args:
+        data (dict): Request body
+
+    Returns:
+        dict: Options with defaults applied
+
+    Raises:
+        ValueError: If an option is invalid or options conflict
+    """
+    options = {
+        'codec_mode': data.get('codec_mode') or Config.STREAM_CODEC_MODE,
+        'low_latency': bool(data.get('low_latency')),
+        'abr': bool(data.get('abr')),
+        'burn_overlays': bool(data.get('burn_overlays')),
+        'dvr': bool(data.get('dvr')),
+        'record': bool(data.get('record'))
+    }
+
+    validate_codec_mode(options['codec_mode'])
+    if options['low_latency'] and options['abr']:
+        raise ValueError("low_latency and abr cannot be combined")
+    if options['dvr'] and (options['low_latency'] or options['abr']):
+        raise ValueError("dvr cannot be combined with low_latency or abr")
+    if options['record'] and options['low_latency']:
+        raise ValueError("record cannot be combined with low_latency")
+
+    return options
+
+
+# Output options that need FFmpeg, which relayed HTTP(S) sources do not run
+PROXY_UNSUPPORTED_OPTIONS = ('low_latency', 'abr', 'burn_overlays', 'dvr', 'record')
+
+
+def parse_prewarm_streams(spec):
+    """
+    Parse Config.PREWARM_STREAMS.
+
+    Args:
+        spec (str): Comma-separated stream_id=url pairs, e.g.
+            'lobby=rtsp://10.0.0.5/stream1,garage=rtsp://10.0.0.6/stream1'
+
+    Returns:
+        list: (stream_id, url) tuples
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    streams = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        stream_id, _, url = entry.partition('=')
+        validate_stream_id(stream_id.strip())
+        if not url.strip().startswith(('rtsp://', 'http://', 'https://')):
+            raise ValueError(f"Invalid pre-warm stream {entry!r}. Use stream_id=rtsp://...")
+        streams.append((stream_id.strip(), url.strip()))
+    return streams
+
+
+def share_key(normalized_url, options):
+    """
+    Build the key under which viewers share one FFmpeg process.
+    Only options that change the HLS output take part; codec_mode and
+    record do not.
+    """
+    return (normalized_url, options['low_latency'], options['abr'], options['burn_overlays'], options['dvr'])
+
+
+def monitor_ffmpeg_output(stream_id, process, metrics):
+    """
+    Monitor FFmpeg stderr output in a separate thread.
+    Warnings and errors are logged as such; routine output only at DEBUG.
+
+    Args:
+        stream_id (str): Stream the process belongs to
+        process (subprocess.Popen): FFmpeg process
+        metrics (StreamMetrics): Metrics to record segment writes in
+    """
+    try:
+        for line in process.stderr:
+            line = line.strip()
+            if not line:
+                continue
+
+            opened = OPENING_FILE.search(line)
+            if opened:
+                metrics.record_file_opened(opened.group(1))
+
+            level = FFMPEG_LOG_LEVEL.search(line)
+            if level is None:
+                logger.debug(f"FFmpeg [{stream_id}]: {line}")
+            elif level.group(1) == 'warning':
+                logger.warning(f"FFmpeg [{stream_id}]: {line}")
+            else:
+                logger.error(f"FFmpeg [{stream_id}]: {line}")
+    except Exception as e:
+        logger.error(f"Error monitoring FFmpeg [{stream_id}]: {str(e)}")
+
+
+class StreamSession:
+    """A single RTSP source being converted to HLS."""
+
+    proxy = False
+
+    def __init__(self, stream_id, rtsp_url, options, source_codecs=None):
+        self.stream_id = stream_id
+        self.rtsp_url = rtsp_url
+        self.normalized_url = normalize_rtsp_url(rtsp_url)
+        self.options = options
+        self.low_latency = options['low_latency']
+        self.abr = options['abr']
+        self.burn_overlays = options['burn_overlays']
+        self.codec_mode = options['codec_mode']
+        self.source_codecs = source_codecs
+        self.codec_plan = select_codec_plan(self.codec_mode, source_codecs, self.low_latency)
+        self.renditions = select_renditions(source_codecs) if self.abr else []
+        if self.abr or self.burn_overlays:
+            # Scaled or composited video must be re-encoded
+            self.codec_plan['video'] = 'transcode'
+        self.output_dir = os.path.join(Config.STREAM_DIR, stream_id)
+        self.dvr = (
+            DvrIndex(self.output_dir, Config.DVR_WINDOW_SECONDS, Config.STREAM_STORAGE_MAX_BYTES)
+            if options['dvr'] else None
+        )
+        self.recorder = None
+        self.process = None
+        self.started_at = None
+        self.launched_at = None
+        self.viewers = 0
+        self.teardown_timer = None
+        self.restart_count = 0
+        self.pinned = False
+        self.first_segment_at = None
+        self.metrics = StreamMetrics(self.segment_duration)
+        self.last_failure = None
+        self._stopped = threading.Event()
+        self._process_lock = threading.Lock()
+
+    @property
+    def share_key(self):
+        """Viewers share a session only if they want the same source and output format."""
+        return share_key(self.normalized_url, self.options)
+
+    @property
+    def playlist_name(self):
+        """Playlist players should load: the master playlist for ABR streams, the full window for DVR."""
+        if self.abr:
+            return 'master.m3u8'
+        return DVR_PLAYLIST if self.dvr else LIVE_PLAYLIST
+
+    @property
+    def playlist_path(self):
+        return os.path.join(self.output_dir, self.playlist_name)
+
+    @property
+    def live_playlist_path(self):
+        """Playlist FFmpeg writes; DVR playlists are generated from it."""
+        return os.path.join(self.output_dir, LIVE_PLAYLIST)
+
+    @property
+    def media_playlist_path(self):
+        """Media playlist FFmpeg writes: LL-HLS parts, the top ABR rendition, or the live playlist."""
+        if self.low_latency:
+            return os.path.join(self.output_dir, ll_hls.PARTS_PLAYLIST)
+        if self.abr:
+            return os.path.join(self.output_dir, f'{self.renditions[0]["name"]}.m3u8')
+        return self.live_playlist_path
+
+    @property
+    def overlay_layer_path(self):
+        """PNG the burned-in overlays are read from."""
+        return os.path.join(self.output_dir, LAYER_FILENAME)
+
+    @property
+    def segment_duration(self):
+        """Target duration in seconds of each file FFmpeg writes."""
+        return Config.LL_HLS_PART_DURATION if self.low_latency else 2
+
+    @property
+    def segment_pattern(self):
+        return os.path.join(self.output_dir, 'segment%03d.ts')
+
+    def start_recording(self):
+        """Start handing completed segments to the recorder. ABR streams record their top rendition."""
+        if self.recorder is not None:
+            return
+        self.recorder = StreamRecorder(self.stream_id, self.media_playlist_path, recording_pool)
+        logger.info(f"Recording stream {self.stream_id} to {Config.RECORDING_DIR}")
+
+    def is_active(self):
+        """Return True while the FFmpeg process is running."""
+        return self.process is not None and self.process.poll() is None
+
+    def is_ready(self):
+        """Return True once FFmpeg has written a first segment, so players can start."""
+        if self.first_segment_at is None:
+            try:
+                with open(self.media_playlist_path) as f:
+                    if '#EXTINF' not in f.read():
+                        return False
+            except FileNotFoundError:
+                return False
+            self.first_segment_at = time.time()
+            logger.info(
+                f"First segment of stream {self.stream_id} ready "
+                f"{self.first_segment_at - self.launched_at:.2f}s after launching FFmpeg"
+            )
+        return True
+
+    def wait_until_ready(self, timeout):
+        """
+        Block until the first segment is written.
+
+        Args:
+            timeout (float): Seconds to wait at most
+
+        Returns:
+            bool: True if ready, False on timeout or if the session stopped
+        """
+        deadline = time.monotonic() + timeout
+        while not self.is_ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopped.wait(min(READY_POLL_SECONDS, remaining)):
+                return False
+        return True
+
+    def start(self):
+        """
+        Create the output directory, launch FFmpeg and start supervising it.
+
+        Raises:
+            FileNotFoundError: If the FFmpeg binary cannot be found
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.dvr:
+            # The window bounds the stream instead of STREAM_MAX_BYTES
+            segment_storage.exempt(self.stream_id, self.dvr.discard)
+        segment_storage.start()
+        if self.options['record']:
+            self.start_recording()
+        if self.abr:
+            write_master_playlist(self)
+        if self.burn_overlays:
+            source = self.source_codecs or {}
+            burn_in_renderer.register(
+                self.stream_id, self.overlay_layer_path, source.get('width'), source.get('height')
+            )
+
+        with self._process_lock:
+            self._launch()
+        self.started_at = datetime.utcnow()
+
+        logger.info(f"Streaming from: {self.rtsp_url}")
+        logger.info(f"Output playlist: {self.playlist_path}")
+
+        supervisor_thread = threading.Thread(target=self._supervise, daemon=True)
+        supervisor_thread.start()
+
+    def stop(self):
+        """
+        Stop supervising, terminate FFmpeg and remove the stream's HLS output.
+        Ensures no zombie processes are left running.
+        """
+        self._stopped.set()
+        if self.burn_overlays:
+            burn_in_renderer.unregister(self.stream_id)
+        if self.dvr:
+            segment_storage.release(self.stream_id)
+        with self._process_lock:
+            self._terminate()
+
+        if self.recorder:
+            try:
+                self.recorder.finish()
+            except Exception as e:
+                logger.error(f"Error finishing recording [{self.stream_id}]: {str(e)}")
+
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        segment_cache.discard_dir(self.output_dir)
+        snapshot_cache.discard(self.stream_id)
+
+    def _launch(self):
+        """Start an FFmpeg process for this session. Caller holds the process lock."""
+        ffmpeg_cmd = build_ffmpeg_command(self)
+        logger.info(f"Starting FFmpeg [{self.stream_id}] with command: {' '.join(ffmpeg_cmd)}")
+
+        self.process = subprocess.Popen(
+            ffmpeg_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        self.launched_at = time.time()
+        self.metrics.reset()
+
+        monitor_thread = threading.Thread(
+            target=monitor_ffmpeg_output,
+            args=(self.stream_id, self.process, self.metrics),
+            daemon=True
+        )
+        monitor_thread.start()
+
+        progress_thread = threading.Thread(
+            target=monitor_ffmpeg_progress,
+            args=(self.metrics, self.process),
+            daemon=True
+        )
+        progress_thread.start()
+
+        logger.info(f"FFmpeg [{self.stream_id}] started with PID: {self.process.pid}")
+
+    def _terminate(self):
+        """Terminate the FFmpeg process, keeping its output. Caller holds the process lock."""
+        process = self.process
+        self.process = None
+
+        if process:
+            logger.info(f"Stopping FFmpeg [{self.stream_id}]...")
+            try:
+                process.terminate()
+                process.wait(timeout=5)
+                logger.info(f"FFmpeg [{self.stream_id}] terminated successfully")
+            except subprocess.TimeoutExpired:
+                logger.warning(f"FFmpeg [{self.stream_id}] did not terminate, forcing kill")
+                process.kill()
+            except Exception as e:
+                logger.error(f"Error stopping FFmpeg [{self.stream_id}]: {str(e)}")
+
+    def _check_health(self):
+        """
+        Check whether FFmpeg needs restarting.
+
+        Returns:
+            str: Reason to restart, or None if the process is healthy
+        """
+        process = self.process
+        if process is None:
+            return "is not running"
+        if process.poll() is not None:
+            return f"exited with code {process.returncode}"
+
+        last_output = self.launched_at
+        try:
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    # The overlay layer is written by us, not FFmpeg
+                    if not entry.name.startswith(LAYER_FILENAME):
+                        last_output = max(last_output, entry.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+
+        if time.time() - last_output > Config.STREAM_STALL_TIMEOUT_SECONDS:
+            return f"wrote no output for {Config.STREAM_STALL_TIMEOUT_SECONDS:g}s"
+        return None
+
+    def _supervise(self):
+        """
+        Restart FFmpeg whenever it exits or stalls, until the session is stopped.
+        Consecutive failures back off exponentially; the jitter keeps streams
+        from one dropped camera network from all reconnecting at once.
+        """
+        failures = 0
+        check_interval = min(1.0, Config.STREAM_STALL_TIMEOUT_SECONDS / 4)
+
+        while not self._stopped.wait(check_interval):
+            self.is_ready()
+            if self.dvr:
+                try:
+                    self.dvr.refresh()
+                except Exception as e:
+                    logger.error(f"Error updating DVR index [{self.stream_id}]: {str(e)}")
+            if self.recorder:
+                try:
+                    self.recorder.refresh()
+                except Exception as e:
+                    logger.error(f"Error recording segments [{self.stream_id}]: {str(e)}")
+
+            reason = self._check_health()
+            if reason is None:
+                if failures and time.time() - self.launched_at > Config.STREAM_RESTART_RESET_SECONDS:
+                    failures = 0
+                continue
+
+            failures += 1
+            delay = min(
+                Config.STREAM_RESTART_BACKOFF_MAX_SECONDS,
+                Config.STREAM_RESTART_BACKOFF_SECONDS * 2 ** (failures - 1)
+            )
+            delay = random.uniform(delay / 2, delay)
+            self.last_failure = reason
+            logger.warning(
+                f"FFmpeg [{self.stream_id}] {reason}, restarting in {delay:.1f}s "
+                f"(attempt {failures})"
+            )
+
+            with self._process_lock:
+                self._terminate()
+            if self._stopped.wait(delay):
+                break
+
+            with self._process_lock:
+                if self._stopped.is_set():
+                    break
+                self.restart_count += 1
+                try:
+                    self._launch()
+                except Exception as e:
+                    # Left without a process, so the next check retries with a longer delay
+                    logger.error(f"Failed to restart FFmpeg [{self.stream_id}]: {str(e)}")
+
+    def to_dict(self):
+        """Serialize session state for API responses."""
+        return {
+            'stream_id': self.stream_id,
+            'rtsp_url': self.rtsp_url,
+            'active': self.is_active(),
+            'ready': self.is_ready(),
+            'proxy': False,
+            'pinned': self.pinned,
+            'viewers': self.viewers,
+            'low_latency': self.low_latency,
+            'abr': self.abr,
+            'burn_overlays': self.burn_overlays,
+            'dvr': self.dvr.window() if self.dvr else None,
+            'recording': self.recorder is not None,
+            'renditions': [rendition['name'] for rendition in self.renditions],
+            'codec_mode': self.codec_mode,
+            'codec_plan': self.codec_plan,
+            'source_codecs': self.source_codecs,
+            'pid': self.process.pid if self.process else None,
+            'restarts': self.restart_count,
+            'last_failure': self.last_failure,
+            'startedAt': self.started_at.isoformat() if self.started_at else None
+        }
+
+
+class StreamManager:
+    """
+    Thread-safe registry of stream sessions keyed by stream ID.
+
+    Sessions are shared between viewers of the same normalized RTSP URL and
+    output mode, and reference counted; the last viewer leaving schedules teardown after
+    the configured grace period. Pre-warmed sessions are pinned and keep
+    running without viewers. HTTP(S) HLS sources are registered as
+    ProxySession relays and shared per upstream URL the same way.
+    """
+
+    def __init__(self, max_streams, idle_grace_seconds):
+        self.max_streams = max_streams
+        self.idle_grace_seconds = idle_grace_seconds
+        self._streams = {}
+        self._by_key = {}
+        # Streams being launched outside the lock: stream ID -> (share key, Event set when done)
+        self._starting = {}
+        self._lock = threading.RLock()
+
+    def start(self, rtsp_url, stream_id=None, options=None):
+        """
+        Attach a viewer to an RTSP source, starting FFmpeg only if needed.
+        An http(s) HLS URL starts or joins a relay of it instead.
+
+        Without a stream_id, an existing stream for the same normalized URL
+        and output mode is reused. With a stream_id, that stream is joined if
+        it already serves them and restarted with the new settings otherwise.
+
+        Args:
+            rtsp_url (str): RTSP source URL, or http(s) HLS playlist URL to relay
+            stream_id (str): Optional client-chosen ID; generated when omitted
+            options (dict): Result of parse_stream_options; defaults when omitted.
+                codec_mode is ignored when joining a running stream; record
+                starts recording it
+
+        Returns:
+            StreamSession: The running session, or a ProxySession for relays
+
+        Raises:
+            ValueError: If stream_id is malformed, or a relay is given output
+                options or a host that is not allowed
+            StreamLimitError: If the concurrent stream limit is reached
+        """
+        if stream_id is not None:
+            validate_stream_id(stream_id)
+        if options is None:
+            options = parse_stream_options({})
+        proxy = rtsp_url.startswith(('http://', 'https://'))
+        if proxy:
+            relay_options = [name for name in PROXY_UNSUPPORTED_OPTIONS if options[name]]
+            if relay_options:
+                raise ValueError(f"{', '.join(relay_options)} not supported for HTTP(S) sources")
+            validate_source_url(rtsp_url)
+            key = proxy_share_key(rtsp_url)
+        else:
+            key = share_key(normalize_rtsp_url(rtsp_url), options)
+
+        # Probe outside the lock: it can take seconds and must not block other streams
+        source_codecs = None
+        if not proxy and (options['codec_mode'] == 'auto' or options['abr'] or options['burn_overlays']):
+            with self._lock:
+                stream_id, existing = self._find_shared(key, stream_id)
+            if existing is None:
+                source_codecs = probe_source_codecs(rtsp_url)
+
+        while True:
+            with self._lock:
+                stream_id, existing = self._find_shared(key, stream_id)
+                if existing:
+                    # An exited process is already being restarted by the session's supervisor
+                    if options['record']:
+                        existing.start_recording()
+                    return self._acquire(existing)
+
+                pending = self._pending_start(key, stream_id)
+                replaced = None
+                if pending is None:
+                    replaced = self._streams.get(stream_id) if stream_id else None
+                    if replaced is None:
+                        # Streams waiting to be restarted by their supervisor still hold a slot
+                        if len(self._streams) + len(self._starting) >= self.max_streams:
+                            raise StreamLimitError(
+                                f"Maximum of {self.max_streams} concurrent streams reached"
+                            )
+                        stream_id = stream_id or uuid.uuid4().hex[:12]
+                        started = threading.Event()
+                        self._starting[stream_id] = (key, started)
+                        break
+
+                    logger.info(f"Replacing existing stream: {stream_id}")
+                    self._remove(replaced)
+
+            if pending is not None:
+                # Another request is launching this stream; join or replace it once it is up
+                pending.wait()
+                continue
+            # Stopping waits for FFmpeg to exit, so it runs outside the lock. The
+            # replacement reuses the stream directory and starts only afterwards.
+            replaced.stop()
+
+        # Launching (and stopping after a failed launch) can take seconds, so only
+        # the reservation is held meanwhile and find() keeps serving other streams
+        session = None
+        try:
+            if proxy:
+                session = ProxySession(stream_id, rtsp_url)
+            else:
+                session = StreamSession(stream_id, rtsp_url, options, source_codecs=source_codecs)
+            session.start()
+        except Exception:
+            if session is not None:
+                session.stop()
+            with self._lock:
+                del self._starting[stream_id]
+            started.set()
+            raise
+
+        with self._lock:
+            del self._starting[stream_id]
+            self._streams[stream_id] = session
+            self._by_key[key] = stream_id
+            self._acquire(session)
+        started.set()
+        return session
+
+    def stop(self, stream_id, force=False):
+        """
+        Detach a viewer from a stream.
+        FFmpeg is stopped once no viewers remain and the grace period elapses.
+
+        Args:
+            stream_id (str): Stream ID
+            force (bool): Stop immediately regardless of remaining viewers
+
+        Raises:
+            LookupError: If no stream exists with this ID
+        """
+        with self._lock:
+            session = self._streams.get(stream_id)
+            if session is None:
+                raise LookupError(f"Stream not found: {stream_id}")
+
+            session.viewers = max(session.viewers - 1, 0)
+            if not force and (session.viewers > 0 or session.pinned):
+                logger.info(f"Viewer left stream {stream_id}, {session.viewers} remaining")
+                return
+
+            if not force and self.idle_grace_seconds > 0:
+                if session.teardown_timer is None:
+                    logger.info(
+                        f"Last viewer left stream {stream_id}, "
+                        f"stopping in {self.idle_grace_seconds}s"
+                    )
+                    session.teardown_timer = threading.Timer(
+                        self.idle_grace_seconds,
+                        self._expire,
+                        args=(session,)
+                    )
+                    session.teardown_timer.daemon = True
+                    session.teardown_timer.start()
+                return
+
+            self._remove(session)
+
+        session.stop()
+
+    def prewarm(self, streams):
+        """
+        Start streams in the background and keep them running without
+        viewers, so the first viewer of these cameras joins a transcoder
+        that is already connected and writing segments. They are joined like
+        any other stream with default options and hold a concurrent stream
+        slot. Failures are logged; the supervisor keeps retrying streams
+        whose FFmpeg exits.
+
+        Args:
+            streams (list): (stream_id, url) tuples from parse_prewarm_streams
+        """
+        def run():
+            for stream_id, url in streams:
+                try:
+                    session = self.start(url, stream_id=stream_id)
+                except Exception as e:
+                    logger.error(f"Failed to pre-warm stream {stream_id}: {str(e)}")
+                    continue
+                with self._lock:
+                    # Pinned instead of counted as a viewer
+                    session.pinned = True
+                    session.viewers = max(session.viewers - 1, 0)
+                logger.info(f"Pre-warmed stream {stream_id}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_all(self):
+        """Stop every registered stream."""
+        with self._lock:
+            sessions = list(self._streams.values())
+            for session in sessions:
+                self._remove(session)
+
+        for session in sessions:
+            session.stop()
+
+    def find(self, stream_id):
+        """Return the session for a stream ID, or None if it is not registered."""
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def get(self, stream_id):
+        """
+        Look up a stream session.
+
+        Raises:
+            LookupError: If no stream exists with this ID
+        """
+        session = self.find(stream_id)
+        if session is None:
+            raise LookupError(f"Stream not found: {stream_id}")
+
+        return session
+
+    def list(self):
+        """Return all registered sessions, oldest first."""
+        with self._lock:
+            return list(self._streams.values())
+
+    def _find_shared(self, key, stream_id):
+        """
+        Resolve the stream a viewer should join. Caller holds the lock.
+
+        Returns:
+            tuple: (stream_id or None, StreamSession serving the key or None)
+        """
+        if stream_id is None:
+            stream_id = self._by_key.get(key)
+
+        existing = self._streams.get(stream_id) if stream_id else None
+        if existing and existing.share_key == key:
+            return stream_id, existing
+        return stream_id, None
+
+    def _pending_start(self, key, stream_id):
+        """
+        Return the Event of a launch in progress that this request must wait
+        for: one for the same stream ID, or for the same key when no ID was
+        given. None if there is none. Caller holds the lock.
+        """
+        if stream_id is not None:
+            pending = self._starting.get(stream_id)
+            return pending[1] if pending else None
+        for pending_key, started in self._starting.values():
+            if pending_key == key:
+                return started
+        return None
+
+    def _acquire(self, session):
+        """Add a viewer, cancelling any pending teardown. Caller holds the lock."""
+        if session.teardown_timer:
+            session.teardown_timer.cancel()
+            session.teardown_timer = None
+        session.viewers += 1
+        logger.info(f"Viewer joined stream {session.stream_id}, {session.viewers} total")
+        return session
+
+    def _remove(self, session):
+        """Unregister a session without stopping it. Caller holds the lock."""
+        if session.teardown_timer:
+            session.teardown_timer.cancel()
+            session.teardown_timer = None
+        self._streams.pop(session.stream_id, None)
+        if self._by_key.get(session.share_key) == session.stream_id:
+            del self._by_key[session.share_key]
+
+    def _expire(self, session):
+        """Grace period elapsed: stop the session if it is still unused."""
+        with self._lock:
+            if self._streams.get(session.stream_id) is not session or session.viewers > 0:
+                return
+            self._remove(session)
+
+        logger.info(f"Grace period elapsed, stopping idle stream {session.stream_id}")
+        session.stop()
+
+
+stream_manager = StreamManager(
+    Config.MAX_CONCURRENT_STREAMS,
+    Config.STREAM_IDLE_GRACE_SECONDS
+)
@@ -0,0 +1,255 @@
+"""
+Per-stream FFmpeg performance metrics.
+FFmpeg runs with -progress writing key=value blocks to stdout; these are
+parsed into metrics that show whether a camera's transcode keeps up with
+real time, and rendered for the JSON API and Prometheus. Relayed HTTP(S)
+sources run no FFmpeg and count their upstream fetches instead.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+# FFmpeg logs "Opening '<file>' for writing" each time the HLS muxer starts a file
+OPENING_FILE = re.compile(r"Opening '([^']+)' for writing")
+# The trailing sequence number distinguishes segments of the same output
+SEGMENT_SEQUENCE = re.compile(r'\d+(?=\.(ts|m4s)$)')
+
+logger = logging.getLogger(__name__)
+
+
+class StreamMetrics:
+    """Thread-safe metrics for the current FFmpeg process of one stream."""
+
+    def __init__(self, segment_duration):
+        self.segment_duration = segment_duration
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clear all values when a new FFmpeg process is launched."""
+        with self._lock:
+            self.frames = 0
+            self.fps = 0.0
+            self.speed = None
+            self.bitrate_kbps = None
+            self.total_bytes = 0
+            self.out_time_seconds = 0.0
+            self.dropped_frames = 0
+            self.duplicated_frames = 0
+            self.encode_lag_seconds = 0.0
+            self.segments_written = 0
+            self.segment_write_latency_seconds = None
+            self.updated_at = None
+            self._progress_origin = None
+            self._last_segment_opened = {}
+
+    def update_progress(self, fields):
+        """
+        Apply one -progress block.
+
+        Args:
+            fields (dict): Key/value pairs FFmpeg printed before 'progress='
+        """
+        now = time.monotonic()
+        out_time = _parse_float(fields.get('out_time_us'))
+        with self._lock:
+            self.frames = _parse_int(fields.get('frame'), self.frames)
+            self.fps = _parse_float(fields.get('fps'), self.fps)
+            self.speed = _parse_float(fields.get('speed', '').rstrip('x'), self.speed)
+            self.bitrate_kbps = _parse_float(fields.get('bitrate', '').replace('kbits/s', ''), self.bitrate_kbps)
+            self.total_bytes = _parse_int(fields.get('total_size'), self.total_bytes)
+            self.dropped_frames = _parse_int(fields.get('drop_frames'), self.dropped_frames)
+            self.duplicated_frames = _parse_int(fields.get('dup_frames'), self.duplicated_frames)
+
+            if out_time is not None and out_time > 0:
+                self.out_time_seconds = out_time / 1000000
+                # Measured from the first output so connection setup doesn't count as lag
+                if self._progress_origin is None:
+                    self._progress_origin = (now, self.out_time_seconds)
+                started, origin_out_time = self._progress_origin
+                self.encode_lag_seconds = max(
+                    (now - started) - (self.out_time_seconds - origin_out_time), 0.0
+                )
+            self.updated_at = time.time()
+
+    def record_file_opened(self, path):
+        """
+        Track segment writes from FFmpeg's "Opening ... for writing" log lines.
+        A segment is complete when the next one of the same output is opened;
+        latency is how much longer than its target duration that took.
+        """
+        name = os.path.basename(path)
+        if name.endswith('.tmp'):
+            name = name[:-len('.tmp')]
+        if not SEGMENT_SEQUENCE.search(name):
+            return
+
+        output = SEGMENT_SEQUENCE.sub('', name)
+        now = time.monotonic()
+        with self._lock:
+            previous = self._last_segment_opened.get(output)
+            self._last_segment_opened[output] = now
+            if previous is not None:
+                self.segments_written += 1
+                self.segment_write_latency_seconds = max(now - previous - self.segment_duration, 0.0)
+
+    def to_dict(self):
+        """Serialize metrics for API responses."""
+        with self._lock:
+            return {
+                'frames': self.frames,
+                'fps': self.fps,
+                'speed': self.speed,
+                'bitrate_kbps': self.bitrate_kbps,
+                'total_bytes': self.total_bytes,
+                'out_time_seconds': self.out_time_seconds,
+                'dropped_frames': self.dropped_frames,
+                'duplicated_frames': self.duplicated_frames,
+                'encode_lag_seconds': round(self.encode_lag_seconds, 3),
+                'segments_written': self.segments_written,
+                'segment_write_latency_seconds': (
+                    round(self.segment_write_latency_seconds, 3)
+                    if self.segment_write_latency_seconds is not None else None
+                ),
+                'updated_at': self.updated_at
+            }
+
+
+class RelayMetrics:
+    """Thread-safe upstream fetch counters of one relayed HTTP(S) source."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.upstream_fetches = 0
+        self.upstream_bytes = 0
+        self.upstream_errors = 0
+        self.updated_at = None
+
+    def record_fetch(self, size):
+        """Count a playlist or segment fetched from upstream."""
+        with self._lock:
+            self.upstream_fetches += 1
+            self.upstream_bytes += size
+            self.updated_at = time.time()
+
+    def record_error(self):
+        """Count a failed upstream fetch."""
+        with self._lock:
+            self.upstream_errors += 1
+            self.updated_at = time.time()
+
+    def to_dict(self):
+        """Serialize metrics for API responses."""
+        with self._lock:
+            return {
+                'upstream_fetches': self.upstream_fetches,
+                'upstream_bytes': self.upstream_bytes,
+                'upstream_errors': self.upstream_errors,
+                'updated_at': self.updated_at
+            }
+
+
+def monitor_ffmpeg_progress(metrics, process):
+    """
+    Read -progress output from FFmpeg's stdout until the process exits.
+
+    Args:
+        metrics (StreamMetrics): Metrics to update
+        process (subprocess.Popen): FFmpeg process started with -progress pipe:1
+    """
+    fields = {}
+    try:
+        for line in process.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'progress':
+                metrics.update_progress(fields)
+                fields = {}
+            elif key:
+                fields[key] = value.strip()
+    except Exception as e:
+        logger.error(f"Error reading FFmpeg progress (PID {process.pid}): {str(e)}")
+
+
+def render_prometheus(sessions, cache_stats, raster_stats, storage_stats, snapshot_stats, recording_stats, proxy_stats):
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        sessions (list): StreamSession and ProxySession objects
+        cache_stats (dict): Result of SegmentCache.stats()
+        raster_stats (dict): Result of OverlayRasterCache.stats()
+        storage_stats (dict): Result of SegmentStorage.stats()
+        snapshot_stats (dict): Result of SnapshotCache.stats()
+        recording_stats (dict): Result of RecordingPool.stats()
+        proxy_stats (dict): Result of UpstreamPool.stats()
+
+    Returns:
+        str: Exposition text
+    """
+    # Series a session's metrics do not include are left out for it, so
+    # relays report only their upstream counters and FFmpeg streams only theirs
+    stream_metrics = [
+        ('rtsp_stream_up', 'gauge', 'Whether FFmpeg is running or the relay is registered', lambda s, m: int(s.is_active())),
+        ('rtsp_stream_viewers', 'gauge', 'Attached viewers', lambda s, m: s.viewers),
+        ('rtsp_stream_restarts_total', 'counter', 'FFmpeg restarts by the supervisor', lambda s, m: None if s.proxy else s.restart_count),
+        ('rtsp_stream_fps', 'gauge', 'Output frames per second', lambda s, m: m.get('fps')),
+        ('rtsp_stream_speed', 'gauge', 'Processing speed relative to real time', lambda s, m: m.get('speed')),
+        ('rtsp_stream_bitrate_kbps', 'gauge', 'Output bitrate in kbit/s', lambda s, m: m.get('bitrate_kbps')),
+        ('rtsp_stream_frames', 'gauge', 'Frames output by the current FFmpeg process', lambda s, m: m.get('frames')),
+        ('rtsp_stream_dropped_frames', 'gauge', 'Frames dropped by the current FFmpeg process', lambda s, m: m.get('dropped_frames')),
+        ('rtsp_stream_duplicated_frames', 'gauge', 'Frames duplicated by the current FFmpeg process', lambda s, m: m.get('duplicated_frames')),
+        ('rtsp_stream_encode_lag_seconds', 'gauge', 'Seconds the output has fallen behind real time', lambda s, m: m.get('encode_lag_seconds')),
+        ('rtsp_stream_segment_write_latency_seconds', 'gauge', 'Seconds the last segment took beyond its target duration', lambda s, m: m.get('segment_write_latency_seconds')),
+        ('rtsp_stream_upstream_fetches_total', 'counter', 'Playlists and segments the relay fetched from upstream', lambda s, m: m.get('upstream_fetches')),
+        ('rtsp_stream_upstream_bytes_total', 'counter', 'Bytes the relay fetched from upstream', lambda s, m: m.get('upstream_bytes')),
+        ('rtsp_stream_upstream_errors_total', 'counter', 'Failed upstream fetches of the relay', lambda s, m: m.get('upstream_errors')),
+    ]
+
+    snapshots = [(session, session.metrics.to_dict()) for session in sessions]
+    lines = []
+    for name, metric_type, help_text, value_of in stream_metrics:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for session, metrics in snapshots:
+            value = value_of(session, metrics)
+            if value is not None:
+                lines.append(f'{name}{{stream_id="{session.stream_id}"}} {value}')
+
+    cache_metrics = (
+        ('segment_cache', cache_stats, ('entries', 'bytes', 'hits', 'misses')),
+        ('overlay_raster_cache', raster_stats, ('sources', 'rasters', 'bytes', 'hits', 'misses')),
+        ('stream_storage', storage_stats, ('bytes', 'evicted_segments', 'evicted_bytes')),
+        ('snapshot_cache', snapshot_stats, ('entries', 'bytes', 'hits', 'misses')),
+        ('recording_jobs', recording_stats, ('pending', 'completed', 'failed')),
+        ('hls_proxy_upstream', proxy_stats, ('requests', 'reused_connections', 'fetched_bytes')),
+    )
+    counters = (
+        'hits', 'misses', 'evicted_segments', 'evicted_bytes', 'completed', 'failed',
+        'requests', 'reused_connections', 'fetched_bytes'
+    )
+    for prefix, stats, keys in cache_metrics:
+        for key in keys:
+            metric_type = 'counter' if key in counters else 'gauge'
+            name = f'{prefix}_{key}' + ('_total' if metric_type == 'counter' else '')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {stats[key]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _parse_float(value, default=None):
+    """Parse a float, returning default for missing values and FFmpeg's 'N/A'."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_int(value, default=0):
+    """Parse an int, returning default for missing values and FFmpeg's 'N/A'."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
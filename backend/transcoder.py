@@ -0,0 +1,522 @@
+"""
+FFmpeg command construction and RTSP source probing.
+Decides per stream whether codecs can be remuxed as-is or must be transcoded,
+and builds single-rendition or adaptive bitrate (ABR) ladder outputs.
+"""
+import json
+import logging
+import os
+import re
+import subprocess
+from config import Config
+import ll_hls
+
+logger = logging.getLogger(__name__)
+
+CODEC_MODES = ('auto', 'copy', 'transcode')
+
+# Codecs that can be carried in MPEG-TS HLS segments without re-encoding
+HLS_VIDEO_CODECS = {'h264'}
+HLS_AUDIO_CODECS = {'aac', 'mp3'}
+
+RENDITION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Segment length and playlist size of standard, ABR and DVR output
+SEGMENT_SECONDS = 2
+LIVE_LIST_SIZE = 5
+DVR_LIST_SIZE = 10  # Only needs to cover the gap between DVR index refreshes
+
+
+def validate_codec_mode(codec_mode):
+    """
+    Validate a codec mode.
+
+    Raises:
+        ValueError: If the mode is not one of CODEC_MODES
+    """
+    if codec_mode not in CODEC_MODES:
+        raise ValueError(f"Invalid codec mode. Must be one of: {', '.join(CODEC_MODES)}")
+
+
+def probe_source_codecs(rtsp_url):
+    """
+    Probe an RTSP source with ffprobe to find its first video and audio codecs
+    and the video resolution.
+
+    Args:
+        rtsp_url (str): RTSP source URL
+
+    Returns:
+        dict: {'video': str or None, 'audio': str or None, 'width': int or None,
+            'height': int or None}, or None if probing failed
+    """
+    probe_cmd = [
+        Config.FFPROBE_PATH,
+        '-v', 'error',
+        # Same transport and analysis limits as the FFmpeg that follows
+        *build_rtsp_input_args(),
+        '-show_entries', 'stream=codec_type,codec_name,width,height',
+        '-of', 'json',
+        rtsp_url
+    ]
+
+    try:
+        result = subprocess.run(
+            probe_cmd,
+            capture_output=True,
+            text=True,
+            timeout=Config.PROBE_TIMEOUT_SECONDS
+        )
+    except FileNotFoundError:
+        logger.warning("ffprobe not found, falling back to transcoding")
+        return None
+    except subprocess.TimeoutExpired:
+        logger.warning(f"ffprobe timed out after {Config.PROBE_TIMEOUT_SECONDS}s: {rtsp_url}")
+        return None
+
+    if result.returncode != 0:
+        logger.warning(f"ffprobe failed for {rtsp_url}: {result.stderr.strip()}")
+        return None
+
+    try:
+        streams = json.loads(result.stdout).get('streams', [])
+    except ValueError:
+        logger.warning(f"Could not parse ffprobe output for {rtsp_url}")
+        return None
+
+    codecs = {'video': None, 'audio': None, 'width': None, 'height': None}
+    for stream in streams:
+        codec_type = stream.get('codec_type')
+        if codec_type in ('video', 'audio') and codecs[codec_type] is None:
+            codecs[codec_type] = stream.get('codec_name')
+            if codec_type == 'video':
+                codecs['width'] = stream.get('width')
+                codecs['height'] = stream.get('height')
+
+    logger.info(f"Probed {rtsp_url}: video={codecs['video']}, audio={codecs['audio']}")
+    return codecs
+
+
+def select_codec_plan(codec_mode, source_codecs, low_latency=False):
+    """
+    Decide per media type whether to stream-copy or transcode.
+
+    Args:
+        codec_mode (str): 'auto', 'copy' or 'transcode'
+        source_codecs (dict): Result of probe_source_codecs, or None
+        low_latency (bool): Low-latency output needs keyframes at every part
+            boundary, so 'auto' transcodes video instead of copying
+
+    Returns:
+        dict: {'video': 'copy' or 'transcode', 'audio': 'copy' or 'transcode'}
+    """
+    if codec_mode == 'copy':
+        return {'video': 'copy', 'audio': 'copy'}
+
+    if codec_mode == 'transcode' or not source_codecs:
+        return {'video': 'transcode', 'audio': 'transcode'}
+
+    video_copyable = source_codecs.get('video') in HLS_VIDEO_CODECS and not low_latency
+    return {
+        'video': 'copy' if video_copyable else 'transcode',
+        # A source without audio has nothing to encode, so copying is free
+        'audio': 'copy' if source_codecs.get('audio') in HLS_AUDIO_CODECS | {None} else 'transcode'
+    }
+
+
+def parse_abr_ladder(spec):
+    """
+    Parse an ABR ladder specification.
+
+    Args:
+        spec (str): Comma-separated 'name:height:video_bitrate' entries,
+            e.g. '1080p:1080:5000k,720p:720:2800k'
+
+    Returns:
+        list: Rendition dicts with name, height and bitrate, tallest first
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    renditions = []
+    for entry in spec.split(','):
+        try:
+            name, height, bitrate = entry.strip().split(':')
+            renditions.append({'name': name, 'height': int(height), 'bitrate': bitrate})
+        except ValueError:
+            raise ValueError(f"Invalid ABR ladder entry: {entry!r}")
+        # Names become playlist filenames
+        if not RENDITION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid ABR rendition name: {name!r}")
+
+    return sorted(renditions, key=lambda rendition: rendition['height'], reverse=True)
+
+
+def select_renditions(source_codecs):
+    """
+    Pick the ladder renditions worth producing for a source.
+    Renditions taller than the source are dropped, keeping at least one.
+
+    Args:
+        source_codecs (dict): Result of probe_source_codecs, or None
+
+    Returns:
+        list: Rendition dicts, tallest first
+    """
+    ladder = parse_abr_ladder(Config.ABR_LADDER)
+    source_height = (source_codecs or {}).get('height')
+    if not source_height:
+        return ladder
+
+    renditions = [rendition for rendition in ladder if rendition['height'] <= source_height]
+    return renditions or ladder[-1:]
+
+
+def _bitrate_to_bps(bitrate):
+    """Convert an FFmpeg bitrate string such as '2800k' or '5M' to bits per second."""
+    multipliers = {'k': 1000, 'm': 1000000}
+    suffix = bitrate[-1].lower()
+    if suffix in multipliers:
+        return int(float(bitrate[:-1]) * multipliers[suffix])
+    return int(bitrate)
+
+
+def write_master_playlist(session):
+    """
+    Write the master playlist listing every rendition of an ABR session.
+    Written before FFmpeg starts, so players can load it immediately.
+
+    Args:
+        session (StreamSession): ABR session
+    """
+    source = session.source_codecs or {}
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+
+    for rendition in session.renditions:
+        bandwidth = _bitrate_to_bps(rendition['bitrate'])
+        if source.get('audio') or not source:
+            bandwidth += _bitrate_to_bps('128k')
+        attributes = f'BANDWIDTH={bandwidth}'
+        if source.get('width') and source.get('height'):
+            # Matches FFmpeg's scale=-2:<height>, which keeps the width even
+            width = round(source['width'] * rendition['height'] / source['height'] / 2) * 2
+            attributes += f',RESOLUTION={width}x{rendition["height"]}'
+        lines.append(f'#EXT-X-STREAM-INF:{attributes}')
+        lines.append(f'{rendition["name"]}.m3u8')
+
+    with open(session.playlist_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def keyframe_expression(interval, initial_interval=0, initial_count=0):
+    """
+    Build a -force_key_frames expression.
+
+    Args:
+        interval (float): Seconds between keyframes
+        initial_interval (float): Seconds between the first initial_count
+            keyframes, to match -hls_init_time (optional)
+        initial_count (int): Keyframes placed at initial_interval
+
+    Returns:
+        str: FFmpeg -force_key_frames value
+    """
+    if not initial_interval or not initial_count:
+        return f'expr:gte(t,n_forced*{interval:g})'
+    initial_window = initial_interval * initial_count
+    return (
+        f'expr:if(lt(t,{initial_window:g}),gte(t,n_forced*{initial_interval:g}),'
+        f'gte(t,{initial_window:g}+(n_forced-{initial_count})*{interval:g}))'
+    )
+
+
+def segment_keyframe_expression(list_size):
+    """
+    Keyframes on every segment boundary. FFmpeg's -hls_init_time applies
+    until the first playlist is full, so that many short segments come first.
+    """
+    return keyframe_expression(SEGMENT_SECONDS, Config.HLS_INIT_SEGMENT_SECONDS, list_size)
+
+
+def build_init_segment_args():
+    """Shorten the first playlist's segments so the first one is playable sooner."""
+    if not Config.HLS_INIT_SEGMENT_SECONDS:
+        return []
+    return ['-hls_init_time', f'{Config.HLS_INIT_SEGMENT_SECONDS:g}']
+
+
+def build_rtsp_input_args():
+    """
+    RTSP input options. A smaller probesize and analyzeduration than FFmpeg's
+    defaults (5 MB, 5 s) let it start writing output sooner after connecting.
+    """
+    args = ['-rtsp_transport', 'tcp']  # Use TCP for reliability
+    if Config.RTSP_PROBESIZE:
+        args += ['-probesize', str(Config.RTSP_PROBESIZE)]
+    if Config.RTSP_ANALYZEDURATION_MS:
+        args += ['-analyzeduration', str(Config.RTSP_ANALYZEDURATION_MS * 1000)]  # Microseconds
+    return args
+
+
+def build_codec_args(codec_plan, force_key_frames=None):
+    """
+    Build FFmpeg codec arguments for a codec plan.
+
+    Args:
+        codec_plan (dict): Result of select_codec_plan
+        force_key_frames (str): -force_key_frames expression applied when
+            transcoding video (optional)
+
+    Returns:
+        list: FFmpeg codec arguments
+    """
+    if codec_plan['video'] == 'copy':
+        video_args = ['-c:v', 'copy']
+    else:
+        video_args = [
+            '-c:v', 'libx264',  # Video codec
+            '-preset', 'ultrafast',  # Prioritize speed over compression
+            '-tune', 'zerolatency'  # Minimize latency
+        ]
+        if force_key_frames:
+            video_args += ['-force_key_frames', force_key_frames]
+
+    if codec_plan['audio'] == 'copy':
+        audio_args = ['-c:a', 'copy']
+    else:
+        audio_args = [
+            '-c:a', 'aac',  # Audio codec
+            '-b:a', '128k'  # Audio bitrate
+        ]
+
+    return video_args + audio_args
+
+
+def build_hls_output_args(session):
+    """
+    Build the HLS muxer arguments for a session's output mode.
+
+    Standard mode writes 2-second MPEG-TS segments, the first playlist's
+    shortened to HLS_INIT_SEGMENT_SECONDS. Low-latency mode writes short
+    fMP4/CMAF parts that ll_hls groups into an LL-HLS playlist. DVR mode
+    keeps segments for dvr to index and delete.
+
+    After a supervisor restart the new output continues the existing
+    playlist behind an EXT-X-DISCONTINUITY tag, so players keep going
+    without a reload.
+
+    Args:
+        session (StreamSession): Session to build the arguments for
+
+    Returns:
+        list: FFmpeg output arguments
+    """
+    restarted = session.restart_count > 0
+
+    if session.low_latency:
+        # LL-HLS segments are groups of parts, so the first new part must start a segment
+        start_args = ['-start_number', str(next_ll_hls_part(session.output_dir))] if restarted else []
+        return start_args + [
+            '-f', 'hls',
+            '-hls_time', str(Config.LL_HLS_PART_DURATION),  # One HLS segment per LL-HLS part
+            '-hls_list_size', str(Config.LL_HLS_PARTS_PER_SEGMENT * 6),
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', ll_hls.INIT_SEGMENT,
+            # temp_file renames finished parts into place so readers never see partial files
+            '-hls_flags', 'delete_segments+independent_segments+temp_file'
+            + ('+discont_start' if restarted else ''),
+            '-hls_segment_filename', os.path.join(session.output_dir, ll_hls.PART_PATTERN),
+            os.path.join(session.output_dir, ll_hls.PARTS_PLAYLIST)
+        ]
+
+    if session.dvr:
+        # Segments stay until they leave the DVR window; dvr.DvrIndex deletes them
+        return [
+            '-f', 'hls',
+            '-hls_time', str(SEGMENT_SECONDS),
+            *build_init_segment_args(),
+            '-hls_list_size', str(DVR_LIST_SIZE),
+            '-hls_flags', 'program_date_time+append_list' + ('+discont_start' if restarted else ''),
+            '-hls_segment_filename', session.segment_pattern,
+            session.live_playlist_path
+        ]
+
+    return [
+        '-f', 'hls',  # Output format HLS
+        '-hls_time', str(SEGMENT_SECONDS),
+        *build_init_segment_args(),
+        '-hls_list_size', str(LIVE_LIST_SIZE),
+        # Auto-delete old segments; append_list continues numbering after a restart
+        '-hls_flags', 'delete_segments+append_list' + ('+discont_start' if restarted else ''),
+        '-hls_segment_filename', session.segment_pattern,
+        session.playlist_path
+    ]
+
+
+def next_ll_hls_part(output_dir):
+    """
+    Return the part number a restarted low-latency stream should start at:
+    the first part of the segment after the last one FFmpeg wrote.
+
+    Args:
+        output_dir (str): Stream output directory
+
+    Returns:
+        int: Part sequence number
+    """
+    parts = ll_hls.read_parts(output_dir)
+    if not parts:
+        return 0
+    per_segment = Config.LL_HLS_PARTS_PER_SEGMENT
+    return (parts[-1][0] // per_segment + 1) * per_segment
+
+
+def build_abr_args(session):
+    """
+    Build codec and HLS arguments for an ABR ladder.
+
+    The source is decoded once and split into one scaled branch per
+    rendition; FFmpeg's var_stream_map writes each as its own media playlist.
+    Keyframes are forced on segment boundaries so renditions stay aligned
+    for switching.
+
+    Args:
+        session (StreamSession): ABR session
+
+    Returns:
+        list: FFmpeg arguments following the input
+    """
+    renditions = session.renditions
+    # Without a successful probe, assume the camera sends audio
+    has_audio = session.source_codecs is None or session.source_codecs.get('audio') is not None
+
+    filters = []
+    source = '[0:v]'
+    if session.burn_overlays:
+        filters.append(build_burn_in_filter())
+        source = '[vburn]'
+
+    split_outputs = ''.join(f'[v{index}]' for index in range(len(renditions)))
+    filters.append(f'{source}split={len(renditions)}{split_outputs}')
+    filters += [
+        f'[v{index}]scale=-2:{rendition["height"]}[v{index}out]'
+        for index, rendition in enumerate(renditions)
+    ]
+
+    args = ['-filter_complex', ';'.join(filters)]
+    stream_map = []
+    for index, rendition in enumerate(renditions):
+        args += ['-map', f'[v{index}out]']
+        if has_audio:
+            args += ['-map', '0:a:0']
+        stream_map.append(
+            f'v:{index},a:{index},name:{rendition["name"]}' if has_audio
+            else f'v:{index},name:{rendition["name"]}'
+        )
+
+    args += [
+        '-c:v', 'libx264',
+        '-preset', 'ultrafast',
+        '-tune', 'zerolatency',
+        '-force_key_frames', segment_keyframe_expression(LIVE_LIST_SIZE)
+    ]
+    for index, rendition in enumerate(renditions):
+        bitrate_bps = _bitrate_to_bps(rendition['bitrate'])
+        args += [
+            f'-b:v:{index}', rendition['bitrate'],
+            f'-maxrate:v:{index}', rendition['bitrate'],
+            f'-bufsize:v:{index}', str(bitrate_bps * 2)
+        ]
+
+    if has_audio:
+        args += ['-c:a', 'copy'] if session.codec_plan['audio'] == 'copy' else ['-c:a', 'aac', '-b:a', '128k']
+
+    return args + [
+        '-f', 'hls',
+        '-hls_time', str(SEGMENT_SECONDS),
+        *build_init_segment_args(),
+        '-hls_list_size', str(LIVE_LIST_SIZE),
+        '-hls_flags', 'delete_segments+independent_segments'
+        + ('+append_list+discont_start' if session.restart_count > 0 else ''),
+        '-var_stream_map', ' '.join(stream_map),
+        '-hls_segment_filename', os.path.join(session.output_dir, '%v_segment%03d.ts'),
+        os.path.join(session.output_dir, '%v.m3u8')
+    ]
+
+
+def build_burn_in_input_args(session):
+    """
+    Build the input arguments for a session's overlay layer. The image2
+    demuxer re-opens the file for every frame it loops, so a re-rendered
+    layer is picked up without restarting FFmpeg.
+
+    Args:
+        session (StreamSession): Burn-in session
+
+    Returns:
+        list: FFmpeg input arguments
+    """
+    return [
+        '-f', 'image2',
+        '-loop', '1',
+        '-framerate', str(Config.BURN_IN_LAYER_FPS),
+        '-thread_queue_size', '4',  # Keep few stale layer frames queued
+        '-i', session.overlay_layer_path
+    ]
+
+
+def build_burn_in_filter():
+    """
+    Build the filter that composites the overlay layer (input 1) onto the
+    video (input 0), scaling the layer to the video size. Outputs [vburn].
+
+    Returns:
+        str: filter_complex chain
+    """
+    return '[1:v][0:v]scale2ref[layer][base];[base][layer]overlay=format=auto[vburn]'
+
+
+def build_ffmpeg_command(session):
+    """
+    Build the FFmpeg command line for a stream session.
+
+    Args:
+        session (StreamSession): Session to build the command for
+
+    Returns:
+        list: FFmpeg argument list
+    """
+    input_args = [
+        Config.FFMPEG_PATH,
+        '-nostats',  # Progress is reported through -progress instead
+        '-loglevel', 'level+info',  # Prefix log lines with their level
+        '-progress', 'pipe:1',  # Machine-readable progress on stdout
+        *build_rtsp_input_args(),
+        '-i', session.rtsp_url  # Input RTSP stream
+    ]
+
+    if session.burn_overlays:
+        input_args += build_burn_in_input_args(session)
+
+    if session.abr:
+        return input_args + build_abr_args(session)
+
+    # Keyframes on part or segment boundaries, so each can start playback
+    if session.low_latency:
+        force_key_frames = keyframe_expression(Config.LL_HLS_PART_DURATION)
+    else:
+        force_key_frames = segment_keyframe_expression(DVR_LIST_SIZE if session.dvr else LIVE_LIST_SIZE)
+
+    # The layer input would otherwise be picked up by automatic stream selection
+    burn_in_args = [
+        '-filter_complex', build_burn_in_filter(),
+        '-map', '[vburn]',
+        '-map', '0:a?'
+    ] if session.burn_overlays else []
+
+    return [
+        *input_args,
+        *burn_in_args,
+        *build_codec_args(session.codec_plan, force_key_frames),
+        *build_hls_output_args(session)
+    ]
@@ -0,0 +1,65 @@
+"""
+Checks for URLs the backend fetches on a client's behalf.
+Image overlay sources and relayed HLS playlists are user-supplied URLs, so
+without a check any client could make the backend request loopback,
+link-local (cloud metadata) or internal services. Hosts that resolve to
+non-public addresses are rejected unless the operator allowlists them,
+e.g. cameras on the local network.
+"""
+import ipaddress
+import socket
+import urllib.parse
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def parse_allowed_hosts(spec):
+    """
+    Parse a comma-separated host allowlist from Config.
+
+    Args:
+        spec (str): e.g. 'camera1.lan,10.0.0.5'
+
+    Returns:
+        frozenset: Lowercased hostnames and IP literals
+    """
+    return frozenset(host.strip().lower().strip('[]') for host in (spec or '').split(',') if host.strip())
+
+
+def is_public_address(address):
+    """Return True if an IP address is globally routable."""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_url(url, allowed_hosts=frozenset()):
+    """
+    Make sure a URL may be fetched: http(s) only, and the host either
+    allowlisted or resolving only to public addresses. Call it again for
+    every redirect target.
+
+    Args:
+        url (str): URL about to be requested
+        allowed_hosts (frozenset): Result of parse_allowed_hosts
+
+    Raises:
+        ValueError: If the scheme is unsupported, the host cannot be
+            resolved, or it resolves to a non-public address
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+        raise ValueError(f"Unsupported URL: {url}")
+
+    host = parts.hostname.lower()
+    if host in allowed_hosts:
+        return
+
+    try:
+        addresses = socket.getaddrinfo(host, parts.port or DEFAULT_PORTS[parts.scheme], proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"Could not resolve {host}: {str(e)}")
+    for _, _, _, _, sockaddr in addresses:
+        if not is_public_address(sockaddr[0]):
+            raise ValueError(f"Host {host} resolves to non-public address {sockaddr[0]}; allowlist it to fetch from it")
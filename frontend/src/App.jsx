@@ -2,7 +2,7 @@
  * Main App component for RTSP Livestream Overlay Application.
  * Manages global state and orchestrates child components.
  */
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Toaster } from 'react-hot-toast';
 import toast from 'react-hot-toast';
 import VideoPlayer from './components/VideoPlayer';
@@ -11,17 +11,52 @@ import OverlayList from './components/OverlayList';
 import { overlayAPI } from './services/api';
 import './App.css';
 
+// Updates made within this window, e.g. several overlays dragged in quick
+// succession, are sent to the backend in one bulk request
+const UPDATE_BATCH_MS = 50;
+
 function App() {
   const [overlays, setOverlays] = useState([]);
   const [loading, setLoading] = useState(true);
+  const pendingUpdates = useRef(new Map());
+  const flushTimer = useRef(null);
 
   /**
-   * Fetch overlays from API on component mount
+   * Fetch overlays from API on component mount, then apply changes pushed
+   * by the backend instead of refetching the list
    */
   useEffect(() => {
     fetchOverlays();
+
+    const unsubscribe = overlayAPI.subscribe({
+      onCreated: upsertOverlay,
+      onUpdated: upsertOverlay,
+      onDeleted: removeOverlay,
+      onReset: fetchOverlays,
+    });
+    return unsubscribe;
   }, []);
 
+  /**
+   * Insert or replace an overlay in local state
+   * @param {Object} overlay - Overlay from the backend
+   */
+  const upsertOverlay = (overlay) => {
+    setOverlays((current) =>
+      current.some((item) => item.id === overlay.id)
+        ? current.map((item) => (item.id === overlay.id ? overlay : item))
+        : [...current, overlay]
+    );
+  };
+
+  /**
+   * Remove an overlay from local state
+   * @param {string} id - Overlay ID
+   */
+  const removeOverlay = (id) => {
+    setOverlays((current) => current.filter((overlay) => overlay.id !== id));
+  };
+
   /**
    * Fetch all overlays from backend
    */
@@ -46,7 +81,8 @@ function App() {
     try {
       const response = await overlayAPI.create(overlayData);
       if (response.success) {
-        setOverlays([...overlays, response.overlay]);
+        // The pushed 'created' event may arrive first; upserting avoids a duplicate
+        upsertOverlay(response.overlay);
       }
     } catch (error) {
       throw error;
@@ -54,19 +90,33 @@ function App() {
   };
 
   /**
-   * Update existing overlay
+   * Update existing overlay. Updates are queued briefly and sent together
+   * through the bulk endpoint; later changes to the same overlay are merged
    * @param {string} id - Overlay ID
    * @param {Object} updates - Updated overlay data
    */
-  const handleUpdateOverlay = async (id, updates) => {
+  const handleUpdateOverlay = (id, updates) => {
+    const pending = pendingUpdates.current;
+    pending.set(id, { ...pending.get(id), ...updates });
+    if (!flushTimer.current) {
+      flushTimer.current = setTimeout(flushUpdates, UPDATE_BATCH_MS);
+    }
+  };
+
+  /**
+   * Send all queued overlay updates in one request
+   */
+  const flushUpdates = async () => {
+    const batch = Array.from(pendingUpdates.current, ([id, updates]) => ({ id, ...updates }));
+    pendingUpdates.current = new Map();
+    flushTimer.current = null;
+
     try {
-      const response = await overlayAPI.update(id, updates);
+      const response = await overlayAPI.updateMany(batch);
       if (response.success) {
-        setOverlays(
-          overlays.map((overlay) =>
-            overlay.id === id ? response.overlay : overlay
-          )
-        );
+        response.overlays.forEach(upsertOverlay);
+        // Overlays deleted elsewhere while being edited
+        response.not_found.forEach(removeOverlay);
       }
     } catch (error) {
       toast.error(error.message || 'Failed to update overlay');
@@ -81,7 +131,7 @@ function App() {
     try {
       const response = await overlayAPI.delete(id);
       if (response.success) {
-        setOverlays(overlays.filter((overlay) => overlay.id !== id));
+        removeOverlay(id);
       }
     } catch (error) {
       throw error;
@@ -5,6 +5,7 @@
 import { Rnd } from 'react-rnd';
 import { X } from 'lucide-react';
 import { useState, useEffect, useRef } from 'react';
+import { overlayAPI } from '../services/api';
 
 export default function Overlay({ overlay, onUpdate, onDelete, onSelect, containerDimensions }) {
   const [isSelected, setIsSelected] = useState(false);
@@ -339,7 +340,15 @@ export default function Overlay({ overlay, onUpdate, onDelete, onSelect, contain
           }}
         >
           <img
-            src={overlay.content}
+            src={
+              containerDimensions.width && containerDimensions.height
+                ? overlayAPI.rasterUrl(
+                    overlay,
+                    containerDimensions.width * window.devicePixelRatio,
+                    containerDimensions.height * window.devicePixelRatio
+                  )
+                : overlay.content
+            }
             alt="Overlay"
             className="w-full h-full"
             style={{
@@ -353,6 +362,12 @@ export default function Overlay({ overlay, onUpdate, onDelete, onSelect, contain
             }}
             draggable={false}
             onError={(e) => {
+              // Load the original image if the backend could not scale it
+              if (e.target.src !== overlay.content && !e.target.dataset.fallback) {
+                e.target.dataset.fallback = 'true';
+                e.target.src = overlay.content;
+                return;
+              }
               e.target.onerror = null;
               // Fallback with semi-transparent error message
               e.target.src = 'data:image/svg+xml,%3Csvg xmlns="http://www.w3.org/2000/svg" width="100" height="100"%3E%3Crect fill="rgba(0,0,0,0.3)" width="100" height="100"/%3E%3Ctext fill="white" x="50%25" y="50%25" text-anchor="middle" dy=".3em" font-size="10" style="text-shadow: 1px 1px 2px rgba(0,0,0,0.8)"%3EImage Error%3C/text%3E%3C/svg%3E';
@@ -15,6 +15,9 @@ export default function VideoPlayer({ overlays, onUpdateOverlay, onDeleteOverlay
   const playerRef = useRef(null);
   const containerRef = useRef(null);
   const [rtspUrl, setRtspUrl] = useState('');
+  const [streamId, setStreamId] = useState(null);
+  const [lowLatency, setLowLatency] = useState(false);
+  const [burnOverlays, setBurnOverlays] = useState(false);
   const [isPlaying, setIsPlaying] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
   const [selectedOverlayId, setSelectedOverlayId] = useState(null);
@@ -44,6 +47,7 @@ export default function VideoPlayer({ overlays, onUpdateOverlay, onDeleteOverlay
       html5: {
         vhs: {
           overrideNative: true,
+          llhls: true, // Use partial segments when the playlist advertises them
         },
         nativeAudioTracks: false,
         nativeVideoTracks: false,
@@ -94,17 +98,19 @@ export default function VideoPlayer({ overlays, onUpdateOverlay, onDeleteOverlay
       }
 
       // For RTSP or non-HLS HTTP URLs, use backend conversion
-      const response = await streamAPI.start(rtspUrl);
+      // The backend responds once the first segment is playable
+      const response = await streamAPI.start(rtspUrl, { lowLatency, burnOverlays, wait: true });
 
       if (response.success) {
         toast.success('Stream started successfully! Initializing player...');
+        setStreamId(response.stream_id || null);
         
-        // Wait a moment for FFmpeg to start generating segments
+        // If the first segment is not ready yet, give FFmpeg a moment longer
         setTimeout(() => {
           initializePlayer(response.hls_url);
           setIsPlaying(true);
           setIsLoading(false);
-        }, 2000);
+        }, response.ready ? 0 : 2000);
       }
     } catch (error) {
       toast.error(error.message || 'Failed to start stream');
@@ -125,12 +131,20 @@ export default function VideoPlayer({ overlays, onUpdateOverlay, onDeleteOverlay
         playerRef.current = null;
       }
 
+      // Direct HLS playback has no backend stream to stop
+      if (!streamId) {
+        setIsPlaying(false);
+        setRtspUrl('');
+        return;
+      }
+
       // Stop stream on backend
-      const response = await streamAPI.stop();
+      const response = await streamAPI.stop(streamId);
 
       if (response.success) {
         toast.success('Stream stopped successfully');
         setIsPlaying(false);
+        setStreamId(null);
         setRtspUrl('');
       }
     } catch (error) {
@@ -300,6 +314,24 @@ export default function VideoPlayer({ overlays, onUpdateOverlay, onDeleteOverlay
             className="w-full px-3 py-2 bg-gray-900 text-white rounded-md border border-gray-700 focus:outline-none focus:border-blue-500 focus:ring-1 focus:ring-blue-500 transition-colors placeholder-gray-500 text-sm"
             disabled={isLoading}
           />
+          <label className="flex items-center gap-2 text-gray-400 text-xs">
+            <input
+              type="checkbox"
+              checked={lowLatency}
+              onChange={(e) => setLowLatency(e.target.checked)}
+              disabled={isLoading}
+            />
+            Low latency (LL-HLS)
+          </label>
+          <label className="flex items-center gap-2 text-gray-400 text-xs">
+            <input
+              type="checkbox"
+              checked={burnOverlays}
+              onChange={(e) => setBurnOverlays(e.target.checked)}
+              disabled={isLoading}
+            />
+            Burn overlays into the video
+          </label>
           <button
             onClick={startStream}
             disabled={isLoading}
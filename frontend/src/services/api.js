@@ -53,25 +53,77 @@ export const streamAPI = {
   /**
    * Start RTSP to HLS stream conversion
    * @param {string} rtspUrl - RTSP stream URL
-   * @returns {Promise} Response with HLS URL
+   * @param {Object} options - Optional start options
+   * @param {string} options.streamId - Reuse or restart a specific stream ID
+   * @param {boolean} options.lowLatency - Request LL-HLS output
+   * @param {boolean} options.abr - Request an adaptive bitrate ladder
+   * @param {boolean} options.burnOverlays - Composite overlays into the video server-side
+   * @param {boolean} options.dvr - Keep a seekable DVR window
+   * @param {boolean} options.record - Record the stream into hourly MP4 files
+   * @param {boolean} options.proxy - Relay an HTTP(S) HLS source through the backend
+   * @param {boolean} options.wait - Resolve only once the first segment is playable
+   * @returns {Promise} Response with stream ID, HLS URL, readiness and time to first frame
    */
-  start: async (rtspUrl) => {
-    const response = await apiClient.post('/stream/start', { rtsp_url: rtspUrl });
+  start: async (rtspUrl, options = {}) => {
+    const payload = { rtsp_url: rtspUrl };
+    if (options.streamId) {
+      payload.stream_id = options.streamId;
+    }
+    if (options.lowLatency) {
+      payload.low_latency = true;
+    }
+    if (options.abr) {
+      payload.abr = true;
+    }
+    if (options.burnOverlays) {
+      payload.burn_overlays = true;
+    }
+    if (options.dvr) {
+      payload.dvr = true;
+    }
+    if (options.record) {
+      payload.record = true;
+    }
+    if (options.proxy) {
+      payload.proxy = true;
+    }
+    if (options.wait) {
+      payload.wait = true;
+    }
+    const response = await apiClient.post('/stream/start', payload);
     return response.data;
   },
 
   /**
-   * Stop current stream
+   * Stop a stream
+   * @param {string} streamId - Stream ID (stops every stream, for all viewers, when omitted)
    * @returns {Promise} Response with success status
    */
-  stop: async () => {
-    const response = await apiClient.post('/stream/stop');
+  stop: async (streamId) => {
+    const response = streamId
+      ? await apiClient.post(`/stream/${streamId}/stop`)
+      : await apiClient.post('/stream/stop', { all: true });
     return response.data;
   },
 
   /**
-   * Get current stream status
-   * @returns {Promise} Response with active status and RTSP URL
+   * Build the URL of a DVR playlist starting at a point in time
+   * @param {string} streamId - Stream started with dvr
+   * @param {string|number} t - ISO 8601 time, Unix seconds, or negative seconds before now
+   * @returns {string} Playlist URL for the video player
+   */
+  seekUrl: (streamId, t) => `${API_BASE_URL}/stream/${streamId}/seek?t=${encodeURIComponent(t)}`,
+
+  /**
+   * Build the URL of a stream's latest JPEG snapshot, for dashboard tiles
+   * @param {string} streamId - Stream ID
+   * @returns {string} Image URL; the backend refreshes it every few seconds
+   */
+  snapshotUrl: (streamId) => `${API_BASE_URL}/stream/${streamId}/snapshot`,
+
+  /**
+   * Get status of all streams
+   * @returns {Promise} Response with active status, RTSP URL, and per-stream list
    */
   status: async () => {
     const response = await apiClient.get('/stream/status');
@@ -92,6 +144,22 @@ export const overlayAPI = {
     return response.data;
   },
 
+  /**
+   * Get one page of the overlays shown on a stream (its own and shared ones)
+   * @param {string} streamId - Stream ID
+   * @param {Object} options - Paging options
+   * @param {number} options.limit - Page size (optional)
+   * @param {string} options.after - next_after of the previous page (optional)
+   * @param {string[]} options.fields - Fields to return besides id (optional)
+   * @returns {Promise} Response with overlays and next_after
+   */
+  getForStream: async (streamId, { limit, after, fields } = {}) => {
+    const response = await apiClient.get(`/stream/${streamId}/overlays`, {
+      params: { limit, after, fields: fields?.join(',') },
+    });
+    return response.data;
+  },
+
   /**
    * Get single overlay by ID
    * @param {string} id - Overlay ID
@@ -109,6 +177,7 @@ export const overlayAPI = {
    * @param {string} data.content - Text content or image URL
    * @param {Object} data.position - {x: number, y: number}
    * @param {Object} data.size - {width: number, height: number}
+   * @param {string} data.streamId - Stream to show the overlay on (optional, all streams if omitted)
    * @returns {Promise} Response with created overlay
    */
   create: async (data) => {
@@ -127,6 +196,16 @@ export const overlayAPI = {
     return response.data;
   },
 
+  /**
+   * Update several overlays in one request
+   * @param {Array<Object>} updates - Objects with an id plus the fields to change
+   * @returns {Promise} Response with updated overlays and IDs that were not found
+   */
+  updateMany: async (updates) => {
+    const response = await apiClient.patch('/overlays', { updates });
+    return response.data;
+  },
+
   /**
    * Delete overlay
    * @param {string} id - Overlay ID
@@ -136,6 +215,42 @@ export const overlayAPI = {
     const response = await apiClient.delete(`/overlays/${id}`);
     return response.data;
   },
+
+  /**
+   * URL of an image overlay pre-scaled by the backend for a player of the given size
+   * @param {Object} overlay - Image overlay
+   * @param {number} width - Player width in device pixels
+   * @param {number} height - Player height in device pixels
+   * @returns {string} Raster URL
+   */
+  rasterUrl: (overlay, width, height) => {
+    // The image source is part of the URL so a changed image is fetched again
+    const params = new URLSearchParams({
+      width: Math.round(width),
+      height: Math.round(height),
+      src: overlay.content,
+    });
+    return `${API_BASE_URL}/overlays/${overlay.id}/raster?${params}`;
+  },
+
+  /**
+   * Subscribe to overlay changes pushed by the backend (Server-Sent Events).
+   * The browser reconnects automatically and resumes where it left off.
+   * @param {Object} handlers - Callbacks for each event type
+   * @param {Function} handlers.onCreated - Called with the created overlay
+   * @param {Function} handlers.onUpdated - Called with the updated overlay
+   * @param {Function} handlers.onDeleted - Called with the deleted overlay ID
+   * @param {Function} handlers.onReset - Called when events were missed and the list must be refetched
+   * @returns {Function} Unsubscribe function
+   */
+  subscribe: (handlers) => {
+    const source = new EventSource(`${API_BASE_URL}/overlays/events`);
+    source.addEventListener('created', (e) => handlers.onCreated(JSON.parse(e.data).overlay));
+    source.addEventListener('updated', (e) => handlers.onUpdated(JSON.parse(e.data).overlay));
+    source.addEventListener('deleted', (e) => handlers.onDeleted(JSON.parse(e.data).id));
+    source.addEventListener('reset', () => handlers.onReset());
+    return () => source.close();
+  },
 };
 
 export default apiClient;